@@ -0,0 +1,38 @@
+"""
+Compares airports startup time of parsing the CSV with pandas against loading the binary snapshot,
+and measures lookups once the airports are loaded.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/airports_startup_benchmark.py
+"""
+import os
+import timeit
+
+from flight_data.airports_data import AirportData
+from flight_data.airports_snapshot import compile_snapshot, default_snapshot_path
+
+AIRPORTS_DATA = os.path.join("data", "static", "airports.csv")
+REPEATS = 10
+LOOKUPS = 100_000
+
+
+def main() -> None:
+    compile_snapshot(AIRPORTS_DATA, default_snapshot_path(AIRPORTS_DATA))
+
+    csv_time = min(timeit.repeat(lambda: AirportData(AIRPORTS_DATA).is_airport("EPWA"), number=1, repeat=REPEATS))
+    snapshot_time = min(timeit.repeat(lambda: AirportData.load(AIRPORTS_DATA), number=1, repeat=REPEATS))
+    snapshot_lookup_time = min(
+        timeit.repeat(lambda: AirportData.load(AIRPORTS_DATA).is_airport("EPWA"), number=1, repeat=REPEATS)
+    )
+
+    print(f"pandas read_csv + index:      {csv_time * 1000:8.2f} ms")
+    print(f"snapshot load:                {snapshot_time * 1000:8.2f} ms ({csv_time / snapshot_time:.1f}x)")
+    print(f"snapshot load + first lookup: {snapshot_lookup_time * 1000:8.2f} ms ({csv_time / snapshot_lookup_time:.1f}x)")
+
+    airports = AirportData.load(AIRPORTS_DATA)
+    airports.get_location("EPWA")
+    lookup_time = min(timeit.repeat(lambda: airports.get_location("EPWA"), number=LOOKUPS, repeat=REPEATS))
+    print(f"get_location:                 {lookup_time / LOOKUPS * 1e9:8.0f} ns per lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Replays recorded OpenSky and weather API responses through the FlightCollector with simulated API latency,
+comparing numbers of track and weather workers without network access or credentials.
+
+Archives are recorded with: PYTHONPATH=src python src/collect_flights.py --record <archive>
+Without an archive, synthetic flights approaching a few airports are recorded into a temporary one first.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/collector_replay_benchmark.py [archive] [latency_ms]
+"""
+from datetime import datetime
+from types import SimpleNamespace
+import os
+import sys
+import tempfile
+import time
+
+from weather_client_benchmark import make_payload
+
+import config
+from common.models import Location
+from common.recording import ResponseArchive
+from common.throttling import AdaptiveRateLimiter
+from data_collection.flight_collector import FlightCollector
+from data_collection.manifest import WindowManifest
+from flight_data.airports_data import AirportData
+from flight_data.flight_data import FlightData
+from flight_data.replay import FLIGHTS, RecordingOpenSkyApi, ReplayOpenSkyApi
+from weather_data.cache import WeatherCache
+from weather_data.replay import RecordingWeatherClient, ReplayWeatherClient
+from weather_data.weather_data import WeatherDataProcessor
+
+DEFAULT_LATENCY_MS = 50
+SYNTHETIC_AIRPORTS = ["EGLL", "EPWA", "KJFK", "LFPG"]
+SYNTHETIC_WINDOWS = 3
+SYNTHETIC_FLIGHTS_PER_WINDOW = 40
+WORKERS = [(1, 1), (8, 2), (16, 4)]  # track and weather workers
+
+
+class SyntheticOpenSkyApi:
+    """Flights landing at SYNTHETIC_AIRPORTS with straight tracks from 300 km away, one point per minute"""
+
+    def __init__(self, airports: AirportData) -> None:
+        self.airports = airports
+
+    def get_flights_from_interval(self, begin: int, end: int) -> list[SimpleNamespace]:
+        step = (end - begin) // SYNTHETIC_FLIGHTS_PER_WINDOW
+        return [
+            SimpleNamespace(
+                icao24=f"{i:06x}", lastSeen=begin + i * step, callsign=f"TST{i:04d}",
+                estArrivalAirport=SYNTHETIC_AIRPORTS[i % len(SYNTHETIC_AIRPORTS)],
+            )
+            for i in range(SYNTHETIC_FLIGHTS_PER_WINDOW)
+        ]
+
+    def get_track_by_aircraft(self, icao24: str, t: int = 0) -> SimpleNamespace:
+        airport = self.airports.get_location(SYNTHETIC_AIRPORTS[int(icao24, 16) % len(SYNTHETIC_AIRPORTS)])
+        path = [
+            [t - minute * 60, airport.latitude + minute * 0.045, airport.longitude, minute * 150.0, 180.0, False]
+            for minute in range(60, -1, -1)
+        ]
+        return SimpleNamespace(icao24=icao24, path=path)
+
+
+class SyntheticWeatherClient:
+    def fetch_weather_data(self, location: Location, date: str) -> dict:
+        return make_payload(date)
+
+    def fetch_many(self, requests: list[tuple[Location, str]]) -> list[dict]:
+        return [make_payload(date) for _, date in requests]
+
+
+def unthrottled() -> AdaptiveRateLimiter:
+    return AdaptiveRateLimiter(1e6, burst=1_000_000)
+
+
+def record_synthetic_archive(archive: ResponseArchive, airports: AirportData, directory: str) -> None:
+    flight_data = FlightData(airports, rate_limiter=unthrottled(),
+                             api=RecordingOpenSkyApi(SyntheticOpenSkyApi(airports), archive))
+    weather_data = WeatherDataProcessor(client=RecordingWeatherClient(SyntheticWeatherClient(), archive))
+    collector = FlightCollector(flight_data, weather_data=weather_data,
+                                manifest=WindowManifest(os.path.join(directory, "recording.json")))
+    start = datetime(2024, 3, 1)
+    collector.run_windows([
+        (start + i * FlightCollector.TIME_WINDOW_DELTA, start + (i + 1) * FlightCollector.TIME_WINDOW_DELTA)
+        for i in range(SYNTHETIC_WINDOWS)
+    ])
+
+
+def main() -> None:
+    latency_s = (int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_LATENCY_MS) / 1000
+    airports = AirportData.load(config.AIRPORTS_DATA)
+
+    with tempfile.TemporaryDirectory() as directory:
+        config.DOWNLOAD_DATA_DIR = directory
+        if len(sys.argv) > 1:
+            archive = ResponseArchive(sys.argv[1])
+        else:
+            archive = ResponseArchive(os.path.join(directory, "archive.sqlite"))
+            record_synthetic_archive(archive, airports, directory)
+        windows = [(datetime.fromtimestamp(begin), datetime.fromtimestamp(end)) for begin, end in archive.keys(FLIGHTS)]
+        print(f"{len(windows)} windows, {len(archive)} recorded responses, {latency_s * 1000:.0f} ms latency")
+
+        for run, (track_workers, weather_workers) in enumerate(WORKERS):
+            api = ReplayOpenSkyApi(archive, latency_s)
+            weather_client = ReplayWeatherClient(archive, latency_s)
+            collector = FlightCollector(
+                FlightData(airports, rate_limiter=unthrottled(), api=api),
+                weather_data=WeatherDataProcessor(WeatherCache(), client=weather_client),
+                track_workers=track_workers,
+                weather_workers=weather_workers,
+                manifest=WindowManifest(os.path.join(directory, f"replay_{run}.json")),
+            )
+            start = time.perf_counter()
+            collector.run_windows(windows)
+            elapsed = time.perf_counter() - start
+            flights = api.stats.hits + api.stats.misses - len(windows)
+            print(f"{f'track workers {track_workers}, weather workers {weather_workers}':<40} {elapsed:7.2f} s  "
+                  f"{flights / elapsed:7.1f} flights/s  misses {api.stats.misses + weather_client.stats.misses}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compares flattening CombinedDatapoints with per-call recursion over the fields against the cached per-class flattener.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/flattener_benchmark.py [count]
+"""
+import sys
+import time
+import tracemalloc
+from dataclasses import fields
+
+from common.models import BaseDataclass, Location
+from data_collection.models import CombinedDatapoint
+from flight_data.models import FlightDatapoint
+from weather_data.models import WeatherDatapoint
+
+DEFAULT_COUNT = 1_000_000
+
+
+def recursive_names(obj: BaseDataclass) -> list[str]:
+    """Flattening as done before the flatteners were cached: recursion with isinstance checks on every call"""
+    names = []
+    for field in fields(obj):
+        value = getattr(obj, field.name)
+        if isinstance(value, BaseDataclass):
+            names.extend(f"{field.name}_{name}" for name in recursive_names(value))
+        else:
+            names.append(field.name)
+    return names
+
+
+def recursive_values(obj: BaseDataclass) -> list:
+    values = []
+    for field in fields(obj):
+        value = getattr(obj, field.name)
+        if isinstance(value, BaseDataclass):
+            values.extend(recursive_values(value))
+        else:
+            values.append(value)
+    return values
+
+
+def make_datapoints(count: int) -> list[CombinedDatapoint]:
+    return [
+        CombinedDatapoint.from_datapoints(
+            FlightDatapoint(Location(50.0, 20.0), "EPWA", Location(52.1, 20.9), i, 500.0, 1000.0, 5.0, 90.0, 100.0, 0, 0),
+            WeatherDatapoint(i, 5.0, 4.0, "Cloudy", 10.0, 60.0, 0.0, 10.0, 1020.0, 1.0),
+        )
+        for i in range(count)
+    ]
+
+
+def measure(label: str, datapoints: list[CombinedDatapoint], names, values) -> None:
+    start = time.perf_counter()
+    for datapoint in datapoints:
+        names(datapoint)
+        values(datapoint)
+    print(f"{label:<22} {time.perf_counter() - start:8.2f} s")
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT
+
+    tracemalloc.start()
+    datapoints = make_datapoints(count)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{count} datapoints use {memory / 2 ** 20:.0f} MiB ({memory / count:.0f} B per datapoint)")
+
+    measure("recursive flattening", datapoints, recursive_names, recursive_values)
+    measure("cached flattener", datapoints, CombinedDatapoint.get_attribute_names, CombinedDatapoint.get_values)
+    getter = CombinedDatapoint.values_getter()
+    measure("generated tuple getter", datapoints, lambda _: CombinedDatapoint.attribute_names(), getter)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Compares per-point Location.distance_to calls with a single vectorized haversine_distance call over a track.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/haversine_benchmark.py
+"""
+import timeit
+
+import numpy as np
+
+from common.models import Location
+from common.utils import haversine_distance
+
+TRACK_SIZES = (1_000, 5_000, 10_000)
+REPEATS = 5
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    destination = Location(52.165833, 20.967222)
+
+    for size in TRACK_SIZES:
+        latitudes = rng.uniform(-90, 90, size)
+        longitudes = rng.uniform(-180, 180, size)
+        track = list(zip(latitudes.tolist(), longitudes.tolist()))
+
+        def scalar() -> list[float]:
+            return [Location(latitude, longitude).distance_to(destination) for latitude, longitude in track]
+
+        def vectorized() -> np.ndarray:
+            return haversine_distance(
+                [point[0] for point in track],
+                [point[1] for point in track],
+                destination.latitude,
+                destination.longitude,
+            )
+
+        np.testing.assert_allclose(scalar(), vectorized(), rtol=1e-9)
+        scalar_time = min(timeit.repeat(scalar, number=1, repeat=REPEATS))
+        vectorized_time = min(timeit.repeat(vectorized, number=1, repeat=REPEATS))
+        print(
+            f"{size:>6} points: scalar {scalar_time * 1000:8.2f} ms, "
+            f"vectorized {vectorized_time * 1000:6.2f} ms ({scalar_time / vectorized_time:.0f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
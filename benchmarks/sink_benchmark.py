@@ -0,0 +1,74 @@
+"""
+Compares writing flight datapoints to CSV row by row with CombinedDatapoint.save_to_csv, flight by flight with
+CombinedDatapointBatch.save_to_csv, and through buffered CSV and Avro sinks kept open for the whole window.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/sink_benchmark.py [flights] [rows_per_flight]
+"""
+from typing import Callable
+import os
+import sys
+import tempfile
+import time
+
+from common.models import Location
+from data_collection.models import CombinedDatapoint, CombinedDatapointBatch
+from data_collection.sinks import AvroSink, CSVSink, Sink
+from flight_data.models import FlightDatapoint
+from weather_data.models import WeatherDatapoint
+
+DEFAULT_FLIGHTS = 200
+DEFAULT_ROWS_PER_FLIGHT = 100
+
+
+def make_datapoints(rows: int) -> list[CombinedDatapoint]:
+    return [
+        CombinedDatapoint.from_datapoints(
+            FlightDatapoint(Location(50.0 + i * 0.01, 20.0), "EPWA", Location(52.0, 21.0), 60 * i, 700.0, 9000.0,
+                            0.0, 90.0, 300.0 - i, 6000, 6000 - 60 * i),
+            WeatherDatapoint(60 * i, 5.0, 4.0, "Cloudy", 10.0, 60.0, 0.0, 10.0, 1020.0, 1.0),
+        )
+        for i in range(rows)
+    ]
+
+
+def main() -> None:
+    flights = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FLIGHTS
+    rows_per_flight = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROWS_PER_FLIGHT
+    datapoints = make_datapoints(rows_per_flight)
+    batch = CombinedDatapointBatch.from_datapoints(datapoints)
+    rows = flights * rows_per_flight
+
+    with tempfile.TemporaryDirectory() as directory:
+        def report(name: str, write: Callable[[str], None]) -> None:
+            path = os.path.join(directory, f"{name}.csv")
+            start = time.perf_counter()
+            write(path)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<32} {elapsed:7.3f} s  {rows / elapsed:10.0f} rows/s  {os.path.getsize(path):>10} bytes")
+
+        def per_row(path: str) -> None:
+            for _ in range(flights):
+                for datapoint in datapoints:
+                    datapoint.save_to_csv(path)
+
+        def per_flight(path: str) -> None:
+            for _ in range(flights):
+                batch.save_to_csv(path)
+
+        def through(sink_factory: Callable[[str], Sink]) -> Callable[[str], None]:
+            def write(path: str) -> None:
+                with sink_factory(path) as sink:
+                    for _ in range(flights):
+                        sink.write(batch)
+                    sink.finalize()
+            return write
+
+        report("CombinedDatapoint.save_to_csv", per_row)
+        report("CombinedDatapointBatch.save_to_csv", per_flight)
+        report("CSVSink", through(CSVSink))
+        for codec in ("null", "deflate"):
+            report(f"AvroSink, {codec}", through(lambda path: AvroSink(path, codec=codec)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares fetching weather days one by one with requests.get against the pooled asynchronous WeatherClient.
+
+Both talk to a local stub of the weather API that serves a history.json-like payload after a simulated delay.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/weather_client_benchmark.py [days] [latency_ms]
+"""
+import asyncio
+import sys
+import threading
+import time
+
+from aiohttp import web
+
+from common.models import Location
+from common.throttling import RateLimiter
+from weather_data import weather_api
+from weather_data.weather_client import WeatherClient
+
+DEFAULT_DAYS = 200
+DEFAULT_LATENCY_MS = 30
+
+
+def make_payload(date: str) -> dict:
+    hours = [
+        {
+            "time": f"{date} {hour:02d}:00", "temp_c": 10.0, "feelslike_c": 9.0, "wind_kph": 12.0, "humidity": 70,
+            "precip_mm": 0.0, "vis_km": 10.0, "pressure_mb": 1015.0, "uv": 1.0, "condition": {"text": "Cloudy"},
+        }
+        for hour in range(24)
+    ]
+    return {"location": {"name": "stub"}, "forecast": {"forecastday": [{"date": date, "hour": hours}]}}
+
+
+def start_stub_server(latency_s: float) -> str:
+    async def handle(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency_s)
+        return web.json_response(make_payload(request.query["dt"]))
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_get("/v1/history.json", handle)
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", 0).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{runner.addresses[0][1]}/v1/history.json"
+
+
+def main() -> None:
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DAYS
+    latency_s = (int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_LATENCY_MS) / 1000
+    url = start_stub_server(latency_s)
+    requests = [(Location(50 + i * 0.1, 20.0), "2024-03-20") for i in range(days)]
+
+    weather_api.WEATHER_API_URL = url
+    start = time.perf_counter()
+    for location, date in requests:
+        weather_api.fetch_weather_data(location, date)
+    sequential = time.perf_counter() - start
+    print(f"{'requests.get, sequential':<32} {sequential:7.2f} s  {days / sequential:7.1f} days/s")
+
+    for concurrency in (1, 8, 32):
+        with WeatherClient(api_url=url, max_concurrency=concurrency, rate_limiter=RateLimiter(None)) as client:
+            start = time.perf_counter()
+            results = client.fetch_many(requests)
+            elapsed = time.perf_counter() - start
+        assert all(results)
+        print(f"{f'WeatherClient, concurrency {concurrency}':<32} {elapsed:7.2f} s  {days / elapsed:7.1f} days/s")
+
+
+if __name__ == "__main__":
+    main()
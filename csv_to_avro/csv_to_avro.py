@@ -1,39 +1,18 @@
+"""
+Converts CSV files of the collector to Avro files with the flight weather schema of src/schema.py.
+
+Only needed for CSV files collected before the collector could write Avro itself (--output-format avro);
+it also reads the older CSV format with differently named columns.
+
+Run with: python csv_to_avro/csv_to_avro.py <input_dir> <output_dir>
+"""
 import fastavro
 import csv
 import os
 import argparse
 from pathlib import Path
 
-schema = {
-    "type": "record",
-    "name": "FlightWeatherData",
-    "fields": [
-        {"name": "timestamp", "type": "long"},
-        {"name": "flight_location_latitude", "type": "double"},
-        {"name": "flight_location_longitude", "type": "double"},
-        {"name": "flight_arrival_airport", "type": "string"},
-        {"name": "flight_arrival_airport_location_latitude", "type": "double"},
-        {"name": "flight_arrival_airport_location_longitude", "type": "double"},
-        {"name": "flight_timestamp", "type": "long"},
-        {"name": "flight_horizontal_speed", "type": "double"},
-        {"name": "flight_altitude", "type": "double"},
-        {"name": "flight_vertical_speed", "type": "double"},
-        {"name": "flight_heading", "type": "double"},
-        {"name": "flight_distance_to_destination", "type": "double"},
-        {"name": "flight_arrival_time", "type": "long"},
-        {"name": "flight_time_to_arrival", "type": "long"},
-        {"name": "weather_timestamp", "type": "long"},
-        {"name": "weather_temperature_celsius", "type": "double"},
-        {"name": "weather_feels_like_celsius", "type": "double"},
-        {"name": "weather_condition_text", "type": "string"},
-        {"name": "weather_wind_speed_kph", "type": "double"},
-        {"name": "weather_humidity_percent", "type": "double"},
-        {"name": "weather_precipitation_mm", "type": "double"},
-        {"name": "weather_visibility_km", "type": "double"},
-        {"name": "weather_pressure_mb", "type": "double"},
-        {"name": "weather_uv_index", "type": "double"}
-    ]
-}
+from schema import SCHEMA
 
 
 def detect_csv_format(header):
@@ -119,7 +98,7 @@ def convert_csv_to_avro(input_file, output_file):
                 print(f"Skipping row due to error: {e}, Row: {row}")
 
     with open(output_file, 'wb') as out:
-        fastavro.writer(out, schema, records)
+        fastavro.writer(out, SCHEMA, records)
 
 
 def process_directory(input_dir, output_dir):
@@ -1,3 +1,8 @@
+"""
+Merges the Avro files of every week in a Cloud Storage bucket into one file, using the schema of src/schema.py.
+
+Run with: python csv_to_avro/merge_week.py <credentials> <source_bucket> <output_bucket>
+"""
 import sys
 import os
 import fastavro
@@ -1,30 +1,14 @@
-SCHEMA = {
-    "type": "record",
-    "name": "FlightWeatherData",
-    "fields": [
-        {"name": "timestamp", "type": "long"},
-        {"name": "flight_location_latitude", "type": "double"},
-        {"name": "flight_location_longitude", "type": "double"},
-        {"name": "flight_arrival_airport", "type": "string"},
-        {"name": "flight_arrival_airport_location_latitude", "type": "double"},
-        {"name": "flight_arrival_airport_location_longitude", "type": "double"},
-        {"name": "flight_timestamp", "type": "long"},
-        {"name": "flight_horizontal_speed", "type": "double"},
-        {"name": "flight_altitude", "type": "double"},
-        {"name": "flight_vertical_speed", "type": "double"},
-        {"name": "flight_heading", "type": "double"},
-        {"name": "flight_distance_to_destination", "type": "double"},
-        {"name": "flight_arrival_time", "type": "long"},
-        {"name": "flight_time_to_arrival", "type": "long"},
-        {"name": "weather_timestamp", "type": "long"},
-        {"name": "weather_temperature_celsius", "type": "double"},
-        {"name": "weather_feels_like_celsius", "type": "double"},
-        {"name": "weather_condition_text", "type": "string"},
-        {"name": "weather_wind_speed_kph", "type": "double"},
-        {"name": "weather_humidity_percent", "type": "double"},
-        {"name": "weather_precipitation_mm", "type": "double"},
-        {"name": "weather_visibility_km", "type": "double"},
-        {"name": "weather_pressure_mb", "type": "double"},
-        {"name": "weather_uv_index", "type": "double"}
-    ]
-}
+"""
+Flight weather schema, defined once in src/schema.py and written by the collector's AvroSink.
+
+Re-exported here, so that the scripts of this directory run without src on the Python path.
+"""
+import importlib.util
+import os
+
+_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src", "schema.py")
+_spec = importlib.util.spec_from_file_location("_collector_schema", _PATH)
+_module = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_module)
+
+SCHEMA = _module.SCHEMA
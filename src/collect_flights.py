@@ -1,21 +1,199 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from itertools import repeat
+from typing import Callable, Iterator
+import os
+
 import click
+import structlog
 
 import config
+from common.recording import ResponseArchive
+from common.throttling import RateLimiter, SharedRateLimiter
 from flight_data.airports_data import AirportData
 from flight_data.flight_data import FlightData
+from flight_data.opensky_client import OpenSkyClient
+from flight_data.replay import RecordingOpenSkyApi
+from flight_data.track_cache import default_track_store
 from data_collection.flight_collector import FlightCollector
+from data_collection.manifest import WindowManifest
+from data_collection.sinks import AvroSink, CSVSink, Sink
+from weather_data.cache import WeatherCache
+from weather_data.grid import WeatherGrid
+from weather_data.replay import RecordingWeatherClient
+from weather_data.store import SQLiteWeatherStore
+from weather_data.weather_client import WeatherClient
+from weather_data.weather_data import WeatherDataProcessor
+
+logger = structlog.get_logger()
+
+Metrics = dict[str, dict[str, float]]
+
+
+@dataclass(frozen=True)
+class CollectorOptions:
+    infer_arrival: bool = False
+    weather_grid: float = config.WEATHER_GRID_RESOLUTION_DEG
+    weather_concurrency: int = config.WEATHER_MAX_CONCURRENCY
+    track_workers: int = config.OPENSKY_TRACK_WORKERS
+    weather_workers: int = config.WEATHER_JOIN_WORKERS
+    queue_size: int = config.PIPELINE_QUEUE_SIZE
+    record: str | None = None  # archive API responses are recorded in for replaying them offline
+    output_format: str = "csv"  # csv or avro
+    avro_codec: str = config.AVRO_CODEC
+    avro_block_bytes: int = config.AVRO_BLOCK_BYTES
+
+    def sink_factory(self) -> Callable[[str], Sink]:
+        if self.output_format == "avro":
+            return partial(AvroSink, codec=self.avro_codec, block_bytes=self.avro_block_bytes)
+        return CSVSink
+
+
+@contextmanager
+def create_collector(
+        options: CollectorOptions,
+        opensky_rate_limiter: SharedRateLimiter | None = None,
+        weather_rate_limiter: RateLimiter | None = None,
+) -> Iterator[FlightCollector]:
+    """
+    Creates a collector with its own API clients, sharing the local weather store and track cache.
+
+    When recording, the local weather store and track cache are not used, so that every response the collector
+    needs ends up in the archive.
+    """
+    airports = AirportData.load(config.AIRPORTS_DATA)
+    archive = ResponseArchive(options.record) if options.record else None
+    api = None
+    if archive is not None:
+        api = RecordingOpenSkyApi(OpenSkyClient(username=config.OPENSKY_USERNAME, password=config.OPENSKY_PASSWORD), archive)
+    flight_data = FlightData(
+        airports,
+        infer_arrival_airport=options.infer_arrival,
+        track_cache=default_track_store() if archive is None else None,
+        rate_limiter=opensky_rate_limiter,
+        api=api,
+    )
+    with WeatherClient(max_concurrency=options.weather_concurrency, rate_limiter=weather_rate_limiter) as weather_client:
+        if archive is None:
+            weather_cache = WeatherCache(persistent=SQLiteWeatherStore(config.WEATHER_STORE_PATH))
+            weather_fetcher = weather_client
+        else:
+            weather_cache = WeatherCache()
+            weather_fetcher = RecordingWeatherClient(weather_client, archive)
+        weather_data = WeatherDataProcessor(weather_cache, WeatherGrid(options.weather_grid), weather_fetcher)
+        yield FlightCollector(
+            flight_data,
+            weather_data=weather_data,
+            track_workers=options.track_workers,
+            weather_workers=options.weather_workers,
+            queue_size=options.queue_size,
+            output_file_template=f"flights_{{start}}_to_{{end}}.{options.output_format}",
+            sink_factory=options.sink_factory(),
+            # Recording runs keep their own progress, so they record windows already collected before
+            manifest=WindowManifest(options.record + ".manifest.json") if archive is not None else None,
+        )
+
+
+def shard_windows(windows: list[tuple[datetime, datetime]], workers: int) -> list[list[tuple[datetime, datetime]]]:
+    """
+    Splits time windows between workers round-robin, so every worker gets windows from the whole time range.
+
+    :return: windows of every worker that has any
+    """
+    return [shard for shard in (windows[worker::workers] for worker in range(workers)) if shard]
+
+
+def merge_metrics(worker_metrics: list[Metrics]) -> Metrics:
+    """Sums the metrics of all workers"""
+    merged: Metrics = {}
+    for metrics in worker_metrics:
+        for group, values in metrics.items():
+            merged_group = merged.setdefault(group, {})
+            for name, value in values.items():
+                merged_group[name] = merged_group.get(name, 0) + value
+    return merged
+
+
+# Rate limiters shared by all worker processes, set by _init_worker
+_rate_limiters: tuple[SharedRateLimiter, SharedRateLimiter] | None = None
+
+
+def _init_worker(opensky_rate_limiter: SharedRateLimiter, weather_rate_limiter: SharedRateLimiter) -> None:
+    global _rate_limiters
+    _rate_limiters = (opensky_rate_limiter, weather_rate_limiter)
+
+
+def _collect_windows(windows: list[tuple[datetime, datetime]], options: CollectorOptions) -> Metrics:
+    with create_collector(options, *_rate_limiters) as collector:
+        collector.run_windows(windows)
+        logger.info("worker finished", pid=os.getpid(), windows=len(windows))
+        return collector.metrics()
+
+
+def collect_with_workers(windows: list[tuple[datetime, datetime]], options: CollectorOptions, workers: int) -> Metrics:
+    """
+    Collects time windows in several processes, each with its own API clients and output files.
+
+    All processes draw from the global OpenSky and weather API rate budgets, share the local weather store
+    and track cache, and record their progress in the same manifest.
+
+    :return: metrics merged over all workers
+    """
+    shards = shard_windows(windows, workers)
+    rate_limiters = (
+        SharedRateLimiter(config.OPENSKY_REQUESTS_PER_SECOND, burst=config.OPENSKY_BURST),
+        SharedRateLimiter(config.WEATHER_REQUESTS_PER_SECOND, burst=options.weather_concurrency),
+    )
+    logger.info("starting workers", workers=len(shards), windows=len(windows))
+    with ProcessPoolExecutor(max_workers=len(shards), initializer=_init_worker, initargs=rate_limiters) as executor:
+        return merge_metrics(list(executor.map(_collect_windows, shards, repeat(options))))
 
 
 @click.command()
 @click.option('--days', default=29, help='Days offset from current time')
 @click.option('--hours', default=0, help='Hours offset from current time')
-def main(days: int, hours: int) -> None:
-    airports = AirportData(config.AIRPORTS_DATA)
-    flight_data = FlightData(airports)
-    collector = FlightCollector(flight_data)
-    import datetime
-    print(collector.collect_flights_in_time_window(datetime.datetime.now() - datetime.timedelta(hours=2), datetime.datetime.now())[0])
-    # collector.run(days, hours)
+@click.option('--infer-arrival', is_flag=True, help='Infer missing arrival airports from the end of flight tracks')
+@click.option('--weather-grid', default=config.WEATHER_GRID_RESOLUTION_DEG, type=float,
+              help='Resolution in degrees of the grid weather lookups are snapped to')
+@click.option('--weather-concurrency', default=config.WEATHER_MAX_CONCURRENCY,
+              help='Maximum number of parallel weather API requests')
+@click.option('--track-workers', default=config.OPENSKY_TRACK_WORKERS,
+              help='Number of threads fetching flight tracks concurrently')
+@click.option('--weather-workers', default=config.WEATHER_JOIN_WORKERS,
+              help='Number of threads joining datapoints with weather concurrently')
+@click.option('--queue-size', default=config.PIPELINE_QUEUE_SIZE,
+              help='Maximum number of flights waiting for every collection stage')
+@click.option('--record', default=None,
+              help='Archive to record OpenSky and weather API responses in, for replaying them offline')
+@click.option('--output-format', default="csv", type=click.Choice(["csv", "avro"]),
+              help='Format of the output files; avro files use the schema of schema.py')
+@click.option('--avro-codec', default=config.AVRO_CODEC,
+              help='Compression codec of Avro output files: null, deflate, snappy, zstandard, ...')
+@click.option('--avro-block-size', default=config.AVRO_BLOCK_BYTES,
+              help='Bytes of encoded rows written as one compressed Avro block')
+@click.option('--workers', default=1, type=click.IntRange(min=1),
+              help='Number of processes the time windows are split between')
+def main(days: int, hours: int, infer_arrival: bool, weather_grid: float, weather_concurrency: int,
+         track_workers: int, weather_workers: int, queue_size: int, record: str | None, output_format: str,
+         avro_codec: str, avro_block_size: int, workers: int) -> None:
+    options = CollectorOptions(infer_arrival, weather_grid, weather_concurrency, track_workers, weather_workers,
+                               queue_size, record, output_format, avro_codec, avro_block_size)
+    if output_format == "avro":
+        try:
+            AvroSink.check_codec(avro_codec)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--avro-codec")
+    if workers == 1:
+        with create_collector(options) as collector:
+            collector.run(days, hours)
+        return
+
+    metrics = collect_with_workers(FlightCollector.windows(days, hours), options, workers)
+    for group, values in metrics.items():
+        logger.info("merged worker metrics", group=group, **values)
 
 
 if __name__ == "__main__":
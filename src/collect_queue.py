@@ -0,0 +1,100 @@
+import os
+import socket
+
+import click
+import structlog
+
+import config
+from collect_flights import CollectorOptions, create_collector
+from data_collection.flight_collector import FlightCollector
+from data_collection.sinks import AvroSink
+from data_collection.work_queue import SQLiteWorkQueue, WorkQueue, work
+
+logger = structlog.get_logger()
+
+
+def open_queue(location: str) -> WorkQueue:
+    """
+    Opens a PostgreSQL work queue for a postgresql:// connection URL, a SQLite one for a path.
+
+    A SQLite queue is shared by workers on one machine only; workers on several machines need PostgreSQL.
+    """
+    if location.startswith(("postgresql://", "postgres://")):
+        # psycopg is needed only by workers sharing a PostgreSQL queue
+        from data_collection.postgres_work_queue import PostgresWorkQueue
+        return PostgresWorkQueue(location)
+    return SQLiteWorkQueue(location)
+
+
+@click.group()
+@click.option('--queue', default=config.WORK_QUEUE_PATH,
+              help='Path to the SQLite work queue database of one machine, or postgresql:// URL of the work queue '
+                   'shared by several machines')
+@click.pass_context
+def main(context: click.Context, queue: str) -> None:
+    """Distributes collection time windows between workers through a durable work queue"""
+    context.obj = open_queue(queue)
+
+
+@main.command('enqueue-range')
+@click.option('--days', default=29, help='Days offset from current time')
+@click.option('--hours', default=0, help='Hours offset from current time')
+@click.pass_obj
+def enqueue_range(queue: WorkQueue, days: int, hours: int) -> None:
+    """Adds all time windows from the offset to the current time to the queue"""
+    windows = FlightCollector.windows(days, hours)
+    added = queue.enqueue(windows)
+    logger.info("enqueued time windows", added=added, windows=len(windows), **queue.counts())
+
+
+@main.command('work')
+@click.option('--worker-id', default=None, help='Identifier of the worker, by default host name and process id')
+@click.option('--lease', default=config.WORK_QUEUE_LEASE_S, type=float, help='Lease duration in seconds')
+@click.option('--wait', is_flag=True, help='Wait for windows leased by other workers until all are done')
+@click.option('--infer-arrival', is_flag=True, help='Infer missing arrival airports from the end of flight tracks')
+@click.option('--weather-grid', default=config.WEATHER_GRID_RESOLUTION_DEG, type=float,
+              help='Resolution in degrees of the grid weather lookups are snapped to')
+@click.option('--weather-concurrency', default=config.WEATHER_MAX_CONCURRENCY,
+              help='Maximum number of parallel weather API requests')
+@click.option('--track-workers', default=config.OPENSKY_TRACK_WORKERS,
+              help='Number of threads fetching flight tracks concurrently')
+@click.option('--output-format', default="csv", type=click.Choice(["csv", "avro"]), help='Format of the output files')
+@click.option('--avro-codec', default=config.AVRO_CODEC, help='Compression codec of Avro output files')
+@click.option('--avro-block-size', default=config.AVRO_BLOCK_BYTES,
+              help='Bytes of encoded rows written as one compressed Avro block')
+@click.pass_obj
+def work_command(queue: WorkQueue, worker_id: str | None, lease: float, wait: bool, infer_arrival: bool,
+                 weather_grid: float, weather_concurrency: int, track_workers: int, output_format: str,
+                 avro_codec: str, avro_block_size: int) -> None:
+    """Processes time windows from the queue until none are left"""
+    if output_format == "avro":
+        try:
+            AvroSink.check_codec(avro_codec)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--avro-codec")
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    options = CollectorOptions(infer_arrival, weather_grid, weather_concurrency, track_workers,
+                               output_format=output_format, avro_codec=avro_codec, avro_block_bytes=avro_block_size)
+    with create_collector(options) as collector:
+        completed = work(queue, collector, worker_id, lease, poll_s=lease / 3 if wait else None)
+        for group, values in collector.metrics().items():
+            logger.info("worker metrics", group=group, **values)
+    logger.info("worker finished", worker=worker_id, completed=completed, **queue.counts())
+
+
+@main.command('status')
+@click.pass_obj
+def status(queue: WorkQueue) -> None:
+    """Prints the number of windows in every status"""
+    logger.info("work queue", **queue.counts())
+
+
+@main.command('requeue-failed')
+@click.pass_obj
+def requeue_failed(queue: WorkQueue) -> None:
+    """Gives windows that failed too many times back to the queue"""
+    logger.info("requeued failed time windows", count=queue.requeue_failed())
+
+
+if __name__ == "__main__":
+    main()
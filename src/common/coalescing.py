@@ -0,0 +1,75 @@
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Generic, Hashable, TypeVar
+import threading
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CoalescingStats:
+    calls: int = 0  # requests actually made
+    coalesced: int = 0  # duplicate requests that waited for a request already in flight
+
+
+class SingleFlight(Generic[K, V]):
+    """
+    Coalesces concurrent requests for the same key into one.
+
+    The first caller for a key becomes its leader and makes the request; callers asking for the same key
+    while the request is in flight wait for it and receive the same result or exception. Results are not kept
+    after the request finishes, caching them is left to the caller.
+    """
+
+    def __init__(self) -> None:
+        self.stats = CoalescingStats()
+        self._in_flight: dict[K, Future] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: K) -> tuple[Future, bool]:
+        """
+        Registers interest in a key.
+
+        :return: future receiving the result and whether the caller is the leader, which has to make the request
+            and pass its outcome to resolve or fail
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.stats.coalesced += 1
+                return future, False
+            future = self._in_flight[key] = Future()
+            self.stats.calls += 1
+            return future, True
+
+    def resolve(self, key: K, result: V) -> None:
+        """Publishes the leader's result to all callers waiting for the key"""
+        with self._lock:
+            future = self._in_flight.pop(key)
+        future.set_result(result)
+
+    def fail(self, key: K, exception: BaseException) -> None:
+        """Raises the leader's exception in all callers waiting for the key"""
+        with self._lock:
+            future = self._in_flight.pop(key)
+        future.set_exception(exception)
+
+    def do(self, key: K, request: Callable[[], V]) -> V:
+        """
+        Makes the request unless one for the same key is already in flight, and returns its result.
+
+        :param key: identifies requests that return the same result
+        :param request: function making the request
+        """
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = request()
+        except BaseException as e:
+            self.fail(key, e)
+            raise
+        self.resolve(key, result)
+        return result
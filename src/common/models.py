@@ -1,9 +1,72 @@
-from dataclasses import dataclass
-from math import radians, sin, cos, sqrt, atan2
+from dataclasses import dataclass, fields
+from typing import Any, Callable, ClassVar, Iterable, Iterator, Sequence, TypeVar, get_type_hints
+
+import numpy as np
+import pandas as pd
+
+from common.utils import haversine_distance
+
+BatchT = TypeVar("BatchT", bound="ColumnarBatch")
 
 
 class BaseDataclass:
-    """Base class for dataclasses that provides methods for getting attribute names and values recursively"""
+    """
+    Base class for dataclasses that provides methods for getting attribute names and values recursively
+
+    The field layout of a dataclass is static, so the flattened attribute names and a generated function
+    returning the flattened values as a tuple are computed once per class and cached.
+    """
+    __slots__ = ()  # lets subclasses declared with @dataclass(slots=True) drop the per-instance __dict__
+
+    _flatteners: ClassVar[dict[type, tuple[tuple[str, ...], Callable[[Any], tuple]]]] = {}
+
+    @classmethod
+    def _nested_fields(cls) -> Iterator[tuple[str, type["BaseDataclass"] | None]]:
+        """Yields names of dataclass fields with their type if it is a nested BaseDataclass"""
+        hints = get_type_hints(cls)
+        for field in fields(cls):
+            hint = hints.get(field.name)
+            yield field.name, hint if isinstance(hint, type) and issubclass(hint, BaseDataclass) else None
+
+    @classmethod
+    def _build_flattener(cls) -> tuple[tuple[str, ...], Callable[[Any], tuple]]:
+        names: list[str] = []
+        expressions: list[str] = []
+        lines: list[str] = []
+
+        def visit(klass: type[BaseDataclass], variable: str, prefix: str) -> None:
+            for name, nested in klass._nested_fields():
+                if nested is None:
+                    names.append(prefix + name)
+                    expressions.append(f"{variable}.{name}")
+                else:
+                    nested_variable = f"_{len(lines)}"
+                    lines.append(f"    {nested_variable} = {variable}.{name}")
+                    visit(nested, nested_variable, f"{prefix}{name}_")
+
+        visit(cls, "obj", "")
+        source = "def flatten(obj):\n{}\n    return ({},)".format("\n".join(lines), ", ".join(expressions))
+        namespace: dict[str, Any] = {}
+        exec(source, namespace)
+        return tuple(names), namespace["flatten"]
+
+    @classmethod
+    def _flattener(cls) -> tuple[tuple[str, ...], Callable[[Any], tuple]]:
+        flattener = BaseDataclass._flatteners.get(cls)
+        if flattener is None:
+            flattener = BaseDataclass._flatteners[cls] = cls._build_flattener()
+        return flattener
+
+    @classmethod
+    def attribute_names(cls) -> tuple[str, ...]:
+        """Flattened attribute names of the class, see get_attribute_names"""
+        return cls._flattener()[0]
+
+    @classmethod
+    def values_getter(cls) -> Callable[[Any], tuple]:
+        """Generated function returning the flattened attribute values of an instance as a tuple"""
+        return cls._flattener()[1]
+
     def get_attribute_names(self) -> list[str]:
         """
         Recursively gets all attribute names of the dataclass and its nested dataclasses
@@ -11,28 +74,14 @@ class BaseDataclass:
         If an attribute is an object which is a child of BaseDataclass, the attribute names of the child object
         will be prefixed with the parent attribute name and an underscore.
         """
-        keys: list[str] = []
-        for key, value in zip(self.__annotations__.keys(), self.__dict__.values()):
-            if isinstance(value, BaseDataclass):
-                keys.extend(
-                    [f"{key}_{sub_key}" for sub_key in value.get_attribute_names()]
-                )
-            else:
-                keys.append(key)
-        return keys
+        return list(self.attribute_names())
 
     def get_values(self) -> list:
         """Recursively gets all attribute values of the dataclass and its nested dataclasses"""
-        values = []
-        for value in self.__dict__.values():
-            if isinstance(value, BaseDataclass):
-                values.extend(value.get_values())
-            else:
-                values.append(value)
-        return values
+        return list(self.values_getter()(self))
 
 
-@dataclass
+@dataclass(slots=True)
 class Location(BaseDataclass):
     latitude: float  # degrees
     longitude: float  # degrees
@@ -48,15 +97,95 @@ class Location(BaseDataclass):
 
     def distance_to(self, other: "Location") -> float:
         """Calculates the great-circle distance between two locations"""
+        return float(haversine_distance(self.latitude, self.longitude, other.latitude, other.longitude))
+
+
+class ColumnarBatch:
+    """
+    Base class for dataclasses that store rows column by column in NumPy arrays (struct of arrays)
 
-        # Convert decimal degrees to radians
-        lat1, lon1, lat2, lon2 = map(radians, [self.latitude, self.longitude, other.latitude, other.longitude])
+    Every dataclass field is one column. Columns are float64 unless listed in COLUMN_DTYPES; missing values
+    are stored as NaN. Float columns listed in INTEGER_COLUMNS hold whole numbers that are only stored as floats
+    to allow missing values, and are converted back to int when rows are materialized.
+    """
+    COLUMN_DTYPES: ClassVar[dict[str, Any]] = {}
+    INTEGER_COLUMNS: ClassVar[frozenset[str]] = frozenset()
 
-        # Haversine formula
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        r = 6371  # Radius of Earth in kilometers
+    @classmethod
+    def column_names(cls) -> list[str]:
+        return [field.name for field in fields(cls)]
+
+    @classmethod
+    def from_rows(cls: type[BatchT], rows: Iterable[Sequence]) -> BatchT:
+        """Creates a batch from rows of values ordered like the columns"""
+        names = cls.column_names()
+        columns = list(zip(*rows)) or [()] * len(names)
+        return cls(**{
+            name: np.array(column, dtype=cls.COLUMN_DTYPES.get(name, float))
+            for name, column in zip(names, columns)
+        })
+
+    @classmethod
+    def concat(cls: type[BatchT], batches: Sequence[BatchT]) -> BatchT:
+        if not batches:
+            return cls.from_rows([])
+        return cls(**{
+            name: np.concatenate([getattr(batch, name) for batch in batches])
+            for name in cls.column_names()
+        })
+
+    def __len__(self) -> int:
+        return len(getattr(self, fields(self)[0].name))
+
+    def columns(self) -> dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.column_names()}
+
+    def take(self: BatchT, indices: np.ndarray | list[int] | slice) -> BatchT:
+        """Selects rows by position"""
+        return type(self)(**{name: column[indices] for name, column in self.columns().items()})
+
+    def complete_rows(self: BatchT) -> BatchT:
+        """Selects the rows without missing values, e.g. for formats whose schema does not allow them"""
+        complete = np.ones(len(self), dtype=bool)
+        for column in self.columns().values():
+            if column.dtype.kind == 'f':
+                complete &= ~np.isnan(column)
+        return self if complete.all() else self.take(complete)
+
+    def column_values(self, name: str) -> list:
+        """Returns a column as a list of Python values, with None in place of missing values"""
+        column = getattr(self, name)
+        if column.dtype.kind != 'f':
+            return column.tolist()
+
+        missing = np.isnan(column)
+        if name in self.INTEGER_COLUMNS:
+            values = np.where(missing, 0, column).astype(np.int64).tolist()
+        else:
+            values = column.tolist()
+        for i in np.flatnonzero(missing).tolist():
+            values[i] = None
+        return values
+
+    def rows(self) -> Iterator[tuple]:
+        """Iterates over rows as tuples of Python values"""
+        return zip(*(self.column_values(name) for name in self.column_names()))
+
+    def to_records(self) -> Iterator[dict[str, Any]]:
+        """Iterates over rows as dictionaries, e.g. to write them with fastavro or send them as JSON"""
+        names = self.column_names()
+        return (dict(zip(names, row)) for row in self.rows())
+
+    def to_numpy(self, columns: Sequence[str]) -> np.ndarray:
+        """
+        Returns selected columns as a 2D feature matrix with one row per datapoint.
+
+        A single column is returned as a view without copying; several columns are stacked into a new array.
+        """
+        if len(columns) == 1:
+            return getattr(self, columns[0]).reshape(-1, 1)
+        return np.column_stack([getattr(self, name) for name in columns])
 
-        return c * r
+    def to_dataframe(self) -> pd.DataFrame:
+        """Returns the batch as a DataFrame; columns are shared with the batch where pandas allows it"""
+        return pd.DataFrame(self.columns(), copy=False)
@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+from typing import Any, Iterator
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    body BLOB NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID
+"""
+
+
+@dataclass
+class ReplayStats:
+    hits: int = 0
+    misses: int = 0  # requests that were not recorded
+
+
+class ResponseArchive:
+    """
+    Compact local archive of API responses for recording and replaying them without network access.
+
+    Responses are stored as zlib-compressed JSON per kind of request and request key in an SQLite database,
+    so an archive is a single file that can be shared and recorded into from several threads.
+    """
+
+    def __init__(self, path: str) -> None:
+        """:param path: path to the archive file, created if missing"""
+        self.path = path
+        self._local = threading.local()  # SQLite connections cannot be shared between threads
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _key(key: tuple) -> str:
+        return json.dumps(key)
+
+    def put(self, kind: str, key: tuple, response: Any) -> None:
+        """
+        Records a response.
+
+        :param kind: kind of request, e.g. the name of the API method
+        :param key: arguments identifying the request, JSON serializable
+        :param response: JSON serializable response
+        """
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (kind, key, body) VALUES (?, ?, ?)",
+                (kind, self._key(key), zlib.compress(json.dumps(response).encode())),
+            )
+
+    def lookup(self, kind: str, key: tuple) -> tuple[bool, Any]:
+        """
+        Looks a recorded response up.
+
+        :return: whether the request was recorded, and its response
+        """
+        row = self._connection().execute(
+            "SELECT body FROM responses WHERE kind = ? AND key = ?", (kind, self._key(key)),
+        ).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(zlib.decompress(row[0]))
+
+    def keys(self, kind: str) -> Iterator[tuple]:
+        """Iterates over the keys of all recorded requests of a kind"""
+        for (key,) in self._connection().execute("SELECT key FROM responses WHERE kind = ? ORDER BY key", (kind,)):
+            yield tuple(json.loads(key))
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
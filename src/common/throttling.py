@@ -0,0 +1,260 @@
+from dataclasses import dataclass
+from enum import Enum
+from multiprocessing.context import BaseContext
+import asyncio
+import multiprocessing
+import random
+import threading
+import time
+from typing import Callable
+
+
+class ErrorKind(Enum):
+    """How a failed call to an external service should be handled"""
+    RATE_LIMITED = "rate_limited"  # retry later, at a lower rate
+    SERVER = "server"  # temporary server error, retry
+    TRANSIENT = "transient"  # timeout or network error, retry
+    PERMANENT = "permanent"  # invalid request, retrying cannot help
+
+
+@dataclass
+class CallStats:
+    """Statistics of calls to an external service"""
+    calls: int = 0  # attempts, including retries
+    retries: int = 0
+    rate_limited: int = 0
+    throttle_wait_s: float = 0.0  # time spent waiting for the rate limiter
+    backoff_wait_s: float = 0.0  # time spent waiting before retries
+
+    @property
+    def waited_s(self) -> float:
+        return self.throttle_wait_s + self.backoff_wait_s
+
+
+class RateLimiter:
+    """
+    Token bucket limiting how often a shared resource, e.g. an API, is called.
+
+    Tokens are refilled continuously at `rate` per second up to `burst`. Every call takes one token; when the
+    bucket is empty the call reserves the next token and waits for it, so waiting callers are served in order.
+    The limiter is thread-safe and can be used both from threads and from coroutines.
+    """
+
+    def __init__(self, rate: float | None, burst: int = 1, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        :param rate: tokens per second, None for no limit
+        :param burst: maximum number of calls that can be made at once after the limiter was idle
+        :param clock: monotonic clock in seconds
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token without waiting for it.
+
+        :return: number of seconds the caller has to wait before using the token
+        """
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> float:
+        """
+        Blocks until a token is available.
+
+        :return: number of seconds waited
+        """
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self) -> float:
+        """
+        Waits without blocking the event loop until a token is available.
+
+        :return: number of seconds waited
+        """
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+def backoff_delay(
+        attempt: int,
+        base_delay: float,
+        max_delay: float,
+        random_fraction: Callable[[], float] = random.random,
+) -> float:
+    """
+    Exponential backoff with full jitter: a random delay up to base_delay * 2^attempt, capped at max_delay.
+
+    Jitter spreads the retries of concurrent clients, so they do not hit the server again at the same moment.
+
+    :param attempt: number of the retry, starting from 0
+    :param base_delay: upper bound of the first delay in seconds
+    :param max_delay: upper bound of every delay in seconds
+    :param random_fraction: source of random numbers in [0, 1)
+    :return: delay in seconds
+    """
+    return random_fraction() * min(max_delay, base_delay * 2 ** attempt)
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    RateLimiter that adapts to the limit actually enforced by the server.
+
+    The rate is halved whenever the server reports that it is rate limiting, down to min_rate, and recovers
+    by a small fraction after every successful call, up to the configured rate.
+    """
+
+    def __init__(
+            self,
+            rate: float,
+            burst: int = 1,
+            min_rate: float | None = None,
+            recovery: float = 0.05,
+            clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param rate: maximum tokens per second
+        :param burst: maximum number of calls that can be made at once after the limiter was idle
+        :param min_rate: lower bound of the rate, by default a hundredth of the maximum
+        :param recovery: fraction the rate grows by after every successful call
+        :param clock: monotonic clock in seconds
+        """
+        super().__init__(rate, burst, clock)
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 100
+        self.recovery = recovery
+
+    def decrease(self) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def increase(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate * (1 + self.recovery))
+
+
+class SharedRateLimiter(AdaptiveRateLimiter):
+    """
+    AdaptiveRateLimiter whose state lives in shared memory, so that all processes started with it draw from
+    one global rate budget, and rate limiting noticed by one process slows all of them down.
+
+    The limiter has to be passed to the processes when they are started, e.g. as arguments or initargs.
+    """
+
+    def __init__(
+            self,
+            rate: float,
+            burst: int = 1,
+            min_rate: float | None = None,
+            recovery: float = 0.05,
+            clock: Callable[[], float] = time.monotonic,
+            mp_context: BaseContext | None = None,
+    ) -> None:
+        """
+        :param clock: monotonic clock in seconds shared by all processes, which time.monotonic is
+        :param mp_context: multiprocessing context the processes are started with, the default one if None
+        """
+        mp_context = mp_context if mp_context is not None else multiprocessing.get_context()
+        self._state = mp_context.RawArray("d", 3)  # rate, tokens, last update
+        super().__init__(rate, burst, min_rate, recovery, clock)
+        self._lock = mp_context.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._state[0]
+
+    @rate.setter
+    def rate(self, value: float) -> None:
+        self._state[0] = value
+
+    @property
+    def _tokens(self) -> float:
+        return self._state[1]
+
+    @_tokens.setter
+    def _tokens(self, value: float) -> None:
+        self._state[1] = value
+
+    @property
+    def _updated(self) -> float:
+        return self._state[2]
+
+    @_updated.setter
+    def _updated(self, value: float) -> None:
+        self._state[2] = value
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a service that keeps failing"""
+
+    def __init__(self, message: str, retry_in_s: float) -> None:
+        """:param retry_in_s: seconds until a trial call is let through"""
+        super().__init__(message)
+        self.retry_in_s = retry_in_s
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while, so that callers fail fast instead of waiting for retries.
+
+    After failure_threshold consecutive failures the circuit opens and calls are rejected. Once reset_timeout_s
+    has passed, one trial call is let through: its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(
+            self,
+            failure_threshold: int = 5,
+            reset_timeout_s: float = 300,
+            clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def check(self) -> None:
+        """Raises CircuitOpenError if calls are currently rejected"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout_s - self._clock()
+            if remaining > 0:
+                raise CircuitOpenError(
+                    f"Circuit open after {self._failures} failures, retry in {remaining:.0f} s", remaining,
+                )
+            # Half-open: let this call through and reject others until it finishes
+            self._opened_at = self._clock()
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
@@ -1,5 +1,36 @@
 from datetime import datetime, timezone
 
+import numpy as np
+from numpy.typing import ArrayLike
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_distance(
+        latitudes1: ArrayLike,
+        longitudes1: ArrayLike,
+        latitudes2: ArrayLike,
+        longitudes2: ArrayLike,
+) -> np.ndarray:
+    """
+    Calculates great-circle distances between pairs of points in one vectorized pass.
+
+    Arguments are broadcast against each other, so a whole track can be compared with a single destination.
+
+    :param latitudes1: latitudes of the first points in degrees
+    :param longitudes1: longitudes of the first points in degrees
+    :param latitudes2: latitudes of the second points in degrees
+    :param longitudes2: longitudes of the second points in degrees
+    :return: distances in kilometers
+    """
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(value, dtype=float)) for value in (latitudes1, longitudes1, latitudes2, longitudes2)
+    )
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    a = np.clip(a, 0.0, 1.0)  # guard against rounding just outside of the domain of sqrt
+    return 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)) * EARTH_RADIUS_KM
+
 
 def calculate_speed(distance: float, time: float) -> float | None:
     """
@@ -3,7 +3,29 @@ import yaml
 
 AIRPORTS_DATA = os.path.join("data", "static", "airports.csv")
 DOWNLOAD_DATA_DIR = os.path.join("data", "downloaded_data")
+COLLECTION_MANIFEST_PATH = os.path.join(DOWNLOAD_DATA_DIR, "manifest.json")
+WORK_QUEUE_PATH = os.path.join("data", "work_queue.sqlite")
+WORK_QUEUE_LEASE_S = 600  # a window of a worker that stopped sending heartbeats is leased again after this
+WEATHER_STORE_PATH = os.path.join("data", "weather.sqlite")
+WEATHER_GRID_RESOLUTION_DEG = 0.1  # weather lookups are snapped to a grid with this spacing
 WEATHER_API_URL = "http://api.weatherapi.com/v1/history.json"
+WEATHER_MAX_CONCURRENCY = 8  # parallel weather API requests
+WEATHER_REQUESTS_PER_SECOND = 10.0
+WEATHER_TIMEOUT_S = 10.0
+# OpenSky API credits are limited per day; calls are spread evenly and slowed down further when it rate limits us
+OPENSKY_REQUESTS_PER_SECOND = 1.0
+OPENSKY_BURST = 10
+OPENSKY_TRACK_WORKERS = 4  # threads fetching flight tracks concurrently
+WEATHER_JOIN_WORKERS = 2  # threads joining flight datapoints with weather concurrently
+PIPELINE_QUEUE_SIZE = 16  # flights waiting for every collection stage
+CSV_SINK_BUFFER_BYTES = 1024 ** 2  # rows buffered before they are written to the output file
+SINK_FLUSH_INTERVAL_S = 10.0  # maximum time collected rows stay buffered in memory
+AVRO_CODEC = "deflate"  # snappy and zstandard need cramjam and backports.zstd respectively
+AVRO_BLOCK_BYTES = 1024 ** 2  # encoded rows compressed and written as one Avro block
+TRACK_CACHE_PATH = os.path.join("data", "tracks.sqlite")
+TRACK_CACHE_MAX_BYTES = 2 * 1024 ** 3
+TRACK_CACHE_MAX_AGE_S = 90 * 24 * 3600
+TRACK_CACHE_NEGATIVE_TTL_S = 6 * 3600  # OpenSky may publish a missing track later
 
 with open('credentials.yaml') as file:
     _config = yaml.load(file, Loader=yaml.FullLoader)
@@ -1,24 +1,66 @@
+from dataclasses import asdict
+from typing import Callable
 from datetime import datetime, timedelta
 import structlog
 import os
+import threading
 
-from .models import CombinedDatapoint
+from .manifest import WindowManifest
+from .models import CombinedDatapointBatch
+from .pipeline import Pipeline, Stage
+from .sinks import CSVSink, Sink
 from flight_data.flight_data import FlightData, FlightInfo
-from flight_data.models import FlightDatapoint
-from weather_data.weather_data import WeatherDataProcessor
+from flight_data.models import FlightDatapointBatch
+from flight_data.track_engine import TrackColumns
+from weather_data.cache import CacheKey
+from weather_data.weather_data import WeatherDataProcessor, WeatherPrefetchPlan
 import config
 
 logger = structlog.get_logger()
 
 
+class ProcessingStoppedError(RuntimeError):
+    """Raised when processing of a time window was stopped before it completed, e.g. because its lease was lost"""
+
+
 class FlightCollector:
-    """Collects flight data and save it to CSV"""
+    """Collects flight data and save it to CSV or Avro files"""
     TIME_WINDOW_DELTA = timedelta(hours=2)
 
-    def __init__(self, flight_data: FlightData, output_file_template: str = "flights_{start}_to_{end}.csv") -> None:
+    def __init__(
+            self,
+            flight_data: FlightData,
+            output_file_template: str = "flights_{start}_to_{end}.csv",
+            weather_data: WeatherDataProcessor | None = None,
+            track_workers: int = 1,
+            manifest: WindowManifest | None = None,
+            weather_workers: int = 1,
+            queue_size: int = 16,
+            sink_factory: Callable[[str], Sink] = CSVSink,
+    ) -> None:
+        """
+        :param flight_data: source of flights and their tracks
+        :param output_file_template: name of the output file of every time window
+        :param weather_data: source of weather data joined with flight datapoints
+        :param track_workers: number of threads fetching tracks concurrently
+        :param manifest: progress of time windows, by default kept next to the output files
+        :param weather_workers: number of threads joining datapoints with weather concurrently
+        :param queue_size: maximum number of flights waiting for every processing stage
+        :param sink_factory: opens the sink of an output file, e.g. a CSVSink or an AvroSink with its options;
+            the extension of output_file_template should match it
+        """
+        if track_workers < 1:
+            raise ValueError(f"Number of track workers must be positive, got {track_workers}")
+        if weather_workers < 1:
+            raise ValueError(f"Number of weather workers must be positive, got {weather_workers}")
         self.flight_data = flight_data
-        self.weather_data = WeatherDataProcessor()
+        self.track_workers = track_workers
+        self.weather_workers = weather_workers
+        self.queue_size = queue_size
+        self.sink_factory = sink_factory
+        self.weather_data = weather_data if weather_data is not None else WeatherDataProcessor()
         self.output_template = output_file_template
+        self.manifest = manifest if manifest is not None else WindowManifest(config.COLLECTION_MANIFEST_PATH)
 
     def _generate_filename(self, start_time: datetime, end_time: datetime) -> str:
         """Generates output filename based on the start and end time of a current time window"""
@@ -38,41 +80,197 @@ class FlightCollector:
         end_timestamp = int(end_time.timestamp())
 
         flights = self.flight_data.get_flights(start_timestamp, end_timestamp)
+        if flights is None:
+            return None
         if not flights:
             logger.warning("no flights found in time window", start=start_time, end=end_time)
-            return None
+            return flights
 
         logger.info("found flights", count=len(flights))
         return flights
 
-    def process_flights(self, flights: list[FlightInfo], output_file: str) -> None:
-        """Convert flights to FlightDatapoints and save them to CSV file"""
-        for flight in flights:
-            datapoints = self.flight_data.get_flight_datapoints(flight)
-            if not datapoints:
-                logger.warning("missing datapoints", icao24=flight.icao24)
-                continue
+    def process_flights(
+            self,
+            flights: list[FlightInfo],
+            sink: Sink,
+            window: str | None = None,
+            stop: threading.Event | None = None,
+    ) -> None:
+        """
+        Convert flights to FlightDatapoints, join them with weather data and save them to the output file.
 
-            combined_datapoints = self.get_weather_data_for_flight_datapoints(datapoints)
+        Flights stream through a pipeline of four stages connected by bounded queues: fetching tracks, building
+        datapoints, prefetching weather and joining datapoints with weather. The calling thread saves the results
+        in the order of the flights. Fetching tracks and weather overlaps with building datapoints, and only a
+        bounded number of flights is held in memory. The weather days needed by the window are planned as tracks
+        arrive and the missing ones are fetched concurrently ahead of the join; the plan is logged at the end.
 
-            logger.info("saving flight data", datapoints_count=len(datapoints), icao24=flight.icao24)
-            for combined_datapoint in combined_datapoints:
-                combined_datapoint.save_to_csv(output_file)
+        :param flights: flights to process
+        :param sink: output file the datapoints are written to
+        :param window: time window in progress in the manifest, flights are recorded in it once their rows
+            were flushed and synced to the file
+        :param stop: when set, processing stops after the current flight
+        :raises ProcessingStoppedError: if stop was set before all flights were processed
+        """
+        self.weather_data.reset_request_stats()
+        weather_plan = WeatherPrefetchPlan(required=0, missing=[])
+        pipeline = self._create_pipeline(weather_plan)
+        saved: list[tuple[FlightInfo, int]] = []  # flights whose rows may still be buffered by the sink
+        flushes = sink.flushes
+        try:
+            for flight, combined_batch in pipeline.run(flights):
+                if combined_batch is None:
+                    logger.warning("missing datapoints", icao24=flight.icao24)
+                    saved.append((flight, 0))
+                else:
+                    logger.info("saving flight data", datapoints_count=len(combined_batch), icao24=flight.icao24)
+                    sink.write(combined_batch)
+                    saved.append((flight, len(combined_batch)))
+                # Flights are recorded once their rows are on disk, flights without rows together with the next
+                # flush, so that they do not rewrite the manifest one by one
+                if sink.flushes != flushes:
+                    self._record_flights(window, saved, sink.size)
+                    saved = []
+                    flushes = sink.flushes
+                if stop is not None and stop.is_set():
+                    raise ProcessingStoppedError(f"Processing of time window {window} was stopped")
+        finally:
+            # Rows of flights processed before a failure are kept, so a resumed run does not repeat them
+            sink.flush()
+            self._record_flights(window, saved, sink.size)
 
-    def get_weather_data_for_flight_datapoints(self, flight_datapoints: list[FlightDatapoint]) -> list[CombinedDatapoint]:
-        """Get weather data for each flight datapoint and combine datapoint"""
-        datapoints: list[CombinedDatapoint] = []
-        for flight in flight_datapoints:
-            weather_datapoint = self.weather_data.get_weather_datapoint_for_flight_datapoint(flight)
-            datapoints.append(CombinedDatapoint.from_datapoints(flight, weather_datapoint))
+        for stage, stats in pipeline.stats.items():
+            logger.info("pipeline stage", stage=stage, processed=stats.processed,
+                        busy_s=round(stats.busy_s, 2), blocked_s=round(stats.blocked_s, 2))
+        logger.info("weather prefetch", cell_days=weather_plan.required, api_calls=weather_plan.api_calls)
+        logger.info("weather cache", **asdict(self.weather_data.cache.stats))
+        logger.info("weather cells requested", **self.weather_data.request_stats())
+        logger.info("coalesced requests",
+                    weather=asdict(self.weather_data.in_flight.stats),
+                    tracks=asdict(self.flight_data.track_requests.stats))
+        track_cache = self.flight_data.track_cache
+        if track_cache is not None:
+            logger.info("track cache", **asdict(track_cache.stats), hit_rate=round(track_cache.stats.hit_rate, 3))
+        api_stats = self.flight_data.api_stats
+        logger.info("OpenSky API calls", **asdict(api_stats), waited_s=round(api_stats.waited_s, 1))
 
-        return datapoints
+    def _record_flights(self, window: str | None, saved: list[tuple[FlightInfo, int]], output_size: int) -> None:
+        if window is None or not saved:
+            return
+        flights = [(flight.icao24, flight.last_seen) for flight, _ in saved]
+        self.manifest.record_flights(window, flights, output_size, sum(datapoints for _, datapoints in saved))
 
+    def _create_pipeline(self, weather_plan: WeatherPrefetchPlan) -> Pipeline:
+        """
+        Stages of process_flights, each taking and returning a flight with the data built for it so far.
 
-    def run(self, days_offset: int, hours_offset: int) -> None:
+        All track workers share the OpenSky rate limiter of flight_data, and weather workers share the weather
+        cache, which coalesces their concurrent requests for the same days.
+
+        :param weather_plan: plan the weather days needed by the flights are added to
         """
-        Runs the collector for a specified number of days and hours offset from the current time to
-        get flight data in batches of 2 hours.
+        planned: set[CacheKey] = set()
+        plan_lock = threading.Lock()
+        def fetch_track(flight: FlightInfo) -> tuple[FlightInfo, TrackColumns | None]:
+            return flight, self.flight_data.get_track(flight)
+
+        def build_datapoints(item: tuple[FlightInfo, TrackColumns | None]) -> tuple[FlightInfo, FlightDatapointBatch | None]:
+            flight, track = item
+            return flight, self.flight_data.build_flight_datapoint_batch(flight, track)
+
+        def prefetch_weather(item: tuple[FlightInfo, FlightDatapointBatch | None]) -> tuple[FlightInfo, FlightDatapointBatch | None]:
+            flight, flight_batch = item
+            if not flight_batch:
+                return item
+            # Planning is serialized, so every day is planned and counted once per window; a flight needing a
+            # day planned by another flight waits for it in the join
+            with plan_lock:
+                plan = self.weather_data.plan_prefetch([flight_batch], planned)
+                weather_plan.required += plan.required
+                weather_plan.missing += plan.missing
+            if plan.api_calls:
+                logger.info("prefetching weather", icao24=flight.icao24, cell_days=plan.required, api_calls=plan.api_calls)
+                self.weather_data.prefetch(plan)
+            return item
+
+        def join_weather(item: tuple[FlightInfo, FlightDatapointBatch | None]) -> tuple[FlightInfo, CombinedDatapointBatch | None]:
+            flight, flight_batch = item
+            return flight, self.get_weather_data_for_flight_batch(flight_batch) if flight_batch else None
+
+        return Pipeline([
+            Stage("tracks", fetch_track, self.track_workers, self.queue_size),
+            Stage("datapoints", build_datapoints, 1, self.queue_size),
+            Stage("weather prefetch", prefetch_weather, self.weather_workers, self.queue_size),
+            Stage("weather", join_weather, self.weather_workers, self.queue_size),
+        ])
+
+    def get_weather_data_for_flight_batch(self, flight_batch: FlightDatapointBatch) -> CombinedDatapointBatch:
+        """Get weather data for all datapoints of a flight in one pass and combine them with the datapoints"""
+        weather_batch = self.weather_data.get_weather_batch_for_flight_batch(flight_batch)
+        return CombinedDatapointBatch.from_batches(flight_batch, weather_batch)
+
+    def process_window(self, start_time: datetime, end_time: datetime, stop: threading.Event | None = None) -> None:
+        """
+        Collects and processes flights of a time window unless the manifest marks it as completed.
+
+        Datapoints are written through a sink to a partial file that is renamed to the output file once all
+        flights were processed, so an output file is always complete. A window interrupted before is resumed: its
+        partial file is truncated to the size recorded after the last flushed flights and only the remaining
+        flights are processed. If the partial file is shorter than the recorded size, the window is restarted.
+        A window is completed only once its flights were listed, possibly none.
+
+        :param stop: when set, processing stops after the current flight and the window is left in progress
+        :raises RuntimeError: if no list of flights was returned, leaving the window to be retried
+        :raises ProcessingStoppedError: if stop was set before the window was completed
+        """
+        output_file = self._generate_filename(start_time, end_time)
+        window = os.path.basename(output_file)
+        if self.manifest.is_completed(window):
+            logger.info("skipping completed time window", window=window)
+            return
+
+        flights = self.collect_flights_in_time_window(start_time, end_time)
+        if flights is None:
+            raise RuntimeError(f"No list of flights returned for time window {window}")
+        if stop is not None and stop.is_set():
+            raise ProcessingStoppedError(f"Processing of time window {window} was stopped")
+        state = self.manifest.start(window)
+        partial_file = output_file + ".part"
+        partial_size = os.path.getsize(partial_file) if os.path.exists(partial_file) else 0
+        if partial_size < state.output_size:
+            # Rows of recorded flights were lost, e.g. by a crash of the machine, and it is not known which
+            logger.warning("restarting time window with truncated output", window=window,
+                           size=partial_size, recorded_size=state.output_size)
+            state = self.manifest.restart(window)
+        if os.path.exists(partial_file):
+            with open(partial_file, "r+b") as file:
+                file.truncate(state.output_size)
+
+        done = set(state.flights_done)
+        remaining = [flight for flight in flights if (flight.icao24, flight.last_seen) not in done]
+        if done:
+            logger.info("resuming time window", window=window, done=len(done), remaining=len(remaining))
+        with self.sink_factory(output_file) as sink:
+            if remaining:
+                self.process_flights(remaining, sink, window, stop)
+            sink.finalize()
+        self.manifest.complete(window)
+
+    @classmethod
+    def _first_window_start(cls, start_time: datetime) -> datetime:
+        """Rounds a time up to the next multiple of the time window, so that restarted runs use the same windows"""
+        window_hours = cls.TIME_WINDOW_DELTA // timedelta(hours=1)
+        aligned = start_time.replace(minute=0, second=0, microsecond=0) - timedelta(hours=start_time.hour % window_hours)
+        return aligned if aligned == start_time else aligned + cls.TIME_WINDOW_DELTA
+
+    @classmethod
+    def windows(cls, days_offset: int, hours_offset: int) -> list[tuple[datetime, datetime]]:
+        """
+        Time windows of 2 hours from a specified number of days and hours offset from the current time.
+
+        Windows start at multiples of 2 hours and only windows that already ended are included.
+
+        :return: start and end time of every window, in chronological order
         """
         if days_offset >= 30:
             raise ValueError("Days offset must be less than 30")
@@ -80,13 +278,36 @@ class FlightCollector:
             raise ValueError("Hours offset must be between 0 and 24 (excluded)")
 
         current_time = datetime.now()
-        start_time = current_time - timedelta(days=days_offset, hours=hours_offset)
-        end_time = start_time + self.TIME_WINDOW_DELTA
+        start_time = cls._first_window_start(current_time - timedelta(days=days_offset, hours=hours_offset))
+        end_time = start_time + cls.TIME_WINDOW_DELTA
+        windows = []
         while end_time <= current_time:
-            output_file = self._generate_filename(start_time, end_time)
+            windows.append((start_time, end_time))
+            start_time, end_time = end_time, end_time + cls.TIME_WINDOW_DELTA
+        return windows
+
+    def run(self, days_offset: int, hours_offset: int) -> None:
+        """
+        Runs the collector for a specified number of days and hours offset from the current time to
+        get flight data in batches of 2 hours.
+
+        Windows completed by an earlier run are skipped and an interrupted window is resumed.
+        """
+        self.run_windows(self.windows(days_offset, hours_offset))
 
-            flights = self.collect_flights_in_time_window(start_time, end_time)
-            if flights:
-                self.process_flights(flights, output_file)
+    def run_windows(self, windows: list[tuple[datetime, datetime]]) -> None:
+        """Processes time windows one after another"""
+        for start_time, end_time in windows:
+            self.process_window(start_time, end_time)
 
-            start_time, end_time = end_time, end_time + self.TIME_WINDOW_DELTA
+    def metrics(self) -> dict[str, dict[str, float]]:
+        """Statistics of API calls and caches accumulated by the collector so far"""
+        metrics = {
+            "opensky_api": asdict(self.flight_data.api_stats),
+            "track_requests": asdict(self.flight_data.track_requests.stats),
+            "weather_cache": asdict(self.weather_data.cache.stats),
+            "weather_requests": asdict(self.weather_data.in_flight.stats),
+        }
+        if self.flight_data.track_cache is not None:
+            metrics["track_cache"] = asdict(self.flight_data.track_cache.stats)
+        return metrics
@@ -0,0 +1,163 @@
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from typing import Iterator
+import fcntl
+import json
+import os
+import tempfile
+import threading
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class WindowStatus(Enum):
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+
+
+@dataclass
+class WindowState:
+    """Progress of one collection time window"""
+    status: WindowStatus = WindowStatus.IN_PROGRESS
+    flights_done: list[tuple[str, int]] = field(default_factory=list)  # (icao24, last seen) of processed flights
+    output_size: int = 0  # bytes of the partial output file written for flights_done
+    datapoints: int = 0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "status": self.status.value}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WindowState":
+        return cls(
+            status=WindowStatus(data["status"]),
+            flights_done=[tuple(flight) for flight in data["flights_done"]],
+            output_size=data["output_size"],
+            datapoints=data["datapoints"],
+        )
+
+
+def write_atomically(path: str, data: bytes) -> None:
+    """
+    Writes a file through a temporary file in the same directory that is renamed over it,
+    so readers and a process restarted after a crash never see a half-written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class WindowManifest:
+    """
+    JSON manifest of completed and in-progress collection windows, making collector runs resumable.
+
+    A window is identified by the name of its output file. While a window is in progress, every processed
+    flight is recorded together with the size its partial output file had afterwards; a restarted run truncates
+    the partial file to that size, so rows of a flight interrupted mid-write are dropped, and skips the recorded
+    flights. The manifest is rewritten atomically after every change.
+
+    Several processes may share the manifest as long as they work on different windows: every change is made
+    under an exclusive lock of the file, to the latest version read from disk.
+    """
+
+    def __init__(self, path: str) -> None:
+        """:param path: path to the manifest file, created on the first change"""
+        self.path = path
+        self._lock = threading.Lock()
+        self._windows: dict[str, WindowState] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if os.path.isfile(self.path):
+            with open(self.path) as file:
+                self._windows = {
+                    window: WindowState.from_dict(state) for window, state in json.load(file)["windows"].items()
+                }
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Locks the manifest against other threads and processes and reloads it"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock, open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._load()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self) -> None:
+        windows = {window: state.to_dict() for window, state in self._windows.items()}
+        write_atomically(self.path, json.dumps({"windows": windows}, indent=1).encode())
+
+    def get(self, window: str) -> WindowState | None:
+        return self._windows.get(window)
+
+    def is_completed(self, window: str) -> bool:
+        state = self._windows.get(window)
+        return state is not None and state.status is WindowStatus.COMPLETED
+
+    def start(self, window: str) -> WindowState:
+        """Marks a window as in progress, keeping the progress of an earlier interrupted run"""
+        with self._locked():
+            state = self._windows.get(window)
+            if state is None:
+                state = self._windows[window] = WindowState()
+                self._save()
+            return state
+
+    def restart(self, window: str) -> WindowState:
+        """Drops the progress of a window in progress, so that all its flights are processed again"""
+        with self._locked():
+            state = self._windows[window] = WindowState()
+            self._save()
+            return state
+
+    def record_flight(self, window: str, flight: tuple[str, int], output_size: int, datapoints: int = 0) -> None:
+        """
+        Records that a flight of a window in progress was processed.
+
+        :param window: window the flight belongs to
+        :param flight: icao24 and last seen of the flight
+        :param output_size: size of the partial output file after the rows of the flight were written
+        :param datapoints: number of rows written for the flight
+        """
+        self.record_flights(window, [flight], output_size, datapoints)
+
+    def record_flights(self, window: str, flights: list[tuple[str, int]], output_size: int, datapoints: int = 0) -> None:
+        """
+        Records that several flights of a window in progress were processed, with a single rewrite of the manifest.
+
+        :param window: window the flights belong to
+        :param flights: icao24 and last seen of the flights
+        :param output_size: size of the partial output file after the rows of the flights were written
+        :param datapoints: number of rows written for all the flights
+        """
+        with self._locked():
+            state = self._windows[window]
+            state.flights_done.extend(flights)
+            state.output_size = output_size
+            state.datapoints += datapoints
+            self._save()
+
+    def complete(self, window: str) -> None:
+        """Marks a window as completed; its output file has to be finalized before"""
+        with self._locked():
+            state = self._windows.setdefault(window, WindowState())
+            state.status = WindowStatus.COMPLETED
+            state.flights_done = []
+            self._save()
+
+    def __len__(self) -> int:
+        return len(self._windows)
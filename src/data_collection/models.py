@@ -1,10 +1,15 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from typing import Iterable
 import os
 import csv
 
-from common.models import BaseDataclass
-from flight_data.models import FlightDatapoint
-from weather_data.models import WeatherDatapoint
+import fastavro
+import numpy as np
+
+from common.models import BaseDataclass, ColumnarBatch
+from flight_data.models import FlightDatapoint, FlightDatapointBatch
+from weather_data.models import WeatherDatapoint, WeatherDatapointBatch
+from schema import SCHEMA
 
 
 @dataclass
@@ -33,3 +38,78 @@ class CombinedDatapoint(BaseDataclass):
                 writer.writerow(self.get_attribute_names())
 
             writer.writerow(self.get_values())
+
+
+@dataclass
+class CombinedDatapointBatch(ColumnarBatch):
+    """CombinedDatapoints stored column by column, with the flattened column names of the Avro SCHEMA"""
+    COLUMN_DTYPES = {
+        "timestamp": np.int64,
+        "flight_arrival_airport": object,
+        "flight_timestamp": np.int64,
+        "weather_timestamp": np.int64,
+        "weather_condition_text": object,
+    }
+    INTEGER_COLUMNS = frozenset({"flight_arrival_time", "flight_time_to_arrival"})
+
+    timestamp: np.ndarray
+    flight_location_latitude: np.ndarray
+    flight_location_longitude: np.ndarray
+    flight_arrival_airport: np.ndarray
+    flight_arrival_airport_location_latitude: np.ndarray
+    flight_arrival_airport_location_longitude: np.ndarray
+    flight_timestamp: np.ndarray
+    flight_horizontal_speed: np.ndarray
+    flight_altitude: np.ndarray
+    flight_vertical_speed: np.ndarray
+    flight_heading: np.ndarray
+    flight_distance_to_destination: np.ndarray
+    flight_arrival_time: np.ndarray
+    flight_time_to_arrival: np.ndarray
+    weather_timestamp: np.ndarray
+    weather_temperature_celsius: np.ndarray
+    weather_feels_like_celsius: np.ndarray
+    weather_condition_text: np.ndarray
+    weather_wind_speed_kph: np.ndarray
+    weather_humidity_percent: np.ndarray
+    weather_precipitation_mm: np.ndarray
+    weather_visibility_km: np.ndarray
+    weather_pressure_mb: np.ndarray
+    weather_uv_index: np.ndarray
+
+    @classmethod
+    def from_batches(cls, flight: FlightDatapointBatch, weather: WeatherDatapointBatch) -> "CombinedDatapointBatch":
+        """Combines flight and weather batches aligned row by row; the columns are shared, not copied"""
+        if len(flight) != len(weather):
+            raise ValueError(f"Batches have different lengths: {len(flight)} flight and {len(weather)} weather rows")
+
+        columns = {"timestamp": flight.timestamp}
+        columns.update({f"flight_{field.name}": getattr(flight, field.name) for field in fields(flight)})
+        columns.update({f"weather_{field.name}": getattr(weather, field.name) for field in fields(weather)})
+        return cls(**columns)
+
+    @classmethod
+    def from_datapoints(cls, datapoints: Iterable[CombinedDatapoint]) -> "CombinedDatapointBatch":
+        return cls.from_rows(map(CombinedDatapoint.values_getter(), datapoints))
+
+    def save_to_csv(self, filename: str) -> None:
+        """Appends all rows to a CSV file with a single open, writing the header if the file is empty"""
+        file_exists = os.path.isfile(filename) and os.path.getsize(filename) > 0
+
+        with open(filename, mode='a', newline='') as file:
+            writer = csv.writer(file)
+            if not file_exists:
+                writer.writerow(self.column_names())
+
+            writer.writerows(self.rows())
+
+    def save_to_avro(self, filename: str, codec: str = "deflate") -> None:
+        """
+        Appends all rows to an Avro file with the flight weather SCHEMA, creating the file if needed.
+
+        The schema does not allow missing values, so rows with missing values are skipped.
+        """
+        file_exists = os.path.isfile(filename) and os.path.getsize(filename) > 0
+
+        with open(filename, mode='a+b' if file_exists else 'wb') as file:
+            fastavro.writer(file, SCHEMA, self.complete_rows().to_records(), codec=codec)
@@ -0,0 +1,193 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator
+import queue
+import threading
+import time
+
+_POLL_S = 0.1  # how often blocked threads check whether the pipeline was stopped
+
+
+@dataclass(frozen=True)
+class Stage:
+    """Step of a pipeline applying a function to every item"""
+    name: str
+    function: Callable[[Any], Any]
+    workers: int = 1  # threads applying the function concurrently
+    queue_size: int = 16  # maximum number of items waiting for the stage
+
+    def __post_init__(self) -> None:
+        if self.workers < 1 or self.queue_size < 1:
+            raise ValueError(f"Stage {self.name} needs at least one worker and queue slot")
+
+
+@dataclass
+class StageStats:
+    processed: int = 0
+    busy_s: float = 0.0  # time spent in the function, summed over workers
+    blocked_s: float = 0.0  # time spent waiting for room in the next queue, i.e. for slower stages downstream
+
+
+@dataclass
+class _Failure:
+    error: BaseException
+
+
+_END = object()  # marks the end of the input of a stage
+
+
+@dataclass
+class _StageState:
+    stage: Stage
+    input: queue.Queue
+    stats: StageStats = field(default_factory=StageStats)
+    running: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class Pipeline:
+    """
+    Streams items through stages running in their own threads, connected by bounded queues.
+
+    Every stage takes items from its queue as soon as they arrive, so network-bound and CPU-bound stages
+    overlap. A full queue blocks the stage feeding it, and at most max_in_flight items are inside the pipeline
+    at once, so memory does not depend on the number of items. Results are yielded in the order of the input.
+    An exception raised by a stage stops the pipeline and is raised by run.
+    """
+
+    def __init__(self, stages: list[Stage], max_in_flight: int | None = None) -> None:
+        """
+        :param stages: stages in the order items flow through them
+        :param max_in_flight: maximum number of items taken from the input but not yet yielded, by default
+            enough to fill every queue and worker
+        """
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        self.max_in_flight = max_in_flight or sum(stage.workers + stage.queue_size for stage in stages)
+        self.stats: dict[str, StageStats] = {}
+
+    def run(self, items: Iterable[Any]) -> Iterator[Any]:
+        """
+        Streams items through all stages.
+
+        :param items: input items, consumed lazily
+        :return: result of the last stage for every item, in the order of the items
+        """
+        stop = threading.Event()
+        in_flight = threading.Semaphore(self.max_in_flight)
+        states = [_StageState(stage, queue.Queue(stage.queue_size)) for stage in self.stages]
+        output: queue.Queue = queue.Queue()
+        self.stats = {state.stage.name: state.stats for state in states}
+
+        threads = [threading.Thread(target=self._feed, args=(items, states[0], in_flight, stop), name="pipeline-feed")]
+        for i, state in enumerate(states):
+            if i + 1 < len(states):
+                next_queue, next_workers = states[i + 1].input, states[i + 1].stage.workers
+            else:
+                next_queue, next_workers = output, 1
+            state.running = state.stage.workers
+            threads += [
+                threading.Thread(
+                    target=self._work,
+                    args=(state, next_queue, next_workers, stop),
+                    name=f"pipeline-{state.stage.name}-{worker}",
+                    daemon=True,
+                )
+                for worker in range(state.stage.workers)
+            ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            yield from self._collect(output, in_flight, stop)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    @staticmethod
+    def _put(target: queue.Queue, item: Any, stop: threading.Event) -> bool:
+        """Waits for room in a queue; returns False if the pipeline was stopped meanwhile"""
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=_POLL_S)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def _get(source: queue.Queue, stop: threading.Event) -> Any:
+        """Waits for an item; returns _END if the pipeline was stopped meanwhile"""
+        while not stop.is_set():
+            try:
+                return source.get(timeout=_POLL_S)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _feed(self, items: Iterable[Any], first: _StageState, in_flight: threading.Semaphore, stop: threading.Event) -> None:
+        iterator = iter(items)
+        sequence = 0
+        try:
+            while True:
+                # A slot is taken before the item, so items are not even read ahead of the limit
+                while not in_flight.acquire(timeout=_POLL_S):
+                    if stop.is_set():
+                        return
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                if not self._put(first.input, (sequence, item), stop):
+                    return
+                sequence += 1
+        except BaseException as e:
+            # Failures of the input are reported like failures of the first stage
+            self._put(first.input, (-1, _Failure(e)), stop)
+        for _ in range(first.stage.workers):
+            self._put(first.input, _END, stop)
+
+    def _work(self, state: _StageState, next_queue: queue.Queue, next_workers: int, stop: threading.Event) -> None:
+        stats = state.stats
+        while (entry := self._get(state.input, stop)) is not _END:
+            sequence, item = entry
+            if not isinstance(item, _Failure):
+                started = time.perf_counter()
+                try:
+                    item = state.stage.function(item)
+                except BaseException as e:
+                    item = _Failure(e)
+                finished = time.perf_counter()
+                with state.lock:
+                    stats.processed += 1
+                    stats.busy_s += finished - started
+            else:
+                finished = time.perf_counter()
+
+            if not self._put(next_queue, (sequence, item), stop):
+                return
+            with state.lock:
+                stats.blocked_s += time.perf_counter() - finished
+
+        # The last worker of a stage to finish ends the input of the next stage
+        with state.lock:
+            state.running -= 1
+            last = state.running == 0
+        if last:
+            for _ in range(next_workers):
+                self._put(next_queue, _END, stop)
+
+    def _collect(self, output: queue.Queue, in_flight: threading.Semaphore, stop: threading.Event) -> Iterator[Any]:
+        pending: dict[int, Any] = {}
+        next_sequence = 0
+        while (entry := self._get(output, stop)) is not _END:
+            sequence, item = entry
+            if isinstance(item, _Failure):
+                raise item.error
+            pending[sequence] = item
+            while next_sequence in pending:
+                result = pending.pop(next_sequence)
+                next_sequence += 1
+                in_flight.release()
+                yield result
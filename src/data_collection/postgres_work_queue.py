@@ -0,0 +1,165 @@
+from datetime import datetime
+from typing import Callable
+import threading
+
+import psycopg
+
+from .work_queue import WorkItem, WorkStatus
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS windows (
+    start BIGINT PRIMARY KEY,
+    "end" BIGINT NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_expires DOUBLE PRECISION,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+)
+"""
+
+
+class PostgresWorkQueue:
+    """
+    Work queue of collection time windows kept in a PostgreSQL database, shared by workers on several machines.
+
+    It has the semantics of SQLiteWorkQueue. A window is leased with SELECT ... FOR UPDATE SKIP LOCKED, so
+    concurrent workers lease different windows without waiting for each other. Leases expire by the clock of
+    the database server by default, so the clocks of the workers do not have to agree.
+    """
+
+    def __init__(self, dsn: str, max_attempts: int = 3, clock: Callable[[], float] | None = None) -> None:
+        """
+        :param dsn: connection string of the database, e.g. postgresql://user@host/collector
+        :param max_attempts: number of failed attempts after which a window is no longer leased
+        :param clock: wall clock in seconds since epoch shared by all workers, None for the clock of the server
+        """
+        self.dsn = dsn
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._local = threading.local()  # psycopg connections are not meant to be shared between threads
+        self._execute(_SCHEMA)
+
+    def _connection(self) -> psycopg.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = psycopg.connect(self.dsn, autocommit=True)
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> psycopg.Cursor:
+        return self._connection().execute(sql, parameters)
+
+    def _now(self, connection: psycopg.Connection) -> float:
+        if self._clock is not None:
+            return self._clock()
+        return connection.execute("SELECT EXTRACT(EPOCH FROM clock_timestamp())::float8").fetchone()[0]
+
+    def enqueue(self, windows: list[tuple[datetime, datetime]]) -> int:
+        """
+        Adds time windows to the queue, windows already in the queue are kept as they are.
+
+        :return: number of added windows
+        """
+        return self._execute(
+            'INSERT INTO windows (start, "end", status) '
+            "SELECT start, window_end, %s FROM unnest(%s::bigint[], %s::bigint[]) AS w(start, window_end) "
+            "ON CONFLICT (start) DO NOTHING",
+            (WorkStatus.PENDING.value,
+             [int(start.timestamp()) for start, _ in windows], [int(end.timestamp()) for _, end in windows]),
+        ).rowcount
+
+    def lease(self, worker: str, lease_s: float) -> WorkItem | None:
+        """
+        Leases the earliest pending window or window with an expired lease and attempts left.
+
+        Windows with an expired lease and no attempts left are set aside as failed first.
+
+        :param worker: identifier of the worker, unique across machines
+        :param lease_s: seconds after which the window can be leased by another worker unless extended
+        :return: leased window or None if there is no window to lease
+        """
+        connection = self._connection()
+        with connection.transaction():
+            now = self._now(connection)
+            connection.execute(
+                "UPDATE windows SET status = %s, worker = NULL, lease_expires = NULL, error = %s "
+                "WHERE status = %s AND lease_expires <= %s AND attempts >= %s",
+                (WorkStatus.FAILED.value, "lease expired", WorkStatus.LEASED.value, now, self.max_attempts),
+            )
+            row = connection.execute(
+                "WITH next AS ("
+                "  SELECT start FROM windows"
+                "  WHERE status = %s OR (status = %s AND lease_expires <= %s)"
+                "  ORDER BY start LIMIT 1 FOR UPDATE SKIP LOCKED"
+                ") "
+                "UPDATE windows SET status = %s, worker = %s, lease_expires = %s, attempts = attempts + 1 "
+                'FROM next WHERE windows.start = next.start RETURNING windows.start, windows."end", windows.attempts',
+                (WorkStatus.PENDING.value, WorkStatus.LEASED.value, now,
+                 WorkStatus.LEASED.value, worker, now + lease_s),
+            ).fetchone()
+        if row is None:
+            return None
+        return WorkItem.from_timestamps(*row)
+
+    def _update_lease(self, item: WorkItem, worker: str, assignments: str, parameters: tuple) -> bool:
+        """Updates a window if it is still leased by the worker"""
+        cursor = self._execute(
+            f"UPDATE windows SET {assignments} WHERE start = %s AND status = %s AND worker = %s",
+            (*parameters, int(item.start.timestamp()), WorkStatus.LEASED.value, worker),
+        )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, item: WorkItem, worker: str, lease_s: float) -> bool:
+        """
+        Extends the lease of a window.
+
+        :return: False if the lease was lost, because it expired and the window was leased by another worker
+        """
+        connection = self._connection()
+        with connection.transaction():
+            return self._update_lease(item, worker, "lease_expires = %s", (self._now(connection) + lease_s,))
+
+    def complete(self, item: WorkItem, worker: str) -> bool:
+        """
+        Marks a leased window as done.
+
+        :return: False if the lease was lost before, in which case the window is completed by another worker
+        """
+        return self._update_lease(
+            item, worker, "status = %s, lease_expires = NULL, error = NULL", (WorkStatus.DONE.value,),
+        )
+
+    def release(self, item: WorkItem, worker: str, error: str) -> bool:
+        """
+        Gives a window that failed back to the queue, or sets it aside when it failed max_attempts times.
+
+        :return: False if the lease was lost before
+        """
+        status = WorkStatus.FAILED if item.attempts >= self.max_attempts else WorkStatus.PENDING
+        return self._update_lease(
+            item, worker, "status = %s, worker = NULL, lease_expires = NULL, error = %s", (status.value, error),
+        )
+
+    def requeue_failed(self) -> int:
+        """
+        Gives all failed windows back to the queue with a new budget of attempts.
+
+        :return: number of requeued windows
+        """
+        return self._execute(
+            "UPDATE windows SET status = %s, attempts = 0 WHERE status = %s",
+            (WorkStatus.PENDING.value, WorkStatus.FAILED.value),
+        ).rowcount
+
+    def counts(self) -> dict[str, int]:
+        """Number of windows in every status"""
+        rows = self._execute("SELECT status, COUNT(*) FROM windows GROUP BY status").fetchall()
+        return {status.value: 0 for status in WorkStatus} | dict(rows)
+
+    def close(self) -> None:
+        """Closes the connection of the calling thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
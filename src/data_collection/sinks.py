@@ -0,0 +1,227 @@
+from abc import ABC, abstractmethod
+from typing import Callable
+import csv
+import io
+import os
+import sys
+import time
+
+import fastavro
+import structlog
+
+from common.models import ColumnarBatch
+from config import AVRO_BLOCK_BYTES, AVRO_CODEC, CSV_SINK_BUFFER_BYTES, SINK_FLUSH_INTERVAL_S
+from schema import SCHEMA
+
+logger = structlog.get_logger()
+
+
+class Sink(ABC):
+    """
+    Output file of a collection window, kept open while batches are written to it.
+
+    Rows are buffered in memory and written to the file once the buffer is full or flush_interval_s passed
+    since the last flush. Rows are appended to a partial file, so a window interrupted earlier continues its
+    partial file, and finalize renames it to the output file, which therefore is either complete or missing.
+    After every flush the partial file ends after complete rows and is synced to disk, so its size can be
+    recorded and the file truncated to it later.
+
+    Subclasses open self._file and implement the format specific methods below.
+    """
+    EXTENSION: str
+
+    def __init__(self, path: str, flush_interval_s: float, clock: Callable[[], float]) -> None:
+        self.path = path
+        self.partial_path = path + ".part"
+        self.flush_interval_s = flush_interval_s
+        self._clock = clock
+        self._last_flush = clock()
+        self.flushes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    @abstractmethod
+    def size(self) -> int:
+        """Bytes written to the partial file so far"""
+
+    @property
+    @abstractmethod
+    def pending_rows(self) -> int:
+        """Rows written to the sink but not to the file yet"""
+
+    @abstractmethod
+    def _buffer(self, batch: ColumnarBatch) -> bool:
+        """Buffers all rows of a batch; returns whether the buffer is full"""
+
+    @abstractmethod
+    def _write_buffer(self) -> None:
+        """Writes the buffered rows to the partial file"""
+
+    @abstractmethod
+    def _has_rows(self) -> bool:
+        """Whether rows were written to the partial file"""
+
+    def write(self, batch: ColumnarBatch) -> None:
+        """Buffers all rows of a batch, flushing the buffer if it is full or old enough"""
+        if self._buffer(batch) or self._clock() - self._last_flush >= self.flush_interval_s:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered rows to the partial file and syncs it"""
+        self._last_flush = self._clock()
+        if not self.pending_rows:
+            return
+        self._write_buffer()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.flushes += 1
+
+    def close(self) -> None:
+        """Flushes and closes the partial file without finalizing it, e.g. to continue it later"""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def finalize(self) -> None:
+        """Flushes and renames the partial file to the output file; a file without rows is removed"""
+        self.flush()
+        has_rows = self._has_rows()
+        self._file.close()
+        if has_rows:
+            os.replace(self.partial_path, self.path)
+        else:
+            os.remove(self.partial_path)
+        logger.debug("finalized output file", path=self.path, size=self.size, flushes=self.flushes)
+
+    def __enter__(self) -> "Sink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class CSVSink(Sink):
+    """
+    CSV output file with the header written once, when the file is empty.
+
+    Rows are encoded into an in-memory buffer that is written with a single write once it holds buffer_bytes.
+    """
+    EXTENSION = "csv"
+
+    def __init__(
+            self,
+            path: str,
+            buffer_bytes: int = CSV_SINK_BUFFER_BYTES,
+            flush_interval_s: float = SINK_FLUSH_INTERVAL_S,
+            clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param path: output file, written through path + ".part" until finalized
+        :param buffer_bytes: size of the buffered rows that triggers a flush
+        :param flush_interval_s: maximum time rows stay buffered, checked when a batch is written
+        :param clock: monotonic clock in seconds
+        """
+        super().__init__(path, flush_interval_s, clock)
+        self.buffer_bytes = buffer_bytes
+        self._file = open(self.partial_path, "ab")
+        self._size = self._file.seek(0, os.SEEK_END)
+        self._rows = io.StringIO(newline="")
+        self._writer = csv.writer(self._rows)
+        self._pending_rows = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def pending_rows(self) -> int:
+        return self._pending_rows
+
+    def _buffer(self, batch: ColumnarBatch) -> bool:
+        if self._size == 0 and self._rows.tell() == 0:
+            self._writer.writerow(batch.column_names())
+        self._writer.writerows(batch.rows())
+        self._pending_rows += len(batch)
+        return self._rows.tell() >= self.buffer_bytes
+
+    def _write_buffer(self) -> None:
+        data = self._rows.getvalue().encode()
+        self._file.write(data)
+        self._size += len(data)
+        self._rows.seek(0)
+        self._rows.truncate()
+        self._pending_rows = 0
+
+    def _has_rows(self) -> bool:
+        return self._size > 0
+
+
+class AvroSink(Sink):
+    """
+    Avro output file with the flight weather SCHEMA, written without converting CSV files afterwards.
+
+    Rows are encoded by fastavro into the current block, which is compressed with codec and written once it
+    holds block_bytes. A partial file is continued with the codec it was created with. The schema does not allow
+    missing values, so rows with missing values are dropped and counted in dropped_rows.
+    """
+    EXTENSION = "avro"
+
+    def __init__(
+            self,
+            path: str,
+            codec: str = AVRO_CODEC,
+            block_bytes: int = AVRO_BLOCK_BYTES,
+            flush_interval_s: float = SINK_FLUSH_INTERVAL_S,
+            clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param path: output file, written through path + ".part" until finalized
+        :param codec: compression codec of fastavro, e.g. deflate, snappy or zstandard
+        :param block_bytes: size of the encoded rows that triggers writing a block
+        :param flush_interval_s: maximum time rows stay buffered, checked when a batch is written
+        :param clock: monotonic clock in seconds
+        """
+        super().__init__(path, flush_interval_s, clock)
+        self.check_codec(codec)
+        self.block_bytes = block_bytes
+        resumed = os.path.isfile(self.partial_path) and os.path.getsize(self.partial_path) > 0
+        self._file = open(self.partial_path, "a+b" if resumed else "wb")
+        self._rows_written = False
+        if resumed:
+            self._file.seek(0)
+            self._rows_written = next(iter(fastavro.block_reader(self._file)), None) is not None
+            self._file.seek(0, os.SEEK_END)
+        # Blocks are written by flush only, so the file never ends in a block the sink does not know about
+        self._writer = fastavro.write.Writer(self._file, SCHEMA, codec=codec, sync_interval=sys.maxsize)
+        self._size = self._file.tell()
+        self.dropped_rows = 0
+
+    @staticmethod
+    def check_codec(codec: str) -> None:
+        """Raises ValueError if the codec is unknown or the library it needs is not installed"""
+        fastavro.writer(io.BytesIO(), {"type": "record", "name": "codec_check", "fields": []}, [{}], codec=codec)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def pending_rows(self) -> int:
+        return self._writer.block_count
+
+    def _buffer(self, batch: ColumnarBatch) -> bool:
+        complete = batch.complete_rows()
+        if len(complete) < len(batch):
+            self.dropped_rows += len(batch) - len(complete)
+            logger.warning("dropped rows with missing values", path=self.path, count=len(batch) - len(complete))
+        for record in complete.to_records():
+            self._writer.write(record)
+        return self._writer.io.tell() >= self.block_bytes
+
+    def _write_buffer(self) -> None:
+        self._writer.dump()
+        self._size = self._file.tell()
+        self._rows_written = True
+
+    def _has_rows(self) -> bool:
+        return self._rows_written
@@ -0,0 +1,298 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, Protocol
+import os
+import sqlite3
+import threading
+import time
+
+import structlog
+
+from .flight_collector import FlightCollector, ProcessingStoppedError
+
+logger = structlog.get_logger()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS windows (
+    start INTEGER PRIMARY KEY,
+    end INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+)
+"""
+
+
+class WorkStatus(Enum):
+    PENDING = "pending"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"  # failed max_attempts times, needs to be looked at and requeued
+
+
+@dataclass(frozen=True)
+class WorkItem:
+    """Time window leased by a worker"""
+    start: datetime  # in UTC
+    end: datetime  # in UTC
+    attempts: int  # including the current one
+
+    @classmethod
+    def from_timestamps(cls, start: int, end: int, attempts: int) -> "WorkItem":
+        """Creates the item from times in seconds since epoch as stored by the queues"""
+        return cls(datetime.fromtimestamp(start, tz=timezone.utc), datetime.fromtimestamp(end, tz=timezone.utc), attempts)
+
+
+class WorkQueue(Protocol):
+    """
+    Durable queue of collection time windows shared by workers.
+
+    A worker leases a window for lease_s seconds and has to extend the lease by heartbeats while it processes
+    the window. The window of a worker that died is leased again once its lease expires. A completed window is
+    never leased again, and a window that failed max_attempts times, including attempts whose leases expired,
+    is set aside as failed.
+    """
+
+    def enqueue(self, windows: list[tuple[datetime, datetime]]) -> int: ...
+
+    def lease(self, worker: str, lease_s: float) -> WorkItem | None: ...
+
+    def heartbeat(self, item: WorkItem, worker: str, lease_s: float) -> bool: ...
+
+    def complete(self, item: WorkItem, worker: str) -> bool: ...
+
+    def release(self, item: WorkItem, worker: str, error: str) -> bool: ...
+
+    def requeue_failed(self) -> int: ...
+
+    def counts(self) -> dict[str, int]: ...
+
+    def close(self) -> None: ...
+
+
+class SQLiteWorkQueue:
+    """
+    WorkQueue kept in one SQLite database in WAL mode, every operation being a single transaction.
+
+    The queue can be shared by processes on one machine only: WAL mode needs memory shared by all processes
+    using the database, and the locks of network filesystems are not reliable, so the database must not be
+    put on NFS or SMB to share it between machines. Workers on several machines share a PostgresWorkQueue.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3, clock: Callable[[], float] = time.time) -> None:
+        """
+        :param path: path to the database file, created if missing
+        :param max_attempts: number of failed attempts after which a window is no longer leased
+        :param clock: wall clock in seconds since epoch, shared by all workers
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._local = threading.local()  # SQLite connections cannot be shared between threads
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        with self._connection() as connection:
+            return connection.execute(sql, parameters)
+
+    def enqueue(self, windows: list[tuple[datetime, datetime]]) -> int:
+        """
+        Adds time windows to the queue, windows already in the queue are kept as they are.
+
+        :return: number of added windows
+        """
+        with self._connection() as connection:
+            cursor = connection.executemany(
+                "INSERT OR IGNORE INTO windows (start, end, status) VALUES (?, ?, ?)",
+                [(int(start.timestamp()), int(end.timestamp()), WorkStatus.PENDING.value) for start, end in windows],
+            )
+            return cursor.rowcount
+
+    def lease(self, worker: str, lease_s: float) -> WorkItem | None:
+        """
+        Leases the earliest pending window or window with an expired lease and attempts left.
+
+        Windows with an expired lease and no attempts left are set aside as failed first.
+
+        :param worker: identifier of the worker, unique across machines
+        :param lease_s: seconds after which the window can be leased by another worker unless extended
+        :return: leased window or None if there is no window to lease
+        """
+        now = self._clock()
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE windows SET status = ?, worker = NULL, lease_expires = NULL, error = ? "
+                "WHERE status = ? AND lease_expires <= ? AND attempts >= ?",
+                (WorkStatus.FAILED.value, "lease expired", WorkStatus.LEASED.value, now, self.max_attempts),
+            )
+            row = connection.execute(
+                "UPDATE windows SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE start = ("
+                "  SELECT start FROM windows"
+                "  WHERE status = ? OR (status = ? AND lease_expires <= ?)"
+                "  ORDER BY start LIMIT 1"
+                ") RETURNING start, end, attempts",
+                (WorkStatus.LEASED.value, worker, now + lease_s,
+                 WorkStatus.PENDING.value, WorkStatus.LEASED.value, now),
+            ).fetchone()
+        if row is None:
+            return None
+        return WorkItem.from_timestamps(*row)
+
+    def _update_lease(self, item: WorkItem, worker: str, assignments: str, parameters: tuple) -> bool:
+        """Updates a window if it is still leased by the worker"""
+        cursor = self._execute(
+            f"UPDATE windows SET {assignments} WHERE start = ? AND status = ? AND worker = ?",
+            (*parameters, int(item.start.timestamp()), WorkStatus.LEASED.value, worker),
+        )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, item: WorkItem, worker: str, lease_s: float) -> bool:
+        """
+        Extends the lease of a window.
+
+        :return: False if the lease was lost, because it expired and the window was leased by another worker
+        """
+        return self._update_lease(item, worker, "lease_expires = ?", (self._clock() + lease_s,))
+
+    def complete(self, item: WorkItem, worker: str) -> bool:
+        """
+        Marks a leased window as done.
+
+        :return: False if the lease was lost before, in which case the window is completed by another worker
+        """
+        return self._update_lease(
+            item, worker, "status = ?, lease_expires = NULL, error = NULL", (WorkStatus.DONE.value,),
+        )
+
+    def release(self, item: WorkItem, worker: str, error: str) -> bool:
+        """
+        Gives a window that failed back to the queue, or sets it aside when it failed max_attempts times.
+
+        :return: False if the lease was lost before
+        """
+        status = WorkStatus.FAILED if item.attempts >= self.max_attempts else WorkStatus.PENDING
+        return self._update_lease(
+            item, worker, "status = ?, worker = NULL, lease_expires = NULL, error = ?", (status.value, error),
+        )
+
+    def requeue_failed(self) -> int:
+        """
+        Gives all failed windows back to the queue with a new budget of attempts.
+
+        :return: number of requeued windows
+        """
+        return self._execute(
+            "UPDATE windows SET status = ?, attempts = 0 WHERE status = ?",
+            (WorkStatus.PENDING.value, WorkStatus.FAILED.value),
+        ).rowcount
+
+    def counts(self) -> dict[str, int]:
+        """Number of windows in every status"""
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM windows GROUP BY status").fetchall()
+        return {status.value: 0 for status in WorkStatus} | dict(rows)
+
+    def close(self) -> None:
+        """Closes the connection of the calling thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class _Heartbeat:
+    """
+    Extends the lease of a window in a background thread while the window is processed.
+
+    Sets lost when the lease could not be extended, so that the worker stops processing the window.
+    """
+
+    def __init__(self, queue: WorkQueue, item: WorkItem, worker: str, lease_s: float) -> None:
+        self._queue = queue
+        self._item = item
+        self._worker = worker
+        self._lease_s = lease_s
+        self._stopped = threading.Event()
+        self.lost = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def _run(self) -> None:
+        try:
+            while not self._stopped.wait(self._lease_s / 3):
+                if not self._queue.heartbeat(self._item, self._worker, self._lease_s):
+                    logger.warning("lost lease of time window",
+                                   start=self._item.start.isoformat(), worker=self._worker)
+                    self.lost.set()
+                    return
+        finally:
+            self._queue.close()
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+
+def work(
+        queue: WorkQueue,
+        collector: FlightCollector,
+        worker: str,
+        lease_s: float,
+        poll_s: float | None = None,
+) -> int:
+    """
+    Leases and processes time windows until the queue has none left.
+
+    :param queue: queue of time windows
+    :param collector: collector processing the windows
+    :param worker: identifier of the worker, unique across machines
+    :param lease_s: duration of a lease, heartbeats extend it every third of it
+    :param poll_s: when set, windows leased by other workers are waited for every poll_s seconds until all
+        windows are done or failed, so that windows of workers that die are taken over
+    :return: number of windows completed by this worker
+    """
+    completed = 0
+    while True:
+        item = queue.lease(worker, lease_s)
+        if item is None:
+            if poll_s is None or queue.counts()[WorkStatus.LEASED.value] == 0:
+                return completed
+            time.sleep(poll_s)
+            continue
+
+        logger.info("leased time window", start=item.start.isoformat(), worker=worker, attempt=item.attempts)
+        with _Heartbeat(queue, item, worker, lease_s) as heartbeat:
+            try:
+                collector.process_window(item.start, item.end, stop=heartbeat.lost)
+            except ProcessingStoppedError:
+                # The window is processed by the worker holding the lease now
+                logger.warning("stopped time window after its lease was lost", start=item.start.isoformat())
+                continue
+            except Exception as e:
+                logger.exception("time window failed", start=item.start.isoformat(), worker=worker)
+                queue.release(item, worker, str(e) or type(e).__name__)
+                continue
+
+        if queue.complete(item, worker):
+            completed += 1
+        else:
+            logger.warning("time window completed after its lease was lost", start=item.start.isoformat())
@@ -1,18 +1,117 @@
+from functools import cached_property
+from typing import Iterable
+
+import numpy as np
 import pandas as pd
 
 from common.models import Location
+from .airports_index import AirportIndex
+from .airports_snapshot import AirportTable, load_or_compile
 
 
 class AirportData:
+    """
+    Airports in a table sorted by ICAO code, with O(1) membership and location lookups.
+
+    The table is used as is, so airports loaded from a memory-mapped snapshot are not copied. The dictionary
+    from ICAO code to row used by lookups is built on the first lookup, which keeps loading the snapshot cheap.
+    """
+
     def __init__(self, data_path: str) -> None:
-        self._airports = pd.read_csv(data_path)
+        airports = pd.read_csv(data_path).sort_values('ident')
+        self._set_columns(
+            airports['ident'].to_numpy(dtype=str).astype(np.bytes_),
+            airports['latitude'].to_numpy(dtype=float),
+            airports['longitude'].to_numpy(dtype=float),
+        )
+
+    @classmethod
+    def load(cls, data_path: str, snapshot_path: str | None = None) -> "AirportData":
+        """
+        Loads airports from a precompiled binary snapshot of the CSV file, which is much faster than parsing the CSV.
+
+        The snapshot is (re)compiled automatically when it is missing or the CSV file has changed.
+
+        :param data_path: path to the airports CSV file
+        :param snapshot_path: path to the snapshot, by default next to the CSV file
+        """
+        return cls.from_table(load_or_compile(data_path, snapshot_path))
+
+    @classmethod
+    def from_table(cls, table: AirportTable) -> "AirportData":
+        airports = cls.__new__(cls)
+        airports._set_columns(table.idents, table.latitudes, table.longitudes)
+        return airports
+
+    def _set_columns(self, idents: np.ndarray, latitudes: np.ndarray, longitudes: np.ndarray) -> None:
+        """:param idents: ASCII ICAO codes as fixed-width bytes, sorted"""
+        self._idents = idents
+        self._latitudes = latitudes
+        self._longitudes = longitudes
+
+    @cached_property
+    def _rows(self) -> dict[str, int]:
+        """Row of every airport in the table by ICAO code"""
+        return {ident: i for i, ident in enumerate(self._idents.astype(str).tolist())}
+
+    def _position(self, icao: str) -> int | None:
+        """Row of an airport in the table, or None if it is unknown"""
+        return self._rows.get(icao)
+
+    @cached_property
+    def spatial_index(self) -> AirportIndex:
+        """Spatial index over all airports, built on first use"""
+        return AirportIndex(self._idents.astype(str), self._latitudes, self._longitudes)
+
+    def __len__(self) -> int:
+        return len(self._idents)
 
     def is_airport(self, icao: str) -> bool:
-        return icao in self._airports['ident'].values
+        return self._position(icao) is not None
 
     def get_location(self, icao: str) -> Location:
-        airport = self._airports[self._airports['ident'] == icao]
+        i = self._position(icao)
+        if i is None:
+            raise ValueError(f"Unknown airport {icao}")
         return Location(
-            latitude=float(airport['latitude'].values[0]),
-            longitude=float(airport['longitude'].values[0]),
+            latitude=float(self._latitudes[i]),
+            longitude=float(self._longitudes[i]),
         )
+
+    def filter_airports(self, icaos: Iterable[str]) -> list[str]:
+        """
+        Filters a collection of ICAO codes down to the known airports in a single vectorized pass.
+
+        :param icaos: ICAO codes to check
+        :return: known airports, in the order they were given
+        """
+        candidates = np.asarray(list(icaos), dtype=str)
+        if candidates.size == 0 or not len(self._idents):
+            return []
+        keys = np.char.encode(candidates, errors="replace")
+        positions = np.minimum(np.searchsorted(self._idents, keys), len(self._idents) - 1)
+        return candidates[self._idents[positions] == keys].tolist()
+
+    def nearest_airport(self, location: Location, max_distance_km: float) -> str | None:
+        """
+        Finds the airport closest to a location.
+
+        :param location: location to search around
+        :param max_distance_km: maximum distance to the airport in kilometers
+        :return: ICAO code of the nearest airport or None if there is no airport within max_distance_km
+        """
+        distances, idents = self.spatial_index.nearest([location.latitude], [location.longitude])
+        if distances[0, 0] > max_distance_km:
+            return None
+        return str(idents[0, 0])
+
+    def airports_within(self, location: Location, radius_km: float) -> list[str]:
+        """
+        Finds all airports within a radius of a location, nearest first.
+
+        :param location: location to search around
+        :param radius_km: search radius in kilometers
+        :return: ICAO codes of the airports
+        """
+        _, idents = self.spatial_index.within_radius([location.latitude], [location.longitude], radius_km)[0]
+        return idents.tolist()
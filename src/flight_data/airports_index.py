@@ -0,0 +1,56 @@
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from common.utils import EARTH_RADIUS_KM
+
+
+class AirportIndex:
+    """Ball tree over airport coordinates answering batched nearest-airport and radius queries on the sphere"""
+
+    def __init__(self, idents: np.ndarray, latitudes: np.ndarray, longitudes: np.ndarray) -> None:
+        self._idents = np.asarray(idents)
+        self._tree = BallTree(self._to_radians(latitudes, longitudes), metric='haversine')
+
+    @staticmethod
+    def _to_radians(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        return np.radians(np.column_stack([
+            np.asarray(latitudes, dtype=float).ravel(),
+            np.asarray(longitudes, dtype=float).ravel(),
+        ]))
+
+    def nearest(self, latitudes: np.ndarray, longitudes: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds k nearest airports for every query point.
+
+        :param latitudes: latitudes of query points in degrees
+        :param longitudes: longitudes of query points in degrees
+        :param k: number of airports to return for each point
+        :return: distances in km and airport idents, both of shape (points, k) and sorted by distance
+        """
+        distances, indices = self._tree.query(self._to_radians(latitudes, longitudes), k=k)
+        return distances * EARTH_RADIUS_KM, self._idents[indices]
+
+    def within_radius(
+            self,
+            latitudes: np.ndarray,
+            longitudes: np.ndarray,
+            radius_km: float,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Finds all airports closer than radius_km to each query point.
+
+        :param latitudes: latitudes of query points in degrees
+        :param longitudes: longitudes of query points in degrees
+        :param radius_km: search radius in kilometers
+        :return: distances in km and airport idents for every query point, sorted by distance
+        """
+        indices, distances = self._tree.query_radius(
+            self._to_radians(latitudes, longitudes),
+            r=radius_km / EARTH_RADIUS_KM,
+            return_distance=True,
+            sort_results=True,
+        )
+        return [
+            (point_distances * EARTH_RADIUS_KM, self._idents[point_indices])
+            for point_indices, point_distances in zip(indices, distances)
+        ]
@@ -0,0 +1,131 @@
+import mmap
+import os
+import struct
+import tempfile
+from typing import NamedTuple
+
+import click
+import numpy as np
+import pandas as pd
+import structlog
+
+logger = structlog.get_logger()
+
+# Header layout: magic, source CSV size, source CSV mtime (ns), number of airports, ident width in bytes
+_MAGIC = b"APTSNAP2"
+_HEADER = struct.Struct("<8sQqQQ")
+_HEADER_SIZE = 64
+
+
+class AirportTable(NamedTuple):
+    """Column arrays of the airports table, sorted by ident"""
+    idents: np.ndarray  # fixed-width ASCII bytes
+    latitudes: np.ndarray  # float64 degrees
+    longitudes: np.ndarray  # float64 degrees
+    elevations: np.ndarray  # float64 meters, NaN when unknown
+
+
+def default_snapshot_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + ".snapshot"
+
+
+def _padded(size: int) -> int:
+    """Rounds size up so that the float64 arrays following it stay aligned"""
+    return (size + 7) // 8 * 8
+
+
+def compile_snapshot(csv_path: str, snapshot_path: str) -> None:
+    """
+    Compiles airports CSV into a binary snapshot: a sorted ident table followed by float64 coordinate arrays.
+
+    The snapshot is written to a temporary file and atomically renamed, so concurrent readers
+    never see a half-written file.
+
+    :param csv_path: path to the airports CSV file
+    :param snapshot_path: path of the snapshot to create
+    """
+    stat = os.stat(csv_path)
+    airports = pd.read_csv(csv_path).sort_values('ident')
+    idents = airports['ident'].to_numpy(dtype=str).astype(np.bytes_)
+    width = idents.dtype.itemsize
+    header = _HEADER.pack(_MAGIC, stat.st_size, stat.st_mtime_ns, len(idents), width)
+
+    directory = os.path.dirname(os.path.abspath(snapshot_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(header.ljust(_HEADER_SIZE, b"\0"))
+            file.write(idents.tobytes().ljust(_padded(idents.nbytes), b"\0"))
+            for column in ('latitude', 'longitude', 'elevation_meters'):
+                file.write(airports[column].to_numpy(dtype=np.float64).tobytes())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, snapshot_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    logger.info("compiled airports snapshot", path=snapshot_path, airports=len(idents))
+
+
+def _is_fresh(snapshot_path: str, csv_path: str) -> bool:
+    """Checks whether the snapshot exists and was compiled from the current version of the CSV file"""
+    try:
+        with open(snapshot_path, "rb") as file:
+            header = file.read(_HEADER.size)
+        csv_stat = os.stat(csv_path)
+    except FileNotFoundError:
+        return False
+    if len(header) != _HEADER.size:
+        return False
+
+    magic, csv_size, csv_mtime_ns, _, _ = _HEADER.unpack(header)
+    return magic == _MAGIC and csv_size == csv_stat.st_size and csv_mtime_ns == csv_stat.st_mtime_ns
+
+
+def load_snapshot(snapshot_path: str) -> AirportTable:
+    """
+    Memory-maps a compiled snapshot; the returned arrays are read-only views shared between processes.
+
+    :param snapshot_path: path to a snapshot created by compile_snapshot
+    :return: airport columns backed by the mapped file
+    """
+    with open(snapshot_path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, _, _, count, width = _HEADER.unpack_from(buffer)
+    if magic != _MAGIC:
+        raise ValueError(f"{snapshot_path} is not an airports snapshot")
+
+    idents = np.frombuffer(buffer, dtype=f"S{width}", count=count, offset=_HEADER_SIZE)
+    offset = _HEADER_SIZE + _padded(idents.nbytes)
+    columns = []
+    for _ in range(3):
+        columns.append(np.frombuffer(buffer, dtype=np.float64, count=count, offset=offset))
+        offset += count * 8
+
+    return AirportTable(idents, *columns)
+
+
+def load_or_compile(csv_path: str, snapshot_path: str | None = None) -> AirportTable:
+    """
+    Loads the snapshot for a CSV file, compiling it first if it is missing or older than the CSV.
+
+    :param csv_path: path to the airports CSV file
+    :param snapshot_path: path to the snapshot, by default next to the CSV with a .snapshot extension
+    :return: airport columns backed by the mapped snapshot
+    """
+    snapshot_path = snapshot_path or default_snapshot_path(csv_path)
+    if not _is_fresh(snapshot_path, csv_path):
+        compile_snapshot(csv_path, snapshot_path)
+    return load_snapshot(snapshot_path)
+
+
+@click.command()
+@click.argument('csv_path', default=os.path.join("data", "static", "airports.csv"))
+@click.option('--output', default=None, help='Snapshot path, defaults to the CSV path with a .snapshot extension')
+def main(csv_path: str, output: str | None) -> None:
+    compile_snapshot(csv_path, output or default_snapshot_path(csv_path))
+
+
+if __name__ == "__main__":
+    main()
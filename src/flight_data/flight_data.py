@@ -1,44 +1,170 @@
-from opensky_api import OpenSkyApi
+from dataclasses import replace
+import json
+import threading
 import time
+import requests
 import structlog
 from typing import Callable, Any
+import numpy as np
 
 from .airports_data import AirportData
-from common.utils import calculate_speed
-from .models import FlightDatapoint, FlightInfo
-from config import OPENSKY_PASSWORD, OPENSKY_USERNAME
+from .models import FlightDatapoint, FlightDatapointBatch, FlightInfo
+from .opensky_client import OpenSkyClient
+from .track_cache import SQLiteTrackStore
+from .track_engine import TrackColumns, build_datapoint_batch
+from config import OPENSKY_BURST, OPENSKY_PASSWORD, OPENSKY_REQUESTS_PER_SECOND, OPENSKY_USERNAME
+from common.coalescing import SingleFlight
+from common.throttling import (
+    AdaptiveRateLimiter,
+    CallStats,
+    CircuitBreaker,
+    CircuitOpenError,
+    ErrorKind,
+    backoff_delay,
+)
 from common.models import Location
 
 logger = structlog.get_logger()
 
 
+def classify_api_error(error: Exception) -> ErrorKind:
+    """Decides how a failed OpenSky API call should be retried"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        if status == 429:
+            return ErrorKind.RATE_LIMITED
+        return ErrorKind.SERVER if status >= 500 else ErrorKind.PERMANENT
+    if isinstance(error, (json.JSONDecodeError, requests.JSONDecodeError)):
+        # Truncated or garbled response body
+        return ErrorKind.TRANSIENT
+    if isinstance(error, (ValueError, TypeError)):
+        # Raised by the OpenSky client for invalid arguments, e.g. a too long time interval
+        return ErrorKind.PERMANENT
+    return ErrorKind.TRANSIENT
+
+
+def _retry_after(error: Exception) -> float | None:
+    """Delay in seconds requested by the server in a rate limiting response"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header in ("X-Rate-Limit-Retry-After-Seconds", "Retry-After"):
+        try:
+            return float(response.headers[header])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
 class FlightData:
     """Class to get flight data from OpenSky API"""
-    RETRY_ATTEMPTS = 3  # number of attempts in a row to retry a failed request to OpenSky API
-    RETRY_DELAY = 960  # 16 minutes - minimum time between two failed requests to not get blocked
+    RETRY_BUDGET_S = 3600  # seconds a failed request to OpenSky API is retried for, e.g. during an outage
+    RETRY_BASE_DELAY = 2  # seconds, upper bound of the first backoff after a timeout or server error
+    RATE_LIMITED_BASE_DELAY = 60  # seconds, upper bound of the first backoff after being rate limited
+    RETRY_MAX_DELAY = 960  # 16 minutes - upper bound of every backoff
+    CIRCUIT_FAILURE_THRESHOLD = 5  # consecutive failures after which calls are rejected for a while
+    CIRCUIT_RESET_TIMEOUT = 300  # seconds before a call is tried again after the circuit opened
     THRESHOLD_DISTANCE_KM = 10  # threshold distance from destination to consider the plane has arrived
 
-    def __init__(self, airports: AirportData) -> None:
-        self._api = OpenSkyApi(username=OPENSKY_USERNAME, password=OPENSKY_PASSWORD)
+    def __init__(
+            self,
+            airports: AirportData,
+            infer_arrival_airport: bool = False,
+            track_cache: SQLiteTrackStore | None = None,
+            rate_limiter: AdaptiveRateLimiter | None = None,
+            api: Any | None = None,
+    ) -> None:
+        """
+        :param airports: airports used to validate and locate arrival airports
+        :param infer_arrival_airport: keep flights without estimated arrival airport and infer it from
+            the airport nearest to the last point of their track
+        :param track_cache: persistent cache of tracks already fetched, None to always call the API
+        :param rate_limiter: limiter of OpenSky API calls, e.g. one shared with other processes
+        :param api: OpenSky API client, e.g. one recording or replaying responses, by default a client
+            logged in with the configured credentials
+        """
+        self._api = api if api is not None else OpenSkyClient(username=OPENSKY_USERNAME, password=OPENSKY_PASSWORD)
         self._airport_data = airports
+        self._infer_arrival_airport = infer_arrival_airport
+        self.track_cache = track_cache
+        self.track_requests: SingleFlight[tuple[str, int], TrackColumns | None] = SingleFlight()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else AdaptiveRateLimiter(
+            OPENSKY_REQUESTS_PER_SECOND, burst=OPENSKY_BURST,
+        )
+        self.circuit_breaker = CircuitBreaker(self.CIRCUIT_FAILURE_THRESHOLD, self.CIRCUIT_RESET_TIMEOUT)
+        self.api_stats = CallStats()
+        self._api_stats_lock = threading.Lock()  # tracks may be fetched from several threads
+
+    @property
+    def confirms_missing_data(self) -> bool:
+        """Whether the client returns None only when OpenSky has no data and raises errors, like OpenSkyClient"""
+        return getattr(self._api, "confirms_missing_data", False) is True
+
+    def _record_api_stats(self, **increments: float) -> None:
+        with self._api_stats_lock:
+            for name, increment in increments.items():
+                setattr(self.api_stats, name, getattr(self.api_stats, name) + increment)
 
     def _call_api(self, func: Callable, *args, **kwargs) -> Any:
         """
-        Wrapper function for error handling and retries for OpenSky API calls.
+        Wrapper function for rate limiting, error handling and retries for OpenSky API calls.
+
+        Calls are spaced out by an adaptive rate limiter. Timeouts, network and server errors are retried with
+        exponential backoff with jitter, rate limiting with a longer backoff and a lower rate, invalid requests
+        are not retried. After repeated failures the circuit breaker rejects calls for a while, which is waited
+        out. A call is retried as long as its next attempt starts within RETRY_BUDGET_S, so an outage of
+        OpenSky API pauses the collection instead of failing it.
 
         :param func: OpenSky API function to call
         :param args: arguments for func
         :param kwargs: keyword arguments for func
         :return: result of func call
+        :raises RuntimeError: if the call did not succeed within RETRY_BUDGET_S
         """
+        deadline = time.monotonic() + self.RETRY_BUDGET_S
+        attempt = 0
+        while True:
+            try:
+                self.circuit_breaker.check()
+            except CircuitOpenError as e:
+                if time.monotonic() + e.retry_in_s > deadline:
+                    raise RuntimeError(f"Failed to get flight data within {self.RETRY_BUDGET_S} s") from e
+                logger.warning("OpenSky API circuit open, waiting..", delay=round(e.retry_in_s, 1))
+                self._record_api_stats(backoff_wait_s=e.retry_in_s)
+                time.sleep(e.retry_in_s)
+                continue
 
-        for i in range(self.RETRY_ATTEMPTS):
+            self._record_api_stats(throttle_wait_s=self.rate_limiter.acquire(), calls=1)
             try:
-                return func(*args, **kwargs)
+                result = func(*args, **kwargs)
             except Exception as e:
-                logger.warning("An error occurred, retrying..", error=str(e))
-                time.sleep(self.RETRY_DELAY)
-        raise RuntimeError(f"Failed to get flight data after {self.RETRY_ATTEMPTS} attempts")
+                kind = classify_api_error(e)
+                if kind is ErrorKind.PERMANENT:
+                    raise
+                self.circuit_breaker.record_failure()
+                if kind is ErrorKind.RATE_LIMITED:
+                    self._record_api_stats(rate_limited=1)
+                    self.rate_limiter.decrease()
+                attempt += 1
+                if self.circuit_breaker.is_open:
+                    # The reset timeout of the circuit replaces the backoff
+                    continue
+
+                base_delay = self.RATE_LIMITED_BASE_DELAY if kind is ErrorKind.RATE_LIMITED else self.RETRY_BASE_DELAY
+                delay = _retry_after(e) or backoff_delay(attempt - 1, base_delay, self.RETRY_MAX_DELAY)
+                delay = min(delay, self.RETRY_MAX_DELAY)
+                if time.monotonic() + delay > deadline:
+                    raise RuntimeError(
+                        f"Failed to get flight data after {attempt} attempts within {self.RETRY_BUDGET_S} s"
+                    ) from e
+                logger.warning("An error occurred, retrying..", error=str(e), kind=kind.value, delay=round(delay, 1))
+                self._record_api_stats(retries=1, backoff_wait_s=delay)
+                time.sleep(delay)
+                continue
+
+            self.circuit_breaker.record_success()
+            self.rate_limiter.increase()
+            return result
 
     def get_flights(self, start: int, end: int) -> list[FlightInfo] | None:
         """
@@ -46,21 +172,27 @@ class FlightData:
 
         :param start: start time in seconds since epoch
         :param end: end time in seconds since epoch
-        :return: list of FlightInfo objects or None if no data is found
+        :return: list of FlightInfo objects, empty if OpenSky confirmed there are no flights, or None if the client
+            returned no data without confirming it
         """
         data = self._call_api(self._api.get_flights_from_interval, start, end)
 
         if data is None:
+            if self.confirms_missing_data:
+                return []
             logger.warning("No flights data returned")
             return None
 
         flights_info: list[FlightInfo] = []
         for flight in data:
             if not flight.estArrivalAirport:
-                continue
-            airport = flight.estArrivalAirport.replace(" ", "")
-            if not self._airport_data.is_airport(airport):
-                continue
+                if not self._infer_arrival_airport:
+                    continue
+                airport = None  # inferred from the flight track in get_flight_datapoints
+            else:
+                airport = flight.estArrivalAirport.replace(" ", "")
+                if not self._airport_data.is_airport(airport):
+                    continue
 
             flights_info.append(
                 FlightInfo(
@@ -73,64 +205,96 @@ class FlightData:
 
         return flights_info
 
-    def get_flight_datapoints(self, flight_info: FlightInfo, ignore_min_distance: bool = False) -> list[FlightDatapoint] | None:
-        """Get flight path from OpenSky API for a given flight and convert it to a list of FlightDatapoints"""
+    def _with_inferred_arrival_airport(self, flight_info: FlightInfo, track: TrackColumns) -> FlightInfo | None:
+        """
+        Sets the arrival airport of a flight to the airport nearest to the last point of its track.
 
-        flight_data = self._call_api(self._api.get_track_by_aircraft, flight_info.icao24, flight_info.last_seen)
+        :param flight_info: flight without arrival airport
+        :param track: flight track columns
+        :return: flight with arrival airport or None if the track doesn't end close enough to any airport
+        """
+        if not len(track) or np.isnan(track.latitudes[-1]) or np.isnan(track.longitudes[-1]):
+            return None
 
-        if not flight_data:
-            logger.info("No flight data found", icao24=flight_info.icao24)
+        last_location = Location(float(track.latitudes[-1]), float(track.longitudes[-1]))
+        airport = self._airport_data.nearest_airport(last_location, self.THRESHOLD_DISTANCE_KM)
+        if airport is None:
+            logger.info("Could not infer arrival airport", icao24=flight_info.icao24, location=last_location)
             return None
 
-        arrival_airport_location = self._airport_data.get_location(flight_info.arrival_airport)
-        path = flight_data.path  # list of tuples (time, latitude, longitude, altitude, heading, on_ground)
-        distances_to_destination = [
-            Location(datapoint[1], datapoint[2]).distance_to(arrival_airport_location)
-            for datapoint in path
-        ]
-        arrival_time: int | None = None
-        # Calculate arrival time; assume that arrival is when the plane is less than threshold km from the destination
-        for i, datapoint in enumerate(flight_data.path):
-            if distances_to_destination[i] < self.THRESHOLD_DISTANCE_KM:
-                arrival_time = datapoint[0]
-                distances_to_destination = distances_to_destination[:i + 1]
-                path = path[:i + 1]
-                break
-
-        if arrival_time is None and not ignore_min_distance:
-            logger.info(f"No data points further than {self.THRESHOLD_DISTANCE_KM} km of destination", icao24=flight_info.icao24)
+        logger.debug("Inferred arrival airport", icao24=flight_info.icao24, arrival_airport=airport)
+        return replace(flight_info, arrival_airport=airport)
+
+    def _fetch_track(self, key: tuple[str, int]) -> TrackColumns | None:
+        """
+        Fetches a track from OpenSky API and stores it in the track cache.
+
+        The fact that there is no track is stored only if the client confirms it, i.e. raises errors instead of
+        returning None for them, like OpenSkyClient does.
+        """
+        flight_data = self._call_api(self._api.get_track_by_aircraft, *key)
+        track = TrackColumns.from_path(flight_data.path) if flight_data else None
+        if self.track_cache is not None and (track is not None or self.confirms_missing_data):
+            self.track_cache.put(key, track)
+        return track
+
+    def get_track(self, flight_info: FlightInfo) -> TrackColumns | None:
+        """
+        Get flight track from the track cache or from OpenSky API.
+
+        :param flight_info: flight to get the track of
+        :return: track columns or None if OpenSky has no track of the flight
+        """
+        key = (flight_info.icao24, flight_info.last_seen)
+        if self.track_cache is not None:
+            cached, track = self.track_cache.lookup(key)
+            if cached:
+                return track
+
+        # Threads asking for the same track at the same time share one API call
+        return self.track_requests.do(key, lambda: self._fetch_track(key))
+
+    def get_flight_datapoint_batch(self, flight_info: FlightInfo, ignore_min_distance: bool = False) -> FlightDatapointBatch | None:
+        """Get flight path from OpenSky API for a given flight and convert it to a columnar batch of datapoints"""
+        return self.build_flight_datapoint_batch(flight_info, self.get_track(flight_info), ignore_min_distance)
+
+    def build_flight_datapoint_batch(
+            self,
+            flight_info: FlightInfo,
+            track: TrackColumns | None,
+            ignore_min_distance: bool = False,
+    ) -> FlightDatapointBatch | None:
+        """
+        Convert a flight track to a columnar batch of datapoints, without calling the API.
+
+        :param flight_info: flight the track belongs to
+        :param track: track returned by get_track
+        :param ignore_min_distance: keep datapoints closer to the destination than THRESHOLD_DISTANCE_KM
+        """
+        if track is None:
+            logger.info("No flight data found", icao24=flight_info.icao24)
             return None
 
-        if ignore_min_distance:
-            arrival_time = None
+        if flight_info.arrival_airport is None:
+            flight_info = self._with_inferred_arrival_airport(flight_info, track)
+            if flight_info is None:
+                return None
 
-        flight_datapoints: list[FlightDatapoint] = []
-        last_saved_datapoint = 0
-        for i in range(1, len(path)):
-            if path[i][0] - path[last_saved_datapoint][0] < 60:  # Skip data points that are less than a minute apart
-                continue
+        batch = build_datapoint_batch(
+            track,
+            flight_info.arrival_airport,
+            self._airport_data.get_location(flight_info.arrival_airport),
+            self.THRESHOLD_DISTANCE_KM,
+            ignore_min_distance=ignore_min_distance,
+        )
+        if batch is None:
+            logger.info(f"No data points further than {self.THRESHOLD_DISTANCE_KM} km of destination", icao24=flight_info.icao24)
 
-            flight_datapoints.append(
-                FlightDatapoint(
-                    location=Location(latitude=path[i][1], longitude=path[i][2]),
-                    arrival_airport=flight_info.arrival_airport,
-                    arrival_airport_location=arrival_airport_location,
-                    timestamp=path[i][0],
-                    horizontal_speed=calculate_speed(
-                        distances_to_destination[i] - distances_to_destination[last_saved_datapoint],
-                        path[i][0] - path[last_saved_datapoint][0],
-                    ),
-                    altitude=path[i][3],
-                    vertical_speed=calculate_speed(
-                        (path[i][3] - path[last_saved_datapoint][3]) / 1000,  # Convert delta in meters to km
-                        path[i][0] - path[last_saved_datapoint][0],
-                    ),
-                    heading=path[i][4],
-                    distance_to_destination=distances_to_destination[i],
-                    arrival_time=arrival_time,
-                    time_to_arrival=arrival_time-path[i][0] if arrival_time is not None else None,
-                )
-            )
-            last_saved_datapoint = i
+        return batch
 
-        return flight_datapoints
+    def get_flight_datapoints(self, flight_info: FlightInfo, ignore_min_distance: bool = False) -> list[FlightDatapoint] | None:
+        """Get flight path from OpenSky API for a given flight and convert it to a list of FlightDatapoints"""
+        batch = self.get_flight_datapoint_batch(flight_info, ignore_min_distance)
+        if batch is None:
+            return None
+        return batch.to_datapoints()
@@ -1,17 +1,20 @@
 from dataclasses import dataclass
+from typing import Iterable
 
-from common.models import Location, BaseDataclass
+import numpy as np
+
+from common.models import Location, BaseDataclass, ColumnarBatch
 
 
 @dataclass
 class FlightInfo(BaseDataclass):
     icao24: str
     last_seen: int  # seconds since epoch
-    arrival_airport: str
+    arrival_airport: str | None  # None when it has to be inferred from the flight track
     call_sign: str | None
 
 
-@dataclass
+@dataclass(slots=True)
 class FlightDatapoint(BaseDataclass):
     location: Location
     arrival_airport: str
@@ -24,3 +27,40 @@ class FlightDatapoint(BaseDataclass):
     distance_to_destination: float  # km
     arrival_time: int  # seconds since epoch
     time_to_arrival: int  # seconds
+
+
+@dataclass
+class FlightDatapointBatch(ColumnarBatch):
+    """FlightDatapoints stored column by column, with columns named like the flattened FlightDatapoint attributes"""
+    COLUMN_DTYPES = {"arrival_airport": object, "timestamp": np.int64}
+    INTEGER_COLUMNS = frozenset({"arrival_time", "time_to_arrival"})
+
+    location_latitude: np.ndarray
+    location_longitude: np.ndarray
+    arrival_airport: np.ndarray
+    arrival_airport_location_latitude: np.ndarray
+    arrival_airport_location_longitude: np.ndarray
+    timestamp: np.ndarray
+    horizontal_speed: np.ndarray
+    altitude: np.ndarray
+    vertical_speed: np.ndarray
+    heading: np.ndarray
+    distance_to_destination: np.ndarray
+    arrival_time: np.ndarray
+    time_to_arrival: np.ndarray
+
+    @classmethod
+    def from_datapoints(cls, datapoints: Iterable[FlightDatapoint]) -> "FlightDatapointBatch":
+        return cls.from_rows(map(FlightDatapoint.values_getter(), datapoints))
+
+    def to_datapoints(self) -> list[FlightDatapoint]:
+        """Materializes the batch as FlightDatapoint objects"""
+        return [
+            FlightDatapoint(
+                Location(latitude, longitude),
+                arrival_airport,
+                Location(arrival_latitude, arrival_longitude),
+                *values,
+            )
+            for latitude, longitude, arrival_airport, arrival_latitude, arrival_longitude, *values in self.rows()
+        ]
@@ -0,0 +1,23 @@
+from typing import Any, Callable
+
+import requests
+from opensky_api import OpenSkyApi
+
+
+class OpenSkyClient(OpenSkyApi):
+    """
+    OpenSky API client raising requests.HTTPError for failed requests.
+
+    The original client returns None for every response other than 200, so rate limiting and server errors
+    look like missing data and are never retried. OpenSky answers 404 when it has no flights in an interval
+    or no track of an aircraft, which is still returned as None.
+    """
+    TIMEOUT_S = 15.0
+    confirms_missing_data = True  # None is returned only when OpenSky has no data, never for errors
+
+    def _get_json(self, url_post: str, callee: Callable, params: dict[str, Any] | None = None) -> Any | None:
+        response = requests.get(f"{self._api_url}{url_post}", auth=self._auth, params=params, timeout=self.TIMEOUT_S)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
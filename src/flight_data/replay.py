@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+from typing import Any
+import threading
+import time
+
+import structlog
+
+from common.recording import ReplayStats, ResponseArchive
+
+logger = structlog.get_logger()
+
+FLIGHTS = "opensky_flights"
+TRACK = "opensky_track"
+
+
+def _to_dict(response: Any) -> dict[str, Any]:
+    """Attributes of an OpenSky response object, which holds only JSON values"""
+    return dict(vars(response))
+
+
+class RecordingOpenSkyApi:
+    """
+    Passes calls through to an OpenSky API client and records successful responses in an archive.
+
+    Implements the methods of opensky_api.OpenSkyApi used by FlightData. Responses without data are not
+    recorded, since replaying a call that was not recorded returns None as well.
+    """
+
+    def __init__(self, api: Any, archive: ResponseArchive) -> None:
+        """
+        :param api: OpenSky API client
+        :param archive: archive the responses are recorded in
+        """
+        self._api = api
+        self._archive = archive
+        self.confirms_missing_data = getattr(api, "confirms_missing_data", False) is True
+
+    def get_flights_from_interval(self, begin: int, end: int) -> list[Any] | None:
+        flights = self._api.get_flights_from_interval(begin, end)
+        if flights is not None:
+            self._archive.put(FLIGHTS, (begin, end), [_to_dict(flight) for flight in flights])
+        return flights
+
+    def get_track_by_aircraft(self, icao24: str, t: int = 0) -> Any | None:
+        track = self._api.get_track_by_aircraft(icao24, t)
+        if track is not None:
+            self._archive.put(TRACK, (icao24, t), _to_dict(track))
+        return track
+
+
+class ReplayOpenSkyApi:
+    """
+    Serves OpenSky API responses recorded by RecordingOpenSkyApi, without network access or credentials.
+
+    Every call takes latency_s, like a call over the network. Calls that were not recorded return None,
+    as OpenSky does for intervals and aircraft it has no data for.
+    """
+
+    def __init__(self, archive: ResponseArchive, latency_s: float = 0.0) -> None:
+        self._archive = archive
+        self.latency_s = latency_s
+        self.stats = ReplayStats()
+        self._lock = threading.Lock()
+
+    def _replay(self, kind: str, key: tuple) -> Any:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        recorded, response = self._archive.lookup(kind, key)
+        with self._lock:
+            if recorded:
+                self.stats.hits += 1
+            else:
+                self.stats.misses += 1
+        if not recorded:
+            logger.warning("OpenSky call was not recorded", kind=kind, key=key)
+        return response
+
+    def get_flights_from_interval(self, begin: int, end: int) -> list[SimpleNamespace] | None:
+        flights = self._replay(FLIGHTS, (begin, end))
+        return None if flights is None else [SimpleNamespace(**flight) for flight in flights]
+
+    def get_track_by_aircraft(self, icao24: str, t: int = 0) -> SimpleNamespace | None:
+        track = self._replay(TRACK, (icao24, t))
+        return None if track is None else SimpleNamespace(**track)
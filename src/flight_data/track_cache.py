@@ -0,0 +1,230 @@
+from dataclasses import dataclass
+from typing import Callable
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import click
+import numpy as np
+import structlog
+
+import config
+from .track_engine import TrackColumns
+
+logger = structlog.get_logger()
+
+TrackKey = tuple[str, int]  # icao24, last seen in seconds since epoch
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    icao24 TEXT NOT NULL,
+    last_seen INTEGER NOT NULL,
+    points BLOB,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (icao24, last_seen)
+) WITHOUT ROWID
+"""
+
+
+@dataclass
+class TrackCacheStats:
+    hits: int = 0
+    negative_hits: int = 0  # flights known to have no track
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.negative_hits + self.misses
+        return (self.hits + self.negative_hits) / lookups if lookups else 0.0
+
+
+def _encode(track: TrackColumns) -> bytes:
+    """Packs track columns into one compressed float64 array; times in seconds are exact in float64"""
+    return zlib.compress(np.stack([column.astype(float) for column in track]).tobytes())
+
+
+def _decode(points: bytes) -> TrackColumns:
+    columns = np.frombuffer(zlib.decompress(points), dtype=float).reshape(len(TrackColumns._fields), -1)
+    return TrackColumns(columns[0].astype(np.int64), *(column.copy() for column in columns[1:]))
+
+
+class SQLiteTrackStore:
+    """
+    Durable cache of OpenSky flight tracks shared by all processes on a machine.
+
+    Tracks are stored per (icao24, last seen) as compressed NumPy columns in an SQLite database in WAL mode.
+    A flight the API returned no track for is stored as a negative entry, which expires after negative_ttl_s,
+    because OpenSky may still publish the track later. Entries older than max_age_s are evicted, and when
+    the stored tracks exceed max_bytes the least recently used ones are evicted first. The access time of an
+    entry is updated at most once per touch_interval_s, so lookups rarely have to wait for the writer lock.
+    """
+    EVICT_EVERY = 256  # number of writes between evictions
+
+    def __init__(
+            self,
+            path: str,
+            max_bytes: int | None = None,
+            max_age_s: float | None = None,
+            negative_ttl_s: float = 3600,
+            touch_interval_s: float = 300,
+            clock: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        :param path: path to the database file, created if missing
+        :param max_bytes: maximum total size of stored tracks, None for no limit
+        :param max_age_s: how long tracks are kept after they were fetched, None for forever
+        :param negative_ttl_s: how long a missing track is served from the cache
+        :param touch_interval_s: minimum time between updates of the access time of an entry
+        :param clock: wall clock in seconds since epoch
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.negative_ttl_s = negative_ttl_s
+        self.touch_interval_s = touch_interval_s
+        self.stats = TrackCacheStats()
+        self._clock = clock
+        self._local = threading.local()  # SQLite connections cannot be shared between threads
+        self._lock = threading.Lock()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(_SCHEMA)
+        self.evict()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _record(self, stat: str) -> None:
+        with self._lock:
+            setattr(self.stats, stat, getattr(self.stats, stat) + 1)
+
+    def _is_valid(self, points: bytes | None, fetched_at: float) -> bool:
+        age = self._clock() - fetched_at
+        if points is None:
+            return age < self.negative_ttl_s
+        return self.max_age_s is None or age < self.max_age_s
+
+    def lookup(self, key: TrackKey) -> tuple[bool, TrackColumns | None]:
+        """
+        Looks a track up.
+
+        :param key: icao24 and last seen of the flight
+        :return: whether the cache knows the flight, and its track or None if the flight has no track
+        """
+        row = self._connection().execute(
+            "SELECT points, fetched_at, accessed_at FROM tracks WHERE icao24 = ? AND last_seen = ?", key,
+        ).fetchone()
+        if row is None or not self._is_valid(*row[:2]):
+            self._record("misses")
+            return False, None
+
+        points, _, accessed_at = row
+        now = self._clock()
+        if now - accessed_at >= self.touch_interval_s:
+            with self._connection() as connection:
+                connection.execute(
+                    "UPDATE tracks SET accessed_at = ? WHERE icao24 = ? AND last_seen = ?", (now, *key),
+                )
+        if points is None:
+            self._record("negative_hits")
+            return True, None
+        self._record("hits")
+        return True, _decode(points)
+
+    def put(self, key: TrackKey, track: TrackColumns | None) -> None:
+        """
+        Stores a track.
+
+        :param key: icao24 and last seen of the flight
+        :param track: track of the flight or None if the API returned no track
+        """
+        points = _encode(track) if track is not None else None
+        now = self._clock()
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO tracks (icao24, last_seen, points, size, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, points, len(points) if points is not None else 0, now, now),
+            )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Removes expired entries, then the least recently used tracks until the cache fits into max_bytes.
+
+        :return: number of removed entries
+        """
+        now = self._clock()
+        with self._connection() as connection:
+            removed = connection.execute(
+                "DELETE FROM tracks WHERE points IS NULL AND fetched_at <= ?", (now - self.negative_ttl_s,),
+            ).rowcount
+            if self.max_age_s is not None:
+                removed += connection.execute(
+                    "DELETE FROM tracks WHERE fetched_at <= ?", (now - self.max_age_s,),
+                ).rowcount
+            if self.max_bytes is not None:
+                # Keep the most recently used tracks whose sizes add up to at most max_bytes
+                removed += connection.execute(
+                    "DELETE FROM tracks WHERE (icao24, last_seen) IN ("
+                    "  SELECT icao24, last_seen FROM ("
+                    "    SELECT icao24, last_seen,"
+                    "      SUM(size) OVER (ORDER BY accessed_at DESC, icao24, last_seen) AS total"
+                    "    FROM tracks"
+                    "  ) WHERE total > ?"
+                    ")",
+                    (self.max_bytes,),
+                ).rowcount
+        if removed:
+            logger.debug("evicted tracks", count=removed)
+        return removed
+
+    def size_bytes(self) -> int:
+        return self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM tracks").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def close(self) -> None:
+        """Closes the connection of the calling thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def default_track_store() -> SQLiteTrackStore:
+    return SQLiteTrackStore(
+        config.TRACK_CACHE_PATH,
+        max_bytes=config.TRACK_CACHE_MAX_BYTES,
+        max_age_s=config.TRACK_CACHE_MAX_AGE_S,
+        negative_ttl_s=config.TRACK_CACHE_NEGATIVE_TTL_S,
+    )
+
+
+@click.command()
+def main() -> None:
+    """Evicts expired and least recently used tracks from the track cache and prints its size"""
+    store = default_track_store()
+    logger.info("track cache", path=store.path, tracks=len(store), size_bytes=store.size_bytes())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from common.models import Location
+from common.utils import haversine_distance
+from .models import FlightDatapointBatch
+
+
+class TrackColumns(NamedTuple):
+    """OpenSky flight track converted to NumPy columns, one row per track point"""
+    times: np.ndarray  # seconds since epoch
+    latitudes: np.ndarray  # degrees
+    longitudes: np.ndarray  # degrees
+    altitudes: np.ndarray  # meters
+    headings: np.ndarray  # degrees
+
+    @classmethod
+    def from_path(cls, path: list[tuple]) -> "TrackColumns":
+        """
+        Converts an OpenSky track path to columns. Missing values become NaN.
+
+        :param path: list of tuples (time, latitude, longitude, altitude, heading, on_ground)
+        """
+        if not path:
+            return cls(np.empty(0, dtype=np.int64), *(np.empty(0) for _ in range(4)))
+
+        points = np.array(path, dtype=float).reshape(len(path), -1)
+        return cls(points[:, 0].astype(np.int64), points[:, 1], points[:, 2], points[:, 3], points[:, 4])
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def truncate(self, size: int) -> "TrackColumns":
+        return TrackColumns(*(column[:size] for column in self))
+
+
+def downsample_indices(times: np.ndarray, min_interval: int) -> np.ndarray:
+    """
+    Selects track points that are at least min_interval seconds after the previously selected one.
+
+    The first point is always selected. For time-ordered tracks every next point is found with a binary search,
+    so the cost depends on the number of selected points rather than on the length of the track.
+
+    :param times: times of track points in seconds
+    :param min_interval: minimum time between two selected points in seconds, all points are selected if it is
+        not positive
+    :return: indices of selected points
+    """
+    if len(times) == 0:
+        return np.empty(0, dtype=np.intp)
+    if min_interval <= 0:
+        return np.arange(len(times))
+
+    indices = [0]
+    if np.all(times[1:] >= times[:-1]):
+        while (i := int(np.searchsorted(times, times[indices[-1]] + min_interval))) < len(times):
+            indices.append(i)
+    else:
+        for i in range(1, len(times)):
+            if times[i] - times[indices[-1]] >= min_interval:
+                indices.append(i)
+
+    return np.array(indices, dtype=np.intp)
+
+
+def _speed(distances: np.ndarray, times: np.ndarray) -> np.ndarray:
+    """Vectorized calculate_speed; speed in km/h from distances in km and times in seconds, NaN when time is 0"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(times != 0, np.abs(distances / (times / 3600)), np.nan)
+
+
+def build_datapoint_batch(
+        track: TrackColumns,
+        arrival_airport: str,
+        arrival_airport_location: Location,
+        threshold_distance_km: float,
+        min_interval: int = 60,
+        ignore_min_distance: bool = False,
+) -> FlightDatapointBatch | None:
+    """
+    Converts a flight track to a batch of datapoints using array operations.
+
+    The track is cut at the first point closer than threshold_distance_km to the destination, which is considered
+    the arrival, and downsampled to points at least min_interval seconds apart. Speeds are computed between
+    consecutive kept points.
+
+    :param track: flight track columns
+    :param arrival_airport: ICAO code of the arrival airport
+    :param arrival_airport_location: location of the arrival airport
+    :param threshold_distance_km: distance from the destination at which the plane is considered arrived
+    :param min_interval: minimum time between two datapoints in seconds
+    :param ignore_min_distance: build datapoints even if the plane never got close to the destination;
+        arrival time is unknown then
+    :return: batch of datapoints or None if the plane has not arrived and ignore_min_distance is not set
+    """
+    distances = haversine_distance(
+        track.latitudes, track.longitudes, arrival_airport_location.latitude, arrival_airport_location.longitude,
+    )
+
+    arrival_time: int | None = None
+    arrived = np.flatnonzero(distances < threshold_distance_km)
+    if arrived.size:
+        arrival_index = int(arrived[0])
+        arrival_time = int(track.times[arrival_index])
+        track = track.truncate(arrival_index + 1)
+        distances = distances[:arrival_index + 1]
+
+    if arrival_time is None and not ignore_min_distance:
+        return None
+
+    if ignore_min_distance:
+        arrival_time = None
+
+    kept = downsample_indices(track.times, min_interval)
+    previous, current = kept[:-1], kept[1:]  # the first point only serves as reference for speeds
+    time_deltas = track.times[current] - track.times[previous]
+    size = len(current)
+    timestamps = track.times[current]
+    arrival_times = np.full(size, np.nan if arrival_time is None else arrival_time, dtype=float)
+
+    return FlightDatapointBatch(
+        location_latitude=track.latitudes[current],
+        location_longitude=track.longitudes[current],
+        arrival_airport=np.full(size, arrival_airport, dtype=object),
+        arrival_airport_location_latitude=np.full(size, arrival_airport_location.latitude, dtype=float),
+        arrival_airport_location_longitude=np.full(size, arrival_airport_location.longitude, dtype=float),
+        timestamp=timestamps,
+        horizontal_speed=_speed(distances[current] - distances[previous], time_deltas),
+        altitude=track.altitudes[current],
+        vertical_speed=_speed((track.altitudes[current] - track.altitudes[previous]) / 1000, time_deltas),
+        heading=track.headings[current],
+        distance_to_destination=distances[current],
+        arrival_time=arrival_times,
+        time_to_arrival=arrival_times - timestamps,
+    )
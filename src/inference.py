@@ -7,9 +7,13 @@ from model.scaler import Scaler
 from model.model import FlightNN
 from flight_data.models import FlightInfo
 from flight_data.airports_data import AirportData
-from data_collection.models import CombinedDatapoint
+from data_collection.models import CombinedDatapointBatch
 from flight_data.flight_data import FlightData
+from flight_data.track_cache import default_track_store
 from data_collection.flight_collector import FlightCollector
+from weather_data.cache import WeatherCache
+from weather_data.store import SQLiteWeatherStore
+from weather_data.weather_data import WeatherDataProcessor
 import numpy as np
 from gcp.load_file import GCSLoader
 
@@ -54,25 +58,33 @@ def inference(X: np.ndarray) -> np.ndarray:
     return scaler_y.inverse_transform(y_pred.detach().numpy().reshape(-1, 1)).ravel()
 
 
-def get_data(flights: list[FlightInfo]) -> list[CombinedDatapoint]:
-    airports = AirportData(config.AIRPORTS_DATA)
-    flight_data = FlightData(airports)
-    collector = FlightCollector(flight_data)
-
-    data: list[CombinedDatapoint] = []
-    for flight in flights:
-        datapoints = collector.flight_data.get_flight_datapoints(flight, ignore_min_distance=True)
-        if not datapoints:
+def get_data(flights: list[FlightInfo]) -> CombinedDatapointBatch:
+    """Builds the latest combined datapoint of every flight"""
+    airports = AirportData.load(config.AIRPORTS_DATA)
+    # Tracks fetched by the collector or by earlier inference batches are read from the local track cache
+    flight_data = FlightData(airports, track_cache=default_track_store())
+    # Weather days are shared through the local store with the collector and earlier inference batches
+    weather_data = WeatherDataProcessor(WeatherCache(persistent=SQLiteWeatherStore(config.WEATHER_STORE_PATH)))
+    collector = FlightCollector(flight_data, weather_data=weather_data)
+
+    # Batches often contain the same flight several times, its data is built once and reused
+    keys = [(flight.icao24, flight.last_seen, flight.arrival_airport) for flight in flights]
+    data: dict[tuple, CombinedDatapointBatch] = {}
+    for key, flight in zip(keys, flights):
+        if key in data:
+            continue
+        batch = collector.flight_data.get_flight_datapoint_batch(flight, ignore_min_distance=True)
+        if not batch:
             raise ValueError(f"Missing datapoints for flight {flight.icao24}")
 
-        combined_datapoints = collector.get_weather_data_for_flight_datapoints(datapoints)
-        data.append(combined_datapoints[-1])
+        # Only the latest datapoint is used for prediction, so it is the only one joined with weather
+        data[key] = collector.get_weather_data_for_flight_batch(batch.take([-1]))
 
-    return data
+    return CombinedDatapointBatch.concat([data[key] for key in keys])
 
 
-def get_features(data: list[CombinedDatapoint]) -> np.ndarray:
-    return np.array([[datapoint.flight.distance_to_destination, datapoint.flight.horizontal_speed] for datapoint in data])
+def get_features(data: CombinedDatapointBatch) -> np.ndarray:
+    return data.to_numpy(["flight_distance_to_destination", "flight_horizontal_speed"])
 
 
 if __name__ == "__main__":
@@ -50,7 +50,7 @@ kafka_producer = KafkaProducer(
     bootstrap_servers=kafka_broker,
     value_serializer=lambda v: json.dumps(v).encode("utf-8")
 )
-airports = AirportData(config.AIRPORTS_DATA)
+airports = AirportData.load(config.AIRPORTS_DATA)
 
 # Apply inference function
 def predict_batch(df, batch_id):
@@ -84,12 +84,8 @@ def predict_batch(df, batch_id):
         y_pred = list(map(float, inference(X)))
         logger.info("Predictions: %s", y_pred)
 
-        for datapoint, y, flight_info in zip(data, y_pred, flights):
+        for d, y, flight_info in zip(data.to_records(), y_pred, flights):
             row = df.filter(df.icao24 == flight_info.icao24).first()
-            d = {
-                key: value
-                for key, value in zip(datapoint.get_attribute_names(), datapoint.get_values())
-            }
             d["time_to_arrival"] = y
             d["session_id"] = row["session_id"]
             d["host_id"] = row["host_id"]
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Protocol
+import threading
+
+from .hourly import HourlyWeather
+
+CacheKey = tuple[str, str]  # (weather grid cell id, date in the format 'YYYY-MM-DD')
+
+
+class PersistentWeatherCache(Protocol):
+    """Persistent tier of WeatherCache, see weather_data.store.SQLiteWeatherStore"""
+
+    def __contains__(self, key: CacheKey) -> bool: ...
+
+    def get(self, key: CacheKey) -> Any | None: ...
+
+    def put(self, key: CacheKey, value: Any) -> None: ...
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0  # served from memory
+    disk_hits: int = 0  # served from the persistent tier
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / lookups if lookups else 0.0
+
+
+class WeatherCache:
+    """
+    Bounded in-memory LRU cache of weather days, optionally backed by a persistent tier.
+
+    Days are put as raw hourly measurements, which the persistent tier stores, and kept in memory parsed,
+    so a day is parsed once when it is put or loaded from the persistent tier instead of on every lookup.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = 1024,
+            persistent: PersistentWeatherCache | None = None,
+            parse: Callable[[Any], Any] | None = HourlyWeather.from_hourly_data,
+    ) -> None:
+        """
+        :param max_entries: maximum number of days kept in memory
+        :param persistent: persistent tier the raw values are stored in
+        :param parse: converts a raw value to the value kept in memory and returned by get, None to keep it as is
+        """
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self.parse = parse
+        self.stats = CacheStats()
+        self._entries: OrderedDict[CacheKey, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: CacheKey) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def is_cached(self, key: CacheKey) -> bool:
+        """Checks whether the key is cached in memory or in the persistent tier, without loading or counting it"""
+        return key in self or (self.persistent is not None and key in self.persistent)
+
+    def peek(self, key: CacheKey) -> Any | None:
+        """Looks a key up in memory in a single step, without updating its recency or counting the lookup"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def get(self, key: CacheKey) -> Any | None:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return self._entries[key]
+
+        raw = self.persistent.get(key) if self.persistent is not None else None
+        value = self._parse(raw) if raw is not None else None
+        with self._lock:
+            if value is None:
+                self.stats.misses += 1
+                return None
+            self.stats.disk_hits += 1
+            self._store(key, value)
+        return value
+
+    def put(self, key: CacheKey, raw: Any) -> Any:
+        """
+        Caches a raw value.
+
+        :return: the value kept in memory, i.e. the parsed raw value
+        """
+        value = self._parse(raw)
+        with self._lock:
+            self._store(key, value)
+        if self.persistent is not None:
+            self.persistent.put(key, raw)
+        return value
+
+    def _parse(self, raw: Any) -> Any:
+        return self.parse(raw) if self.parse is not None else raw
+
+    def _store(self, key: CacheKey, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,47 @@
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+from common.models import Location
+
+
+@dataclass(frozen=True)
+class WeatherGrid:
+    """
+    Regular latitude/longitude grid that weather lookups are snapped to.
+
+    Weather history has a resolution of a few kilometers, so every point is replaced by the nearest grid node
+    and all points in the same cell share one request and one cache entry.
+    """
+    resolution_deg: float = 0.1
+
+    def __post_init__(self) -> None:
+        if not (0 < self.resolution_deg <= 10):
+            raise ValueError(f"Grid resolution must be between 0 and 10 degrees, got {self.resolution_deg}")
+
+    def cell_indices(self, latitudes: ArrayLike, longitudes: ArrayLike) -> tuple[np.ndarray, np.ndarray]:
+        """Vectorized indices of the grid nodes nearest to given points"""
+        return (
+            np.rint(np.asarray(latitudes, dtype=float) / self.resolution_deg).astype(np.int64),
+            np.rint(np.asarray(longitudes, dtype=float) / self.resolution_deg).astype(np.int64),
+        )
+
+    def cell_id_from_indices(self, latitude_index: int, longitude_index: int) -> str:
+        return f"{self.resolution_deg:g}_{latitude_index}_{longitude_index}"
+
+    def cell_id(self, location: Location) -> str:
+        """Identifier of the cell containing a location, safe to use as a file name"""
+        latitude_index, longitude_index = self.cell_indices(location.latitude, location.longitude)
+        return self.cell_id_from_indices(int(latitude_index), int(longitude_index))
+
+    def cell_center(self, latitude_index: int, longitude_index: int) -> Location:
+        return Location(
+            latitude=round(float(np.clip(latitude_index * self.resolution_deg, -90, 90)), 6),
+            longitude=round(float(np.clip(longitude_index * self.resolution_deg, -180, 180)), 6),
+        )
+
+    def snap(self, location: Location) -> Location:
+        """Moves a location to the nearest grid node"""
+        latitude_index, longitude_index = self.cell_indices(location.latitude, location.longitude)
+        return self.cell_center(int(latitude_index), int(longitude_index))
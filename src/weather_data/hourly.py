@@ -0,0 +1,145 @@
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+from .models import WeatherDatapoint, WeatherDatapointBatch
+
+# WeatherDatapoint attribute interpolated linearly between hours -> key of the hourly API measurement
+INTERPOLATED_FIELDS = {
+    "temperature_celsius": "temp_c",
+    "feels_like_celsius": "feelslike_c",
+    "wind_speed_kph": "wind_kph",
+    "humidity_percent": "humidity",
+    "precipitation_mm": "precip_mm",
+    "visibility_km": "vis_km",
+    "pressure_mb": "pressure_mb",
+    "uv_index": "uv",
+}
+
+
+def _round(values: np.ndarray) -> np.ndarray:
+    """
+    Rounds values to 2 decimal places exactly like the built-in round used by interpolate_value.
+
+    np.round scales by 100 before rounding, so it can round differently only where the scaled value is within
+    floating point error of a half; just those values are rounded again with the built-in round.
+    """
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6).tolist():
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
+
+
+class HourlyWeather:
+    """
+    One day of hourly weather measurements stored as arrays, interpolated to minute resolution on demand.
+
+    The minutes between two consecutive hours are interpolated linearly from the earlier hour and rounded to
+    2 decimal places; the condition text of the earlier hour is kept, because text cannot be interpolated.
+    The last hour of the day only closes the preceding interval, so the day covers the minutes from the first
+    hour up to one minute before the last hour.
+    """
+    DATETIME_FORMAT = '%Y-%m-%d %H:%M'
+
+    def __init__(self, times: np.ndarray, values: dict[str, np.ndarray], conditions: np.ndarray) -> None:
+        """
+        :param times: timestamps of the hours in seconds since epoch, in increasing order
+        :param values: measurements for every attribute in INTERPOLATED_FIELDS, one per hour
+        :param conditions: condition text for every hour
+        """
+        self.times = times
+        self.values = values
+        self.conditions = conditions
+        # Number of interpolated minutes following each hour except the last one
+        self._minutes = np.diff(times) // 60
+
+    @classmethod
+    def from_hourly_data(cls, hourly_data: list[dict[str, Any]]) -> "HourlyWeather":
+        """
+        Creates the day from hourly measurements as returned by the weather API.
+
+        :param hourly_data: List of hourly weather measurements
+        """
+        times = np.array(
+            [int(datetime.strptime(hour['time'], cls.DATETIME_FORMAT).timestamp()) for hour in hourly_data],
+            dtype=np.int64,
+        )
+        values = {
+            name: np.array([hour[key] for hour in hourly_data], dtype=float)
+            for name, key in INTERPOLATED_FIELDS.items()
+        }
+        conditions = np.array([hour['condition']['text'] for hour in hourly_data], dtype=object)
+        return cls(times, values, conditions)
+
+    def __len__(self) -> int:
+        """Number of minutes the day covers"""
+        return int(self._minutes.sum()) if len(self._minutes) else 0
+
+    def minute_timestamps(self) -> np.ndarray:
+        """Timestamps of all minutes the day covers"""
+        return np.concatenate([
+            start + 60 * np.arange(minutes, dtype=np.int64)
+            for start, minutes in zip(self.times[:-1].tolist(), self._minutes.tolist())
+        ] or [np.empty(0, dtype=np.int64)])
+
+    def _closest_minutes(self, timestamps: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the minute closest to every timestamp, preferring the earlier minute on ties.
+
+        :return: index of the hour the minute follows and the offset of the minute in that hour
+        """
+        last_hour = len(self.times) - 2
+        hours = np.clip(np.searchsorted(self.times, timestamps, side='right') - 1, 0, last_hour)
+        offsets = np.ceil((timestamps - self.times[hours]) / 60 - 0.5).astype(np.int64)
+
+        # A timestamp just before the next hour is closest to its first minute
+        overflow = (offsets >= self._minutes[hours]) & (hours < last_hour)
+        hours = np.where(overflow, hours + 1, hours)
+        offsets = np.where(overflow, 0, offsets)
+        return hours, np.clip(offsets, 0, self._minutes[hours] - 1)
+
+    def _interpolate(self, hours: np.ndarray, offsets: np.ndarray) -> WeatherDatapointBatch:
+        progress = offsets / self._minutes[hours]
+        columns = {
+            name: _round(values[hours] + progress * (values[hours + 1] - values[hours]))
+            for name, values in self.values.items()
+        }
+        return WeatherDatapointBatch(
+            timestamp=self.times[hours] + 60 * offsets,
+            condition_text=self.conditions[hours],
+            **columns,
+        )
+
+    def at(self, timestamps: ArrayLike) -> WeatherDatapointBatch:
+        """
+        Interpolates the weather at the minutes closest to given timestamps.
+
+        :param timestamps: timestamps in seconds since epoch
+        :return: one weather data point per timestamp, with the timestamp of the minute it was interpolated for
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64).reshape(-1)
+        if len(self) == 0:
+            raise ValueError("Weather day has no interpolated minutes")
+        return self._interpolate(*self._closest_minutes(timestamps))
+
+    def datapoint_at(self, timestamp: int) -> WeatherDatapoint | None:
+        """
+        Interpolates the weather at the minute closest to a timestamp.
+
+        :param timestamp: timestamp in seconds since epoch
+        :return: weather data point or None if the day has less than two hourly measurements
+        """
+        if len(self) == 0:
+            return None
+        return self.at([timestamp]).to_datapoints()[0]
+
+    def to_batch(self) -> WeatherDatapointBatch:
+        """Interpolates every minute of the day"""
+        if len(self) == 0:
+            return WeatherDatapointBatch.from_rows([])
+        hours = np.repeat(np.arange(len(self._minutes)), self._minutes)
+        offsets = np.arange(len(hours)) - np.repeat(np.cumsum(self._minutes) - self._minutes, self._minutes)
+        return self._interpolate(hours, offsets)
@@ -1,9 +1,12 @@
 from dataclasses import dataclass
+from typing import Iterable
 
-from common.models import BaseDataclass
+import numpy as np
 
+from common.models import BaseDataclass, ColumnarBatch
 
-@dataclass
+
+@dataclass(slots=True)
 class WeatherDatapoint(BaseDataclass):
     """Represents weather conditions at a specific point in time"""
     timestamp: int  # seconds since epoch
@@ -32,3 +35,28 @@ class WeatherDatapoint(BaseDataclass):
             pressure_mb=0.0,
             uv_index=0.0,
         )
+
+
+@dataclass
+class WeatherDatapointBatch(ColumnarBatch):
+    """WeatherDatapoints stored column by column, with columns named like WeatherDatapoint attributes"""
+    COLUMN_DTYPES = {"timestamp": np.int64, "condition_text": object}
+
+    timestamp: np.ndarray
+    temperature_celsius: np.ndarray
+    feels_like_celsius: np.ndarray
+    condition_text: np.ndarray
+    wind_speed_kph: np.ndarray
+    humidity_percent: np.ndarray
+    precipitation_mm: np.ndarray
+    visibility_km: np.ndarray
+    pressure_mb: np.ndarray
+    uv_index: np.ndarray
+
+    @classmethod
+    def from_datapoints(cls, datapoints: Iterable[WeatherDatapoint]) -> "WeatherDatapointBatch":
+        return cls.from_rows(map(WeatherDatapoint.values_getter(), datapoints))
+
+    def to_datapoints(self) -> list[WeatherDatapoint]:
+        """Materializes the batch as WeatherDatapoint objects"""
+        return [WeatherDatapoint(*row) for row in self.rows()]
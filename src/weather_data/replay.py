@@ -0,0 +1,81 @@
+from typing import Any, Sequence
+import math
+import threading
+import time
+
+import structlog
+
+from config import WEATHER_MAX_CONCURRENCY
+from common.models import Location
+from common.recording import ReplayStats, ResponseArchive
+from .weather_client import WeatherFetcher
+
+logger = structlog.get_logger()
+
+KIND = "weather_history"
+
+
+def _key(location: Location, date: str) -> tuple[str, str]:
+    return str(location), date
+
+
+class RecordingWeatherClient:
+    """Weather client passing requests through to another client and recording successful responses"""
+
+    def __init__(self, client: WeatherFetcher, archive: ResponseArchive) -> None:
+        self._client = client
+        self._archive = archive
+
+    def _record(self, location: Location, date: str, response: dict[str, Any] | None) -> dict[str, Any] | None:
+        if response is not None:
+            self._archive.put(KIND, _key(location, date), response)
+        return response
+
+    def fetch_weather_data(self, location: Location, date: str) -> dict[str, Any] | None:
+        return self._record(location, date, self._client.fetch_weather_data(location, date))
+
+    def fetch_many(self, requests: Sequence[tuple[Location, str]]) -> list[dict[str, Any] | None]:
+        responses = self._client.fetch_many(requests)
+        return [self._record(location, date, response) for (location, date), response in zip(requests, responses)]
+
+
+class ReplayWeatherClient:
+    """
+    Weather client serving responses recorded by RecordingWeatherClient, without network access.
+
+    Every request takes latency_s, and like the real client at most max_concurrency requests of fetch_many
+    run at once. Requests that were not recorded fail like a failed API call.
+    """
+
+    def __init__(
+            self,
+            archive: ResponseArchive,
+            latency_s: float = 0.0,
+            max_concurrency: int = WEATHER_MAX_CONCURRENCY,
+    ) -> None:
+        self._archive = archive
+        self.latency_s = latency_s
+        self.max_concurrency = max_concurrency
+        self.stats = ReplayStats()
+        self._lock = threading.Lock()
+
+    def _replay(self, location: Location, date: str) -> dict[str, Any] | None:
+        recorded, response = self._archive.lookup(KIND, _key(location, date))
+        with self._lock:
+            if recorded:
+                self.stats.hits += 1
+            else:
+                self.stats.misses += 1
+        if not recorded:
+            logger.warning("weather request was not recorded", location=location, date=date)
+        return response
+
+    def fetch_weather_data(self, location: Location, date: str) -> dict[str, Any] | None:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self._replay(location, date)
+
+    def fetch_many(self, requests: Sequence[tuple[Location, str]]) -> list[dict[str, Any] | None]:
+        if self.latency_s and requests:
+            time.sleep(self.latency_s * math.ceil(len(requests) / self.max_concurrency))
+        return [self._replay(location, date) for location, date in requests]
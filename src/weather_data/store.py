@@ -0,0 +1,135 @@
+from datetime import date as Date, datetime, timedelta, timezone
+from typing import Any, Callable, Iterator
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import click
+import structlog
+
+import config
+from .cache import CacheKey
+
+logger = structlog.get_logger()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS weather_days (
+    cell TEXT NOT NULL,
+    date TEXT NOT NULL,
+    hourly TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (cell, date)
+) WITHOUT ROWID
+"""
+
+
+class SQLiteWeatherStore:
+    """
+    Durable weather store shared by all processes on a machine, usable as the persistent tier of WeatherCache.
+
+    Hourly measurements are stored as JSON per (weather grid cell, date) in an SQLite database in WAL mode,
+    so readers never block and every write is atomic, also between processes. Days that ended more than
+    a day ago in UTC no longer change, so they are written once and kept forever; more recent days may still be
+    completed by the API and expire after recent_ttl_s.
+    """
+
+    def __init__(self, path: str, recent_ttl_s: float = 3600, clock: Callable[[], float] = time.time) -> None:
+        """
+        :param path: path to the database file, created if missing
+        :param recent_ttl_s: how long days that may still change are served from the store
+        :param clock: wall clock in seconds since epoch
+        """
+        self.path = path
+        self.recent_ttl_s = recent_ttl_s
+        self._clock = clock
+        self._local = threading.local()  # SQLite connections cannot be shared between threads
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def is_final(self, date: str) -> bool:
+        """Checks whether weather of a day can no longer change"""
+        today = datetime.fromtimestamp(self._clock(), timezone.utc).date()
+        return Date.fromisoformat(date) < today - timedelta(days=1)
+
+    def _is_valid(self, date: str, fetched_at: float) -> bool:
+        return self.is_final(date) or self._clock() - fetched_at < self.recent_ttl_s
+
+    def __contains__(self, key: CacheKey) -> bool:
+        row = self._connection().execute(
+            "SELECT fetched_at FROM weather_days WHERE cell = ? AND date = ?", key,
+        ).fetchone()
+        return row is not None and self._is_valid(key[1], row[0])
+
+    def get(self, key: CacheKey) -> Any | None:
+        row = self._connection().execute(
+            "SELECT hourly, fetched_at FROM weather_days WHERE cell = ? AND date = ?", key,
+        ).fetchone()
+        if row is None or not self._is_valid(key[1], row[1]):
+            return None
+        return json.loads(row[0])
+
+    def put(self, key: CacheKey, value: Any) -> None:
+        """Stores a day; a final day that is already stored is kept as it is"""
+        verb = "INSERT OR IGNORE" if self.is_final(key[1]) else "INSERT OR REPLACE"
+        with self._connection() as connection:
+            connection.execute(
+                f"{verb} INTO weather_days (cell, date, hourly, fetched_at) VALUES (?, ?, ?, ?)",
+                (*key, json.dumps(value), self._clock()),
+            )
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM weather_days").fetchone()[0]
+
+    def iter_days(self) -> Iterator[tuple[str, str, Any]]:
+        """Iterates over all stored days as (cell, date, hourly measurements), ordered by date and cell"""
+        cursor = self._connection().execute("SELECT cell, date, hourly FROM weather_days ORDER BY date, cell")
+        for cell, date, hourly in cursor:
+            yield cell, date, json.loads(hourly)
+
+    def export_jsonl(self, path: str) -> int:
+        """
+        Exports all stored days to a JSON lines file, one day per line.
+
+        :param path: path of the file to create
+        :return: number of exported days
+        """
+        count = 0
+        with open(path, "w") as file:
+            for cell, date, hourly in self.iter_days():
+                file.write(json.dumps({"cell": cell, "date": date, "hour": hourly}) + "\n")
+                count += 1
+        return count
+
+    def close(self) -> None:
+        """Closes the connection of the calling thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+@click.command()
+@click.argument('output')
+@click.option('--store', default=config.WEATHER_STORE_PATH, help='Path to the weather store database')
+def main(output: str, store: str) -> None:
+    """Exports all days of the weather store to a JSON lines file"""
+    count = SQLiteWeatherStore(store).export_jsonl(output)
+    logger.info("exported weather store", path=output, days=count)
+
+
+if __name__ == "__main__":
+    main()
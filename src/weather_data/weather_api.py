@@ -10,6 +10,12 @@ from common.models import Location
 logger = structlog.get_logger()
 
 
+def validate_date(date: str) -> None:
+    """Raises ValueError if the date is not in the format 'YYYY-MM-DD'"""
+    if not re.match(r'\d{4}-\d{2}-\d{2}', date):
+        raise ValueError("Invalid date format. Please use 'YYYY-MM-DD' format")
+
+
 def fetch_weather_data(location: Location, date: str) -> dict[str, Any] | None:
     """
     Fetches weather data from the API for a given location and date
@@ -19,8 +25,7 @@ def fetch_weather_data(location: Location, date: str) -> dict[str, Any] | None:
     :return: Weather data as dictionary if successful, None otherwise
     """
 
-    if not re.match(r'\d{4}-\d{2}-\d{2}', date):
-        raise ValueError("Invalid date format. Please use 'YYYY-MM-DD' format")
+    validate_date(date)
 
     params = {
         'key': WEATHER_API_KEY,
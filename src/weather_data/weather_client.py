@@ -0,0 +1,183 @@
+import asyncio
+import threading
+from typing import Any, Coroutine, Protocol, Sequence, TypeVar
+
+import aiohttp
+import structlog
+
+from config import (
+    WEATHER_API_KEY,
+    WEATHER_API_URL,
+    WEATHER_MAX_CONCURRENCY,
+    WEATHER_REQUESTS_PER_SECOND,
+    WEATHER_TIMEOUT_S,
+)
+from common.models import Location
+from common.throttling import RateLimiter, backoff_delay
+from .weather_api import validate_date
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+# Responses worth retrying: rate limiting and temporary server errors
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class WeatherFetcher(Protocol):
+    """Client fetching raw weather days, see WeatherClient and weather_data.replay"""
+
+    def fetch_weather_data(self, location: Location, date: str) -> dict[str, Any] | None: ...
+
+    def fetch_many(self, requests: Sequence[tuple[Location, str]]) -> list[dict[str, Any] | None]: ...
+
+
+class AsyncWeatherClient:
+    """
+    Asynchronous weather API client sharing one pooled HTTP session between all requests.
+
+    At most max_concurrency requests are in flight at once and the rate limiter spaces them out. Timeouts,
+    connection errors, rate limiting and server errors are retried with exponential backoff.
+    """
+
+    def __init__(
+            self,
+            api_url: str = WEATHER_API_URL,
+            api_key: str = WEATHER_API_KEY,
+            max_concurrency: int = WEATHER_MAX_CONCURRENCY,
+            rate_limiter: RateLimiter | None = None,
+            timeout_s: float = WEATHER_TIMEOUT_S,
+            max_retries: int = 3,
+            backoff_base_s: float = 0.5,
+            backoff_max_s: float = 10.0,
+    ) -> None:
+        self.api_url = api_url
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(
+            WEATHER_REQUESTS_PER_SECOND, burst=max_concurrency,
+        )
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: aiohttp.ClientSession | None = None
+
+    async def open(self) -> None:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout_s),
+            )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "AsyncWeatherClient":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        await self.close()
+
+    async def fetch(self, location: Location, date: str) -> dict[str, Any] | None:
+        """
+        Fetches weather data from the API for a given location and date
+
+        :param location: location of the weather data
+        :param date: Date in the format 'YYYY-MM-DD'
+        :return: Weather data as dictionary if successful, None otherwise
+        """
+        validate_date(date)
+        await self.open()
+        params = {
+            'key': self.api_key,
+            'q': str(location),
+            'dt': date
+        }
+
+        error = ""
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                delay = backoff_delay(attempt - 1, self.backoff_base_s, self.backoff_max_s)
+                logger.warning("retrying weather request", error=error, attempt=attempt, delay=round(delay, 2))
+                await asyncio.sleep(delay)
+
+            await self.rate_limiter.acquire_async()
+            try:
+                async with self._semaphore, self._session.get(self.api_url, params=params) as response:
+                    if response.status in RETRYABLE_STATUSES:
+                        error = f"HTTP {response.status}"
+                        continue
+                    if response.status >= 400:
+                        logger.error("Error fetching weather data", error=f"HTTP {response.status}")
+                        return None
+                    return await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+            except ValueError as e:
+                logger.error("Error fetching weather data", error=str(e))
+                return None
+
+        logger.error("Error fetching weather data", error=error, attempts=self.max_retries + 1)
+        return None
+
+    async def fetch_many(self, requests: Sequence[tuple[Location, str]]) -> list[dict[str, Any] | None]:
+        """
+        Fetches weather data for several locations and dates concurrently
+
+        :param requests: locations with dates in the format 'YYYY-MM-DD'
+        :return: Weather data for every request, in the order of the requests
+        """
+        return await asyncio.gather(*(self.fetch(location, date) for location, date in requests))
+
+
+class WeatherClient:
+    """
+    Synchronous facade of AsyncWeatherClient for code that does not run an event loop.
+
+    The client runs its own event loop in a background thread, so the pooled session is kept alive between
+    calls and the facade can be used from several threads at once.
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        """:param kwargs: arguments of AsyncWeatherClient"""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="weather-client", daemon=True)
+        self._thread.start()
+        self._client = self._run(self._create_client(kwargs))
+
+    @staticmethod
+    async def _create_client(kwargs: dict[str, Any]) -> AsyncWeatherClient:
+        """Creates the client inside the event loop, which its session and semaphore are bound to"""
+        client = AsyncWeatherClient(**kwargs)
+        await client.open()
+        return client
+
+    def _run(self, coroutine: Coroutine[Any, Any, T]) -> T:
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def fetch_weather_data(self, location: Location, date: str) -> dict[str, Any] | None:
+        """Same as weather_api.fetch_weather_data, but reusing pooled connections"""
+        return self._run(self._client.fetch(location, date))
+
+    def fetch_many(self, requests: Sequence[tuple[Location, str]]) -> list[dict[str, Any] | None]:
+        """See AsyncWeatherClient.fetch_many"""
+        return self._run(self._client.fetch_many(requests))
+
+    def close(self) -> None:
+        if not self._loop.is_running():
+            return
+        self._run(self._client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self) -> "WeatherClient":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
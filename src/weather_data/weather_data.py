@@ -1,124 +1,233 @@
-from typing import Any
-from datetime import datetime, timedelta
+from dataclasses import dataclass
+from typing import Any, Sequence
+import numpy as np
 import structlog
 
+from .cache import CacheKey, WeatherCache
+from common.coalescing import SingleFlight
+from .grid import WeatherGrid
+from .hourly import HourlyWeather
 from .weather_api import fetch_weather_data
+from .weather_client import WeatherFetcher
 from common.models import Location
-from .models import WeatherDatapoint
-from common.utils import interpolate_value, timestamp_to_date
-from flight_data.models import FlightDatapoint
+from .models import WeatherDatapoint, WeatherDatapointBatch
+from common.utils import timestamp_to_date
+from flight_data.models import FlightDatapoint, FlightDatapointBatch
 
 
 logger = structlog.get_logger()
 
 
+@dataclass
+class WeatherPrefetchPlan:
+    """Weather days needed by flights of a collection window"""
+    required: int  # distinct (cell, date) pairs
+    missing: list[tuple[Location, str]]  # cell centers and dates that are not cached
+
+    @property
+    def api_calls(self) -> int:
+        """Expected number of weather API calls"""
+        return len(self.missing)
+
+
 class WeatherDataProcessor:
     """Downloads and processes weather data for a given location and date"""
 
-    DATETIME_FORMAT = '%Y-%m-%d %H:%M'
+    def __init__(
+            self,
+            cache: WeatherCache | None = None,
+            grid: WeatherGrid | None = None,
+            client: WeatherFetcher | None = None,
+    ) -> None:
+        """
+        :param cache: cache of weather days, parsing hourly measurements to HourlyWeather
+        :param grid: grid weather lookups are snapped to
+        :param client: pooled client fetching several days concurrently, by default days are fetched one by one
+        """
+        self.cache = cache if cache is not None else WeatherCache()
+        self.grid = grid if grid is not None else WeatherGrid()
+        self.client = client
+        self.in_flight: SingleFlight[CacheKey, HourlyWeather | None] = SingleFlight()
+        self.requested_keys: set[CacheKey] = set()  # distinct (cell, date) pairs requested since last reset
+
+    def reset_request_stats(self) -> None:
+        self.requested_keys = set()
+
+    def request_stats(self) -> dict[str, int]:
+        """Number of distinct weather cells and cell days requested since last reset"""
+        keys = self.requested_keys.copy()
+        return {"cells": len({cell for cell, _ in keys}), "cell_days": len(keys)}
 
     def get_weather_datapoint_for_flight_datapoint(self, flight_datapoint: FlightDatapoint) -> WeatherDatapoint | None:
         """
         Retrieves weather data for a given flight data point.
 
         :param flight_datapoint: Flight data point to get weather data for
-        :return: weather data point if there is any closer than 1 minute, None otherwise
+        :return: weather data point interpolated for the closest minute, None if there is no weather data
         """
         date = timestamp_to_date(flight_datapoint.timestamp)
         weather_data = self.get_weather_data_for_day(flight_datapoint.location, date)
 
-        if not weather_data:
+        datapoint = weather_data.datapoint_at(flight_datapoint.timestamp) if weather_data is not None else None
+        if datapoint is None:
             logger.warning("No weather data found", location=flight_datapoint.location, date=date)
-            return None
+        return datapoint
 
-        lowest_time_delta: float | None = None
-        closest_data: WeatherDatapoint | None = None
-        for data in weather_data:
-            time_delta = abs(data.timestamp - flight_datapoint.timestamp)
-            if lowest_time_delta is None or time_delta < lowest_time_delta:
-                lowest_time_delta = time_delta
-                closest_data = data
+    def get_weather_batch_for_flight_batch(self, flight_batch: FlightDatapointBatch) -> WeatherDatapointBatch:
+        """
+        Retrieves weather data for all datapoints of a flight at once.
 
-        return closest_data
+        Datapoints are grouped by weather grid cell and UTC date, every group is fetched once and all its
+        timestamps are resolved to the closest minute in one vectorized pass, so flights crossing midnight or
+        several cells are handled in the same call. Datapoints without weather data get empty weather.
 
-    def get_weather_data_for_day(self, location: Location, date: str) -> list[WeatherDatapoint] | None:
+        :param flight_batch: flight datapoints to get weather data for
+        :return: weather data points aligned row by row with the flight batch
         """
-        Retrieves and processes weather data for a given location and date.
+        timestamps = flight_batch.timestamp
+        requests, group_of_row = self._group_by_cell_and_date(flight_batch)
+
+        empty = WeatherDatapoint.empty_from_timestamp(0)
+        weather = WeatherDatapointBatch(**{
+            name: np.full(len(timestamps), getattr(empty, name), dtype=WeatherDatapointBatch.COLUMN_DTYPES.get(name, float))
+            for name in WeatherDatapointBatch.column_names()
+        })
+        weather.timestamp[:] = timestamps
+        for group, ((location, date), weather_data) in enumerate(zip(requests, self.get_weather_data_for_days(requests))):
+            if weather_data is None or len(weather_data) == 0:
+                logger.warning("No weather data found", location=location, date=date)
+                continue
+
+            rows = np.flatnonzero(group_of_row == group)
+            for name, column in weather_data.at(timestamps[rows]).columns().items():
+                getattr(weather, name)[rows] = column
+
+        return weather
+
+    def _group_by_cell_and_date(self, flight_batch: FlightDatapointBatch) -> tuple[list[tuple[Location, str]], np.ndarray]:
+        """
+        Groups flight datapoints by weather grid cell and UTC date.
 
-        :param location: location of the weather data
-        :param date: Date in the format 'YYYY-MM-DD'
-        :return: List of weather data points if successful, None otherwise
+        :return: location of the cell center and date of every group, and the group of every datapoint
         """
-        raw_data = fetch_weather_data(location, date)
-        if (
-            not raw_data
-            or 'forecast' not in raw_data
-            or 'forecastday' not in raw_data['forecast']
-            or len(raw_data['forecast']['forecastday']) == 0
-            or "hour" not in raw_data['forecast']['forecastday'][0]
-        ):
-            logger.error("Invalid weather data response", location=location, date=date)
-            return None
-
-        hourly_data = raw_data['forecast']['forecastday'][0]['hour']
-        return self._interpolate_data(hourly_data)
-
-    def _interpolate_data(self, hourly_data: list[dict[str, Any]]) -> list[WeatherDatapoint]:
+        latitude_indices, longitude_indices = self.grid.cell_indices(
+            flight_batch.location_latitude, flight_batch.location_longitude,
+        )
+        days = flight_batch.timestamp.astype('datetime64[s]').astype('datetime64[D]')
+        groups, group_of_row = np.unique(
+            np.column_stack([latitude_indices, longitude_indices, days.astype(np.int64)]),
+            axis=0, return_inverse=True,
+        )
+        requests = [
+            (self.grid.cell_center(latitude_index, longitude_index), str(np.datetime64(day, 'D')))
+            for latitude_index, longitude_index, day in groups.tolist()
+        ]
+        return requests, group_of_row.reshape(-1)
+
+    def plan_prefetch(
+            self,
+            flight_batches: Sequence[FlightDatapointBatch],
+            planned: set[CacheKey] | None = None,
+    ) -> WeatherPrefetchPlan:
         """
-        Interpolates hourly weather data into minute-by-minute data
+        Computes the distinct weather days needed by flights and finds the ones that are not cached yet.
 
-        :param hourly_data: List of hourly weather measurements
-        :return: List of minute-by-minute weather data points
+        :param flight_batches: flight datapoints that will be joined with weather
+        :param planned: keys planned before, e.g. for earlier flights of the window, which are left out of the
+            plan; the keys of the plan are added to it
+        :return: plan with the weather days to fetch
         """
-        minute_data: list[WeatherDatapoint] = []
-
-        for i in range(len(hourly_data) - 1):
-            start_hour = hourly_data[i]
-            end_hour = hourly_data[i + 1]
-
-            minute_data.extend(
-                self._interpolate_hour_range(start_hour, end_hour)
-            )
-
-        return minute_data
+        planned = planned if planned is not None else set()
+        requests: dict[CacheKey, tuple[Location, str]] = {}
+        for flight_batch in flight_batches:
+            for location, date in self._group_by_cell_and_date(flight_batch)[0]:
+                key = (self.grid.cell_id(location), date)
+                if key not in planned:
+                    requests.setdefault(key, (location, date))
+        planned.update(requests)
+
+        missing = [request for key, request in requests.items() if not self.cache.is_cached(key)]
+        return WeatherPrefetchPlan(required=len(requests), missing=missing)
+
+    def prefetch(self, plan: WeatherPrefetchPlan) -> None:
+        """Fetches and caches the weather days missing according to the plan, concurrently if a client is set"""
+        self.get_weather_data_for_days(plan.missing)
+
+    def get_weather_data_for_day(self, location: Location, date: str) -> HourlyWeather | None:
+        """
+        Retrieves weather data for a given location and date.
 
-    def _interpolate_hour_range(
-            self,
-            start_hour: dict[str, Any],
-            end_hour: dict[str, Any]
-    ) -> list[WeatherDatapoint]:
+        :param location: location of the weather data
+        :param date: Date in the format 'YYYY-MM-DD'
+        :return: Weather of the day, interpolated to minutes on demand, if successful, None otherwise
         """
-        Interpolates weather data between two hours into minute-by-minute data
+        return self.get_weather_data_for_days([(location, date)])[0]
 
-        :param start_hour: Weather data at the start of the hour
-        :param end_hour: Weather data at the end of the hour
-        :return: List of interpolated weather data points for every minute
+    def get_weather_data_for_days(self, requests: Sequence[tuple[Location, str]]) -> list[HourlyWeather | None]:
         """
+        Retrieves weather data for several locations and dates, fetching the days missing in the cache together.
+
+        Locations are snapped to the weather grid first, so that all points in one cell share the request.
+        Days are parsed once, when they are cached, and the parsed days are shared by all lookups.
 
-        start_time = datetime.strptime(start_hour['time'], self.DATETIME_FORMAT)
-        end_time = datetime.strptime(end_hour['time'], self.DATETIME_FORMAT)
-        delta_minutes = (end_time - start_time).seconds // 60
-
-        interpolated_data: list[WeatherDatapoint] = []
-
-        for minute_offset in range(delta_minutes):
-            interpolated_time = start_time + timedelta(minutes=minute_offset)
-            progress = minute_offset / delta_minutes
-
-            datapoint = WeatherDatapoint(
-                timestamp=int(interpolated_time.timestamp()),
-                temperature_celsius=interpolate_value(start_hour['temp_c'], end_hour['temp_c'], progress),
-                feels_like_celsius=interpolate_value(start_hour['feelslike_c'], end_hour['feelslike_c'], progress),
-                # We cannot easily interpolate text data so we assume that the condition stays the same
-                condition_text=start_hour['condition']['text'],
-                wind_speed_kph=interpolate_value(start_hour['wind_kph'], end_hour['wind_kph'], progress),
-                humidity_percent=interpolate_value(start_hour['humidity'], end_hour['humidity'], progress),
-                precipitation_mm=interpolate_value(start_hour['precip_mm'], end_hour['precip_mm'], progress),
-                visibility_km=interpolate_value(start_hour['vis_km'], end_hour['vis_km'], progress),
-                pressure_mb=interpolate_value(start_hour['pressure_mb'], end_hour['pressure_mb'], progress),
-                uv_index=interpolate_value(start_hour['uv'], end_hour['uv'], progress)
-            )
-
-            interpolated_data.append(datapoint)
-
-        return interpolated_data
+        :param requests: locations with dates in the format 'YYYY-MM-DD'
+        :return: Weather of every requested day if successful, None otherwise, in the order of the requests
+        """
+        keys = [(self.grid.cell_id(location), date) for location, date in requests]
+        self.requested_keys.update(keys)
+        days = [self.cache.get(key) for key in keys]
+
+        # Days already being fetched by another thread are waited for instead of being requested again
+        claims = {i: self.in_flight.claim(keys[i]) for i, data in enumerate(days) if data is None}
+        led = [i for i, (_, leader) in claims.items() if leader]
+        try:
+            self._fetch_missing(requests, keys, led, days)
+        except BaseException as e:
+            for i in led:
+                if not claims[i][0].done():
+                    self.in_flight.fail(keys[i], e)
+            raise
+
+        for i, (future, leader) in claims.items():
+            if not leader:
+                days[i] = future.result()
+        return days
+
+    def _fetch_missing(
+            self,
+            requests: Sequence[tuple[Location, str]],
+            keys: list[CacheKey],
+            missing: list[int],
+            days: list[HourlyWeather | None],
+    ) -> None:
+        """Fetches the requests at given positions, caches valid responses and publishes them to waiting threads"""
+        # Another thread may have cached the day between the cache lookup and claiming it. A single lookup is
+        # used, as the day may also be evicted meanwhile, and then it has to be fetched and resolved only once.
+        for i in missing:
+            cached = self.cache.peek(keys[i])
+            if cached is not None:
+                days[i] = cached
+                self.in_flight.resolve(keys[i], cached)
+        missing = [i for i in missing if days[i] is None]
+
+        missing_requests = [(self.grid.snap(requests[i][0]), requests[i][1]) for i in missing]
+        for i, (location, date), raw_data in zip(missing, missing_requests, self._fetch(missing_requests)):
+            if (
+                not raw_data
+                or 'forecast' not in raw_data
+                or 'forecastday' not in raw_data['forecast']
+                or len(raw_data['forecast']['forecastday']) == 0
+                or "hour" not in raw_data['forecast']['forecastday'][0]
+            ):
+                logger.error("Invalid weather data response", location=location, date=date)
+            else:
+                days[i] = self.cache.put(keys[i], raw_data['forecast']['forecastday'][0]['hour'])
+            self.in_flight.resolve(keys[i], days[i])
+
+    def _fetch(self, requests: list[tuple[Location, str]]) -> list[dict[str, Any] | None]:
+        """Fetches raw weather data, concurrently if a client is set"""
+        if not requests:
+            return []
+        if self.client is not None:
+            return self.client.fetch_many(requests)
+        return [fetch_weather_data(location, date) for location, date in requests]
@@ -0,0 +1,64 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from common.coalescing import CoalescingStats, SingleFlight
+
+
+def test_sequential_requests_are_not_coalesced() -> None:
+    single_flight: SingleFlight[str, int] = SingleFlight()
+
+    assert single_flight.do("a", lambda: 1) == 1
+    assert single_flight.do("a", lambda: 2) == 2
+    assert single_flight.stats == CoalescingStats(calls=2, coalesced=0)
+
+
+def test_concurrent_requests_share_one_call() -> None:
+    single_flight: SingleFlight[str, int] = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def request() -> int:
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(single_flight.do, "a", request)
+        started.wait(5)
+        followers = [executor.submit(single_flight.do, "a", request) for _ in range(3)]
+        while single_flight.stats.coalesced < 3:
+            time.sleep(0.001)
+        release.set()
+
+        assert leader.result() == 42
+        assert [follower.result() for follower in followers] == [42, 42, 42]
+
+    assert calls == [1]
+    assert single_flight.stats == CoalescingStats(calls=1, coalesced=3)
+
+
+def test_exception_is_shared_with_waiting_callers() -> None:
+    single_flight: SingleFlight[str, int] = SingleFlight()
+    future, leader = single_flight.claim("a")
+    follower, follower_leader = single_flight.claim("a")
+
+    single_flight.fail("a", RuntimeError("failed"))
+
+    assert leader and not follower_leader
+    with pytest.raises(RuntimeError, match="failed"):
+        follower.result()
+    # The failed key is not in flight anymore, so the next caller retries
+    assert single_flight.claim("a")[1]
+
+
+def test_do_reraises_exception() -> None:
+    single_flight: SingleFlight[str, int] = SingleFlight()
+
+    with pytest.raises(ValueError):
+        single_flight.do("a", lambda: int("x"))
+    assert single_flight.do("a", lambda: 1) == 1
@@ -1,6 +1,8 @@
+from dataclasses import dataclass
+
 import pytest
 
-from common.models import Location
+from common.models import BaseDataclass, Location
 
 
 @pytest.mark.parametrize(
@@ -45,3 +47,40 @@ def test_distance_to_is_symmetric() -> None:
     assert initial_location.distance_to(Location(-40, 50)) == pytest.approx(distance, rel=1e-9)
     assert initial_location.distance_to(Location(40, -50)) == pytest.approx(distance, rel=1e-9)
     assert initial_location.distance_to(Location(-40, -50)) == pytest.approx(distance, rel=1e-9)
+
+
+@dataclass
+class Inner(BaseDataclass):
+    value: int
+    location: Location
+
+
+@dataclass
+class Outer(BaseDataclass):
+    name: str
+    inner: Inner
+    other: Location | None
+
+
+def test_flattened_attribute_names_and_values() -> None:
+    outer = Outer("test", Inner(1, Location(10, 20)), Location(30, 40))
+
+    assert outer.get_attribute_names() == [
+        "name", "inner_value", "inner_location_latitude", "inner_location_longitude", "other",
+    ]
+    assert outer.get_values() == ["test", 1, 10, 20, Location(30, 40)]
+    assert Outer.values_getter()(outer) == ("test", 1, 10, 20, Location(30, 40))
+
+
+def test_flattener_is_built_once_per_class() -> None:
+    assert Outer.attribute_names() is Outer.attribute_names()
+    assert Outer.values_getter() is Outer.values_getter()
+    assert Inner.attribute_names() == ("value", "location_latitude", "location_longitude")
+
+
+def test_location_has_no_instance_dict() -> None:
+    location = Location(10, 20)
+
+    assert not hasattr(location, "__dict__")
+    with pytest.raises(AttributeError):
+        location.altitude = 100
@@ -0,0 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from common.recording import ResponseArchive
+
+
+def test_round_trip(tmp_path) -> None:
+    archive = ResponseArchive(str(tmp_path / "archive.sqlite"))
+    assert archive.lookup("kind", ("abc", 1)) == (False, None)
+
+    archive.put("kind", ("abc", 1), {"path": [[1, 2.5, None]]})
+    archive.put("kind", ("abc", 2), None)
+
+    assert archive.lookup("kind", ("abc", 1)) == (True, {"path": [[1, 2.5, None]]})
+    assert archive.lookup("kind", ("abc", 2)) == (True, None)
+    assert archive.lookup("other", ("abc", 1)) == (False, None)
+    assert list(archive.keys("kind")) == [("abc", 1), ("abc", 2)]
+    assert len(archive) == 2
+
+
+def test_archive_is_shared_between_threads_and_instances(tmp_path) -> None:
+    path = str(tmp_path / "archive.sqlite")
+    archive = ResponseArchive(path)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda i: archive.put("kind", (i,), i), range(20)))
+
+    assert [ResponseArchive(path).lookup("kind", (i,)) for i in range(20)] == [(True, i) for i in range(20)]
@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+from unittest.mock import patch
+
+import pytest
+
+from common.throttling import (
+    AdaptiveRateLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    RateLimiter,
+    SharedRateLimiter,
+    backoff_delay,
+)
+from conftest import FakeClock
+
+
+def test_rate_limiter_allows_burst_then_spaces_calls() -> None:
+    clock = FakeClock()
+    limiter = RateLimiter(rate=2, burst=2, clock=clock)
+
+    assert [limiter.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+
+    clock.now = 3.0
+    assert limiter.reserve() == 0.0
+
+
+def test_rate_limiter_refills_up_to_burst() -> None:
+    clock = FakeClock()
+    limiter = RateLimiter(rate=1, burst=1, clock=clock)
+    limiter.reserve()
+
+    clock.now = 100.0
+
+    assert [limiter.reserve() for _ in range(2)] == [0.0, 1.0]
+
+
+def test_unlimited_rate_limiter_never_waits() -> None:
+    limiter = RateLimiter(rate=None)
+
+    assert [limiter.acquire() for _ in range(100)] == [0.0] * 100
+
+
+def test_rate_limiter_sleeps_for_reserved_delay() -> None:
+    limiter = RateLimiter(rate=4, clock=FakeClock())
+    limiter.reserve()
+
+    with patch("common.throttling.time.sleep") as mock_sleep:
+        assert limiter.acquire() == 0.25
+
+    mock_sleep.assert_called_once_with(0.25)
+
+
+def test_rate_limiter_waits_asynchronously() -> None:
+    limiter = RateLimiter(rate=4, clock=FakeClock())
+    limiter.reserve()
+
+    with patch("common.throttling.asyncio.sleep") as mock_sleep:
+        assert asyncio.run(limiter.acquire_async()) == 0.25
+
+    mock_sleep.assert_called_once_with(0.25)
+
+
+def test_rate_limiter_rejects_invalid_rate() -> None:
+    with pytest.raises(ValueError):
+        RateLimiter(rate=0)
+
+
+@pytest.mark.parametrize(
+    "attempt, fraction, expected_delay",
+    [
+        (0, 1.0, 1.0),
+        (1, 1.0, 2.0),
+        (3, 0.5, 4.0),
+        (10, 1.0, 30.0),
+        (10, 0.0, 0.0),
+    ]
+)
+def test_backoff_delay(attempt: int, fraction: float, expected_delay: float) -> None:
+    assert backoff_delay(attempt, 1.0, 30.0, lambda: fraction) == expected_delay
+
+
+def test_adaptive_rate_limiter_halves_and_recovers_rate() -> None:
+    limiter = AdaptiveRateLimiter(rate=8, min_rate=1, recovery=0.5)
+
+    for _ in range(5):
+        limiter.decrease()
+    assert limiter.rate == 1
+
+    limiter.increase()
+    assert limiter.rate == 1.5
+    for _ in range(10):
+        limiter.increase()
+    assert limiter.rate == 8
+
+
+def test_circuit_breaker_opens_after_consecutive_failures() -> None:
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_s=10, clock=clock)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.check()
+    assert not breaker.is_open
+
+    breaker.record_failure()
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_circuit_breaker_lets_one_trial_call_through_after_timeout() -> None:
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_s=10, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 4
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.check()
+    assert exc.value.retry_in_s == 6
+
+    clock.now = 10
+    breaker.check()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.record_success()
+    breaker.check()
+    assert not breaker.is_open
+
+
+def _take_tokens(limiter: RateLimiter, count: int) -> None:
+    for _ in range(count):
+        limiter.reserve()
+
+
+def test_shared_rate_limiter_spaces_calls_like_rate_limiter() -> None:
+    clock = FakeClock()
+    limiter = SharedRateLimiter(rate=2, burst=2, clock=clock)
+
+    assert [limiter.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+
+    limiter.decrease()
+    assert limiter.rate == 1
+
+
+def test_shared_rate_limiter_budget_is_shared_between_processes() -> None:
+    limiter = SharedRateLimiter(rate=0.001, burst=3)
+    process = multiprocessing.Process(target=_take_tokens, args=(limiter, 3))
+    process.start()
+    process.join(30)
+
+    assert process.exitcode == 0
+    # The burst was used up by the other process
+    assert limiter.reserve() > 100
@@ -1,6 +1,8 @@
+import numpy as np
 import pytest
+from math import radians, sin, cos, sqrt, atan2
 
-from common.utils import calculate_speed, interpolate_value, timestamp_to_date
+from common.utils import calculate_speed, haversine_distance, interpolate_value, timestamp_to_date
 
 
 @pytest.mark.parametrize(
@@ -45,3 +47,31 @@ def test_interpolate_value(start: float, end: float, progress: float, expected_v
 )
 def test_timestamp_to_date(timestamp: int, expected_date: str) -> None:
     assert timestamp_to_date(timestamp) == expected_date
+
+
+def _scalar_haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * atan2(sqrt(a), sqrt(1 - a)) * 6371
+
+
+def test_haversine_distance_matches_scalar_formula() -> None:
+    rng = np.random.default_rng(42)
+    lat1, lat2 = rng.uniform(-90, 90, (2, 1000))
+    lon1, lon2 = rng.uniform(-180, 180, (2, 1000))
+
+    distances = haversine_distance(lat1, lon1, lat2, lon2)
+
+    assert distances.shape == (1000,)
+    expected = [_scalar_haversine(*points) for points in zip(lat1, lon1, lat2, lon2)]
+    np.testing.assert_allclose(distances, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_haversine_distance_broadcasts_single_destination() -> None:
+    distances = haversine_distance([40.7128, 0.0, 51.5074], [-74.0060, 0.0, -0.1278], 51.5074, -0.1278)
+
+    assert distances == pytest.approx([5570.0, 5727.4, 0.0], rel=0.001)
+
+
+def test_haversine_distance_antipodal_points() -> None:
+    assert haversine_distance(0, 0, 0, 180) == pytest.approx(np.pi * 6371, rel=1e-9)
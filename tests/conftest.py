@@ -0,0 +1,18 @@
+import pytest
+
+NOW = 1_700_000_000.0  # start of the clock fixture, seconds since epoch
+
+
+class FakeClock:
+    """Clock for components taking a clock function, advanced by setting now"""
+
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock(NOW)
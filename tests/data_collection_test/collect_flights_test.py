@@ -1,24 +1,59 @@
 from datetime import datetime, timedelta
-from unittest.mock import MagicMock, call
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import ANY, MagicMock, call, patch
 import pytest
 from freezegun import freeze_time
 
 from config import DOWNLOAD_DATA_DIR
-from collect_flights import FlightCollector
+from common.coalescing import SingleFlight
+from common.throttling import CallStats
+import collect_flights
+from collect_flights import CollectorOptions, FlightCollector, merge_metrics, shard_windows
 from flight_data.flight_data import FlightData
-from flight_data.models import FlightDatapoint, FlightInfo
+from flight_data.models import FlightDatapoint, FlightDatapointBatch, FlightInfo
 from common.models import Location
-from weather_data.models import WeatherDatapoint
-from data_collection.models import CombinedDatapoint
+from weather_data.models import WeatherDatapoint, WeatherDatapointBatch
+from weather_data.weather_data import WeatherDataProcessor
+from data_collection.flight_collector import ProcessingStoppedError
+from data_collection.manifest import WindowManifest, WindowStatus
+from data_collection.models import CombinedDatapoint, CombinedDatapointBatch
+from data_collection.sinks import AvroSink, CSVSink
 
 @pytest.fixture
 def mock_flight_data() -> MagicMock:
-    return MagicMock(spec=FlightData)
+    mock = MagicMock(spec=FlightData)
+    mock.track_requests = SingleFlight()
+    mock.api_stats = CallStats()
+    mock.track_cache = None
+    return mock
 
 
 @pytest.fixture
-def collector(mock_flight_data: MagicMock) -> FlightCollector:
-    return FlightCollector(mock_flight_data)
+def manifest(tmp_path) -> WindowManifest:
+    return WindowManifest(str(tmp_path / "manifest.json"))
+
+
+@pytest.fixture
+def weather_client() -> MagicMock:
+    client = MagicMock()
+    client.fetch_many.side_effect = lambda requests: [None] * len(requests)
+    return client
+
+
+@pytest.fixture
+def collector(mock_flight_data: MagicMock, manifest: WindowManifest, weather_client: MagicMock) -> FlightCollector:
+    return FlightCollector(mock_flight_data, weather_data=WeatherDataProcessor(client=weather_client), manifest=manifest)
+
+
+@pytest.fixture
+def sink() -> MagicMock:
+    mock = MagicMock(spec=CSVSink)
+    mock.size = 0
+    mock.pending_rows = 0
+    mock.flushes = 0
+    return mock
 
 
 def test_generate_filename(collector: FlightCollector) -> None:
@@ -46,6 +81,14 @@ def test_collect_flights_success(collector: FlightCollector, mock_flight_data: M
     )
 
 
+def test_collect_flights_empty_list(collector: FlightCollector, mock_flight_data: MagicMock) -> None:
+    mock_flight_data.get_flights.return_value = []
+
+    result = collector.collect_flights_in_time_window(datetime(2024, 1, 1, 10, 0), datetime(2024, 1, 1, 12, 0))
+
+    assert result == []
+
+
 def test_collect_flights_no_data(collector: FlightCollector, mock_flight_data: MagicMock) -> None:
     mock_flight_data.get_flights.return_value = None
 
@@ -57,14 +100,13 @@ def test_collect_flights_no_data(collector: FlightCollector, mock_flight_data: M
     assert result is None
 
 
-def test_process_flights(collector: FlightCollector, mock_flight_data: MagicMock) -> None:
-    mock_flights = [MagicMock(icao24='flight1'), MagicMock(icao24='flight2')]
-    flight_datapoints = [
+def make_flight_batch(timestamps: list[int]) -> FlightDatapointBatch:
+    return FlightDatapointBatch.from_datapoints(
         FlightDatapoint(
             location=Location(10, 20),
             arrival_airport="JFK",
             arrival_airport_location=Location(20, 20),
-            timestamp=0,
+            timestamp=timestamp,
             horizontal_speed=0.0,
             altitude=0.0,
             vertical_speed=0.0,
@@ -73,19 +115,30 @@ def test_process_flights(collector: FlightCollector, mock_flight_data: MagicMock
             arrival_time=0,
             time_to_arrival=0,
         )
-    ]
-    weather_datapoint = WeatherDatapoint.empty_from_timestamp(0)
-    combined_datapoint = CombinedDatapoint.from_datapoints(flight_datapoints[0], weather_datapoint)
-    combined_datapoint.save_to_csv = MagicMock()
+        for timestamp in timestamps
+    )
 
-    mock_flight_data.get_flight_datapoints.side_effect = [flight_datapoints, None]
-    collector.get_weather_data_for_flight_datapoints = MagicMock(return_value=[combined_datapoint])
 
-    collector.process_flights(mock_flights, 'test.csv')
+def test_process_flights(collector: FlightCollector, mock_flight_data: MagicMock, sink: MagicMock) -> None:
+    mock_flights = [MagicMock(icao24='flight1'), MagicMock(icao24='flight2')]
+    tracks = [MagicMock(), None]
+    flight_batch = make_flight_batch([0])
+    combined_batch = MagicMock(spec=CombinedDatapointBatch)
+
+    mock_flight_data.get_track.side_effect = tracks
+    mock_flight_data.build_flight_datapoint_batch.side_effect = [flight_batch, None]
+    collector.get_weather_data_for_flight_batch = MagicMock(return_value=combined_batch)
 
-    assert mock_flight_data.get_flight_datapoints.call_args_list == [call(mock_flights[0]), call(mock_flights[1])]
-    collector.get_weather_data_for_flight_datapoints.assert_called_once_with(flight_datapoints)
-    combined_datapoint.save_to_csv.assert_called_once_with('test.csv')
+    collector.process_flights(mock_flights, sink)
+
+    assert mock_flight_data.get_track.call_args_list == [call(mock_flights[0]), call(mock_flights[1])]
+    assert mock_flight_data.build_flight_datapoint_batch.call_args_list == [
+        call(mock_flights[0], tracks[0]),
+        call(mock_flights[1], None),
+    ]
+    collector.get_weather_data_for_flight_batch.assert_called_once_with(flight_batch)
+    sink.write.assert_called_once_with(combined_batch)
+    sink.flush.assert_called_once_with()
 
 
 @freeze_time("2024-01-01 12:00:00")
@@ -154,9 +207,9 @@ def test_run_checks_all_flights_from_offset_to_current_time(flights: None | list
 
 
 @freeze_time("2024-01-01 12:00:00")
-def test_run_checks_all_flights_from_offset_to_current_time(collector: FlightCollector) -> None:
+def test_run_checks_all_flights_from_offset_to_current_time(collector: FlightCollector, tmp_path) -> None:
     mock_flights = [[MagicMock(icao24='flight1'), MagicMock(icao24='flight2')], [MagicMock(icao24='flight3'), MagicMock(icao24='flight4')]]
-    output_files = ["file1", "file2"]
+    output_files = [str(tmp_path / "file1"), str(tmp_path / "file2")]
 
     current_time = datetime.now()
     collector._generate_filename = MagicMock(side_effect=output_files)
@@ -174,55 +227,271 @@ def test_run_checks_all_flights_from_offset_to_current_time(collector: FlightCol
         call(current_time - timedelta(hours=2), current_time),
     ]
     assert collector.process_flights.call_args_list == [
-        call(mock_flights[0], output_files[0]),
-        call(mock_flights[1], output_files[1]),
+        call(mock_flights[0], ANY, "file1", None),
+        call(mock_flights[1], ANY, "file2", None),
     ]
+    assert [sink.path for _, sink, *_ in (c.args for c in collector.process_flights.call_args_list)] == output_files
 
-def test_get_weather_data_for_flight_datapoints(collector: FlightCollector) -> None:
-    flight_datapoints = [
-        FlightDatapoint(
-            location=Location(10, 20),
-            arrival_airport="JFK",
-            arrival_airport_location=Location(20, 20),
-            timestamp=0,
-            horizontal_speed=0.0,
-            altitude=0.0,
-            vertical_speed=0.0,
-            heading=0.0,
-            distance_to_destination=0.0,
-            arrival_time=0,
-            time_to_arrival=0,
-        ),
-        FlightDatapoint(
-            location=Location(10, 20),
-            arrival_airport="JFK",
-            arrival_airport_location=Location(20, 20),
-            timestamp=40,
-            horizontal_speed=0.0,
-            altitude=0.0,
-            vertical_speed=0.0,
-            heading=0.0,
-            distance_to_destination=0.0,
-            arrival_time=0,
-            time_to_arrival=0,
-        ),
-    ]
+def test_get_weather_data_for_flight_batch(collector: FlightCollector) -> None:
+    flight_batch = make_flight_batch([0, 40])
     weather_datapoints = [WeatherDatapoint.empty_from_timestamp(5), WeatherDatapoint.empty_from_timestamp(50)]
-    datapoints = [
-        CombinedDatapoint.from_datapoints(
-            flight_datapoints[0],
-            weather_datapoints[0],
-        ),
-        CombinedDatapoint.from_datapoints(
-            flight_datapoints[1],
-            weather_datapoints[1],
-        ),
+    collector.weather_data.get_weather_batch_for_flight_batch = MagicMock(
+        return_value=WeatherDatapointBatch.from_datapoints(weather_datapoints),
+    )
+
+    combined_batch = collector.get_weather_data_for_flight_batch(flight_batch)
+
+    assert list(combined_batch.rows()) == [
+        tuple(CombinedDatapoint.from_datapoints(flight, weather).get_values())
+        for flight, weather in zip(flight_batch.to_datapoints(), weather_datapoints)
     ]
-    collector.weather_data.get_weather_datapoint_for_flight_datapoint = MagicMock(side_effect=weather_datapoints)
+    collector.weather_data.get_weather_batch_for_flight_batch.assert_called_once_with(flight_batch)
+
+
+def test_process_flights_fetches_tracks_concurrently_in_order(mock_flight_data: MagicMock, manifest: WindowManifest, sink: MagicMock, weather_client: MagicMock) -> None:
+    collector = FlightCollector(
+        mock_flight_data, weather_data=WeatherDataProcessor(client=weather_client), track_workers=4, manifest=manifest,
+    )
+    mock_flights = [MagicMock(icao24=f'flight{i}') for i in range(8)]
+    batches = {flight.icao24: make_flight_batch([i]) for i, flight in enumerate(mock_flights)}
+    in_flight = []
+    max_in_flight = []
+
+    def get_track(flight: MagicMock) -> MagicMock:
+        in_flight.append(flight)
+        max_in_flight.append(len(in_flight))
+        # Later flights finish first
+        time.sleep(0.005 * (len(mock_flights) - mock_flights.index(flight)))
+        in_flight.remove(flight)
+        return flight
+
+    mock_flight_data.get_track.side_effect = get_track
+    mock_flight_data.build_flight_datapoint_batch.side_effect = lambda flight, track: batches[track.icao24]
+    combined_batches = {flight.icao24: MagicMock(spec=CombinedDatapointBatch) for flight in mock_flights}
+    collector.get_weather_data_for_flight_batch = MagicMock(
+        side_effect=lambda batch: combined_batches[f"flight{batch.timestamp[0]}"],
+    )
+
+    collector.process_flights(mock_flights, sink)
+
+    assert sink.write.call_args_list == [call(combined_batches[flight.icao24]) for flight in mock_flights]
+    assert max(max_in_flight) > 1
+
+
+def test_process_flights_prefetches_weather_of_window_before_join(collector: FlightCollector, mock_flight_data: MagicMock, sink: MagicMock, weather_client: MagicMock) -> None:
+    def weather_day(date: str) -> dict:
+        hour = {"temp_c": 5.0, "feelslike_c": 4.0, "wind_kph": 0.0, "humidity": 50, "precip_mm": 0.0, "vis_km": 10.0,
+                "pressure_mb": 1000.0, "uv": 0.0, "condition": {"text": "Clear"}}
+        hours = [{"time": f"{date} 00:00", **hour}, {"time": f"{date} 23:00", **hour}]
+        return {"forecast": {"forecastday": [{"hour": hours}]}}
+
+    flights = [FlightInfo("a", 0, "JFK", None), FlightInfo("b", 60, "JFK", None), FlightInfo("c", 2 * 86400, "JFK", None)]
+    mock_flight_data.build_flight_datapoint_batch.side_effect = lambda flight, track: make_flight_batch([flight.last_seen])
+    weather_client.fetch_many.side_effect = lambda requests: [weather_day(date) for _, date in requests]
+
+    with patch("data_collection.flight_collector.logger") as mock_logger:
+        collector.process_flights(flights, sink)
+
+    # Flight b needs the day prefetched for flight a, and the join finds all days cached
+    assert weather_client.fetch_many.call_args_list == [
+        call([(Location(10, 20), "1970-01-01")]),
+        call([(Location(10, 20), "1970-01-03")]),
+    ]
+    assert call("weather prefetch", cell_days=2, api_calls=2) in mock_logger.info.call_args_list
+    assert [written.args[0].weather_temperature_celsius.tolist() for written in sink.write.call_args_list] == [[5.0]] * 3
+
+
+def test_collector_rejects_invalid_number_of_track_workers(mock_flight_data: MagicMock) -> None:
+    with pytest.raises(ValueError):
+        FlightCollector(mock_flight_data, track_workers=0)
+
 
-    assert collector.get_weather_data_for_flight_datapoints(flight_datapoints) == datapoints
+def make_csv_writing_batch(row: str) -> MagicMock:
+    """Combined batch mock with a single column and row"""
+    batch = MagicMock(spec=CombinedDatapointBatch)
+    batch.__len__.return_value = 1
+    batch.column_names.return_value = ["timestamp"]
+    batch.rows.return_value = [(row,)]
+    return batch
 
-    assert collector.weather_data.get_weather_datapoint_for_flight_datapoint.call_args_list == [
-        call(flight_datapoints[0]),
-        call(flight_datapoints[1]),
+
+@pytest.fixture
+def window_collector(collector: FlightCollector, mock_flight_data: MagicMock, tmp_path) -> FlightCollector:
+    collector._generate_filename = MagicMock(return_value=str(tmp_path / "window.csv"))
+    mock_flight_data.get_track.side_effect = lambda flight: flight
+    mock_flight_data.build_flight_datapoint_batch.side_effect = lambda flight, track: make_flight_batch([flight.last_seen])
+    collector.get_weather_data_for_flight_batch = MagicMock(
+        side_effect=lambda batch: make_csv_writing_batch(str(batch.timestamp[0])),
+    )
+    return collector
+
+
+def test_process_window_finalizes_output_and_completes_window(window_collector: FlightCollector, mock_flight_data: MagicMock, manifest: WindowManifest, tmp_path) -> None:
+    mock_flight_data.get_flights.return_value = [FlightInfo("a", 1, "JFK", None), FlightInfo("b", 2, "JFK", None)]
+
+    window_collector.process_window(datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 12))
+
+    assert (tmp_path / "window.csv").read_bytes() == b"timestamp\r\n1\r\n2\r\n"
+    assert not (tmp_path / "window.csv.part").exists()
+    assert manifest.is_completed("window.csv")
+    assert manifest.get("window.csv").datapoints == 2
+
+
+def test_process_window_skips_completed_window(window_collector: FlightCollector, mock_flight_data: MagicMock, manifest: WindowManifest) -> None:
+    manifest.complete("window.csv")
+
+    window_collector.process_window(datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 12))
+
+    mock_flight_data.get_flights.assert_not_called()
+
+
+def test_process_window_resumes_interrupted_window(window_collector: FlightCollector, mock_flight_data: MagicMock, manifest: WindowManifest, tmp_path) -> None:
+    mock_flight_data.get_flights.return_value = [FlightInfo("a", 1, "JFK", None), FlightInfo("b", 2, "JFK", None)]
+    manifest.start("window.csv")
+    manifest.record_flight("window.csv", ("a", 1), output_size=14, datapoints=1)
+    # Rows of flight b were partially written before the interruption
+    (tmp_path / "window.csv.part").write_bytes(b"timestamp\r\n1\r\n2")
+
+    window_collector.process_window(datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 12))
+
+    mock_flight_data.get_track.assert_called_once_with(FlightInfo("b", 2, "JFK", None))
+    assert (tmp_path / "window.csv").read_bytes() == b"timestamp\r\n1\r\n2\r\n"
+    assert manifest.get("window.csv").status is WindowStatus.COMPLETED
+
+
+def test_process_window_restarts_window_with_truncated_output(window_collector: FlightCollector, mock_flight_data: MagicMock, manifest: WindowManifest, tmp_path) -> None:
+    mock_flight_data.get_flights.return_value = [FlightInfo("a", 1, "JFK", None), FlightInfo("b", 2, "JFK", None)]
+    manifest.start("window.csv")
+    manifest.record_flights("window.csv", [("a", 1), ("b", 2)], output_size=17, datapoints=2)
+    # Rows of flight b were recorded but lost
+    (tmp_path / "window.csv.part").write_bytes(b"timestamp\r\n1\r\n")
+
+    window_collector.process_window(datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 12))
+
+    assert mock_flight_data.get_track.call_count == 2
+    assert (tmp_path / "window.csv").read_bytes() == b"timestamp\r\n1\r\n2\r\n"
+    assert manifest.get("window.csv").datapoints == 2
+
+
+def test_process_flights_records_flights_without_rows_with_next_flush(collector: FlightCollector, mock_flight_data: MagicMock, sink: MagicMock, manifest: WindowManifest) -> None:
+    flights = [FlightInfo("a", 1, "JFK", None), FlightInfo("b", 2, "JFK", None), FlightInfo("c", 3, "JFK", None)]
+    mock_flight_data.build_flight_datapoint_batch.side_effect = lambda flight, track: (
+        make_flight_batch([flight.last_seen]) if flight.icao24 == "c" else None
+    )
+    collector.get_weather_data_for_flight_batch = MagicMock(side_effect=lambda batch: make_csv_writing_batch("1"))
+
+    def write(batch: MagicMock) -> None:
+        sink.flushes += 1
+        sink.size = 10
+    sink.write.side_effect = write
+    manifest.start("window.csv")
+    manifest.record_flights = MagicMock(wraps=manifest.record_flights)
+
+    collector.process_flights(flights, sink, "window.csv")
+
+    manifest.record_flights.assert_called_once_with("window.csv", [("a", 1), ("b", 2), ("c", 3)], 10, 1)
+
+
+def test_process_window_stops_after_current_flight(window_collector: FlightCollector, mock_flight_data: MagicMock, manifest: WindowManifest, tmp_path) -> None:
+    mock_flight_data.get_flights.return_value = [FlightInfo("a", 1, "JFK", None), FlightInfo("b", 2, "JFK", None)]
+    stop = threading.Event()
+    window_collector.get_weather_data_for_flight_batch.side_effect = lambda batch: (
+        stop.set() or make_csv_writing_batch(str(batch.timestamp[0]))
+    )
+    window_collector.queue_size = 1
+
+    with pytest.raises(ProcessingStoppedError):
+        window_collector.process_window(datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 12), stop=stop)
+
+    assert not (tmp_path / "window.csv").exists()
+    assert (tmp_path / "window.csv.part").read_bytes() == b"timestamp\r\n1\r\n"
+    assert manifest.get("window.csv").status is WindowStatus.IN_PROGRESS
+    assert manifest.get("window.csv").flights_done == [("a", 1)]
+
+
+def test_process_window_without_flights_completes_window(window_collector: FlightCollector, mock_flight_data: MagicMock, manifest: WindowManifest, tmp_path) -> None:
+    mock_flight_data.get_flights.return_value = []
+
+    window_collector.process_window(datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 12))
+
+    assert not (tmp_path / "window.csv").exists()
+    assert manifest.is_completed("window.csv")
+
+
+def test_process_window_without_list_of_flights_leaves_window_incomplete(window_collector: FlightCollector, mock_flight_data: MagicMock, manifest: WindowManifest, tmp_path) -> None:
+    mock_flight_data.get_flights.return_value = None
+
+    with pytest.raises(RuntimeError):
+        window_collector.process_window(datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 12))
+
+    assert not (tmp_path / "window.csv").exists()
+    assert manifest.get("window.csv") is None
+
+
+@freeze_time("2024-01-01 12:30:00")
+def test_run_aligns_windows_to_window_size(collector: FlightCollector) -> None:
+    collector.process_window = MagicMock()
+
+    collector.run(days_offset=0, hours_offset=5)
+
+    assert collector.process_window.call_args_list == [
+        call(datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 10)),
+        call(datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 12)),
     ]
+
+
+def test_collector_metrics(collector: FlightCollector, mock_flight_data: MagicMock) -> None:
+    mock_flight_data.api_stats.calls = 3
+
+    metrics = collector.metrics()
+
+    assert metrics["opensky_api"]["calls"] == 3
+    assert set(metrics) == {"opensky_api", "track_requests", "weather_cache", "weather_requests"}
+
+
+def test_shard_windows_splits_windows_round_robin() -> None:
+    windows = [(datetime(2024, 1, 1, 2 * i), datetime(2024, 1, 1, 2 * i + 2)) for i in range(5)]
+
+    assert shard_windows(windows, 2) == [[windows[0], windows[2], windows[4]], [windows[1], windows[3]]]
+    assert shard_windows(windows[:1], 3) == [windows[:1]]
+
+
+def test_merge_metrics_sums_metrics_of_workers() -> None:
+    merged = merge_metrics([
+        {"opensky_api": {"calls": 2, "waited_s": 1.5}, "track_cache": {"hits": 1}},
+        {"opensky_api": {"calls": 3, "waited_s": 0.5}},
+    ])
+
+    assert merged == {"opensky_api": {"calls": 5, "waited_s": 2.0}, "track_cache": {"hits": 1}}
+
+
+def test_worker_collects_its_windows_with_shared_rate_limiters() -> None:
+    windows = [(datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 12))]
+    options = CollectorOptions(track_workers=2)
+    collector = MagicMock(spec=FlightCollector)
+    collector.metrics.return_value = {"opensky_api": {"calls": 1}}
+    rate_limiters = (MagicMock(), MagicMock())
+    created_with = []
+
+    @contextmanager
+    def create_collector(*args):
+        created_with.append(args)
+        yield collector
+
+    with (
+        patch.object(collect_flights, "create_collector", create_collector),
+        patch.object(collect_flights, "_rate_limiters", None),
+    ):
+        collect_flights._init_worker(*rate_limiters)
+        metrics = collect_flights._collect_windows(windows, options)
+
+    assert created_with == [(options, *rate_limiters)]
+    collector.run_windows.assert_called_once_with(windows)
+    assert metrics == {"opensky_api": {"calls": 1}}
+
+
+def test_collector_options_sink_factory(tmp_path) -> None:
+    assert CollectorOptions().sink_factory() is CSVSink
+
+    with CollectorOptions(output_format="avro", avro_codec="null").sink_factory()(str(tmp_path / "window.avro")) as sink:
+        assert isinstance(sink, AvroSink)
@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+import pytest
+from click.testing import CliRunner
+
+import collect_queue
+from collect_flights import CollectorOptions
+from data_collection.work_queue import SQLiteWorkQueue
+
+
+def test_work_passes_avro_options_to_collector(tmp_path) -> None:
+    created_with = []
+
+    @contextmanager
+    def create_collector(options: CollectorOptions):
+        created_with.append(options)
+        yield MagicMock(**{"metrics.return_value": {}})
+
+    with (
+        patch("collect_queue.create_collector", side_effect=create_collector),
+        patch("collect_queue.work", return_value=0) as mock_work,
+    ):
+        result = CliRunner().invoke(collect_queue.main, [
+            "--queue", str(tmp_path / "queue.sqlite"), "work",
+            "--output-format", "avro", "--avro-codec", "null", "--avro-block-size", "4096",
+        ])
+
+    assert result.exit_code == 0, result.output
+    mock_work.assert_called_once()
+    assert created_with[0].output_format == "avro"
+    assert created_with[0].avro_codec == "null"
+    assert created_with[0].avro_block_bytes == 4096
+
+
+def test_work_rejects_unknown_avro_codec(tmp_path) -> None:
+    with patch("collect_queue.work") as mock_work:
+        result = CliRunner().invoke(collect_queue.main, [
+            "--queue", str(tmp_path / "queue.sqlite"), "work", "--output-format", "avro", "--avro-codec", "unknown",
+        ])
+
+    assert result.exit_code == 2
+    assert "--avro-codec" in result.output
+    mock_work.assert_not_called()
+
+
+def test_open_queue_opens_sqlite_queue_for_path(tmp_path) -> None:
+    assert isinstance(collect_queue.open_queue(str(tmp_path / "queue.sqlite")), SQLiteWorkQueue)
+
+
+def test_open_queue_opens_postgresql_queue_for_url() -> None:
+    pytest.importorskip("psycopg")
+    with patch("data_collection.postgres_work_queue.PostgresWorkQueue") as mock_queue:
+        assert collect_queue.open_queue("postgresql://collector@db/queue") is mock_queue.return_value
+
+    mock_queue.assert_called_once_with("postgresql://collector@db/queue")
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+import fastavro
+
+from data_collection.models import CombinedDatapoint, CombinedDatapointBatch
+from common.models import Location
+from flight_data.models import FlightDatapoint
+from schema import SCHEMA
+from weather_data.models import WeatherDatapoint
+
+SCRIPT = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "csv_to_avro", "csv_to_avro.py")
+
+
+def test_converter_runs_without_src_on_path(tmp_path) -> None:
+    batch = CombinedDatapointBatch.from_datapoints(
+        CombinedDatapoint.from_datapoints(
+            FlightDatapoint(Location(10.0 + i, 20.0), "JFK", Location(20.0, 20.0), 60 * i, 500.0, 1000.0, 10.0, 90.0,
+                            100.0 - i, 600, 600 - 60 * i),
+            WeatherDatapoint(60 * i, 5.0, 4.0, "Cloudy", 10.0, 60.0, 0.0, 10.0, 1020.0, 1.0),
+        )
+        for i in range(3)
+    )
+    (tmp_path / "csv").mkdir()
+    batch.save_to_csv(str(tmp_path / "csv" / "window.csv"))
+    environment = {name: value for name, value in os.environ.items() if name != "PYTHONPATH"}
+
+    subprocess.run([sys.executable, SCRIPT, str(tmp_path / "csv"), str(tmp_path / "avro")],
+                   check=True, capture_output=True, env=environment)
+
+    with open(tmp_path / "avro" / "window.avro", "rb") as file:
+        reader = fastavro.reader(file)
+        assert reader.writer_schema["fields"] == SCHEMA["fields"]
+        assert [record["timestamp"] for record in reader] == [0, 60, 120]
@@ -1,10 +1,15 @@
-from data_collection.models import CombinedDatapoint
-from flight_data.models import FlightDatapoint
-from weather_data.models import WeatherDatapoint
+from data_collection.models import CombinedDatapoint, CombinedDatapointBatch
+from flight_data.models import FlightDatapoint, FlightDatapointBatch
+from weather_data.models import WeatherDatapoint, WeatherDatapointBatch
 from common.models import Location
+from schema import SCHEMA
 import csv
 from tempfile import NamedTemporaryFile
 
+import fastavro
+import numpy as np
+import pytest
+
 
 def test_combined_datapoint_from_datapoints() -> None:
     flight_datapoint = FlightDatapoint(
@@ -171,3 +176,109 @@ def test_combined_datapoint_save_to_csv_with_already_created_file() -> None:
         ['test'],
         ['0', '10.0', '20.0', "JFK", '20.0', '20.0', '0', '0.0', '0.0', '0.0', '0.0', '0.0', '0', '0', '10', '0.0', '0.0', "NA", '0.0', '0.0', '0.0', '0.0', '0.0', '0.0'],
     ]
+
+
+def _combined_datapoints() -> list[CombinedDatapoint]:
+    return [
+        CombinedDatapoint.from_datapoints(
+            FlightDatapoint(
+                location=Location(10.0 + i, 20.0),
+                arrival_airport="JFK",
+                arrival_airport_location=Location(20.0, 20.0),
+                timestamp=60 * i,
+                horizontal_speed=500.0 + i,
+                altitude=1000.0,
+                vertical_speed=10.0,
+                heading=90.0,
+                distance_to_destination=100.0 - i,
+                arrival_time=600,
+                time_to_arrival=600 - 60 * i,
+            ),
+            WeatherDatapoint(60 * i, 5.0, 4.0, "Cloudy", 10.0, 60.0, 0.0, 10.0, 1020.0, 1.0),
+        )
+        for i in range(3)
+    ]
+
+
+def test_combined_datapoint_batch_columns_match_schema() -> None:
+    assert CombinedDatapointBatch.column_names() == [field["name"] for field in SCHEMA["fields"]]
+    assert CombinedDatapointBatch.column_names() == _combined_datapoints()[0].get_attribute_names()
+
+
+def test_combined_datapoint_batch_from_datapoints() -> None:
+    datapoints = _combined_datapoints()
+
+    batch = CombinedDatapointBatch.from_datapoints(datapoints)
+
+    assert len(batch) == 3
+    assert batch.timestamp.dtype == np.int64
+    assert batch.flight_location_latitude.tolist() == [10.0, 11.0, 12.0]
+    assert batch.weather_condition_text.tolist() == ["Cloudy"] * 3
+    assert [list(row) for row in batch.rows()] == [datapoint.get_values() for datapoint in datapoints]
+
+
+def test_combined_datapoint_batch_from_batches() -> None:
+    datapoints = _combined_datapoints()
+    flight = FlightDatapointBatch.from_datapoints(datapoint.flight for datapoint in datapoints)
+    weather = WeatherDatapointBatch.from_datapoints(datapoint.weather for datapoint in datapoints)
+
+    batch = CombinedDatapointBatch.from_batches(flight, weather)
+
+    assert [list(row) for row in batch.rows()] == [datapoint.get_values() for datapoint in datapoints]
+    assert batch.flight_altitude is flight.altitude
+    with pytest.raises(ValueError):
+        CombinedDatapointBatch.from_batches(flight, weather.take(slice(0, 2)))
+
+
+def test_combined_datapoint_batch_conversions() -> None:
+    batch = CombinedDatapointBatch.from_datapoints(_combined_datapoints())
+
+    features = batch.to_numpy(["flight_distance_to_destination", "flight_horizontal_speed"])
+    assert features.tolist() == [[100.0, 500.0], [99.0, 501.0], [98.0, 502.0]]
+    assert np.shares_memory(batch.to_numpy(["flight_altitude"]), batch.flight_altitude)
+
+    dataframe = batch.to_dataframe()
+    assert list(dataframe.columns) == CombinedDatapointBatch.column_names()
+    assert dataframe["flight_time_to_arrival"].tolist() == [600, 540, 480]
+
+    records = list(batch.to_records())
+    assert records[1]["flight_location_latitude"] == 11.0
+    assert records[1]["flight_arrival_time"] == 600
+    assert isinstance(records[1]["flight_arrival_time"], int)
+
+
+def test_combined_datapoint_batch_missing_values() -> None:
+    datapoint = _combined_datapoints()[0]
+    datapoint.flight.arrival_time = None
+    datapoint.flight.time_to_arrival = None
+
+    batch = CombinedDatapointBatch.from_datapoints([datapoint])
+
+    assert np.isnan(batch.flight_arrival_time[0])
+    assert next(batch.to_records())["flight_arrival_time"] is None
+
+
+def test_combined_datapoint_batch_save_to_csv_matches_datapoints(tmp_path) -> None:
+    datapoints = _combined_datapoints()
+    expected_file = tmp_path / "expected.csv"
+    batch_file = tmp_path / "batch.csv"
+    for datapoint in datapoints:
+        datapoint.save_to_csv(str(expected_file))
+
+    batch = CombinedDatapointBatch.from_datapoints(datapoints)
+    batch.take(slice(0, 1)).save_to_csv(str(batch_file))
+    batch.take(slice(1, 3)).save_to_csv(str(batch_file))
+
+    assert batch_file.read_text() == expected_file.read_text()
+
+
+def test_combined_datapoint_batch_save_to_avro(tmp_path) -> None:
+    filename = str(tmp_path / "flights.avro")
+    batch = CombinedDatapointBatch.from_datapoints(_combined_datapoints())
+
+    batch.take(slice(0, 2)).save_to_avro(filename)
+    batch.take(slice(2, 3)).save_to_avro(filename)
+
+    with open(filename, "rb") as file:
+        records = list(fastavro.reader(file))
+    assert records == list(batch.to_records())
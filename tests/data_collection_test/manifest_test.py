@@ -0,0 +1,90 @@
+import json
+
+from data_collection.manifest import WindowManifest, WindowState, WindowStatus, write_atomically
+
+
+def test_manifest_is_persisted(tmp_path) -> None:
+    path = str(tmp_path / "manifest.json")
+    manifest = WindowManifest(path)
+    manifest.start("window1.csv")
+    manifest.record_flight("window1.csv", ("abc", 1), output_size=100, datapoints=3)
+    manifest.start("window2.csv")
+    manifest.complete("window2.csv")
+
+    reloaded = WindowManifest(path)
+
+    assert reloaded.get("window1.csv") == WindowState(WindowStatus.IN_PROGRESS, [("abc", 1)], 100, 3)
+    assert not reloaded.is_completed("window1.csv")
+    assert reloaded.is_completed("window2.csv")
+    assert reloaded.get("window3.csv") is None
+    assert len(reloaded) == 2
+
+
+def test_start_keeps_progress_of_interrupted_window(tmp_path) -> None:
+    manifest = WindowManifest(str(tmp_path / "manifest.json"))
+    manifest.start("window.csv")
+    manifest.record_flight("window.csv", ("abc", 1), output_size=100)
+
+    state = manifest.start("window.csv")
+
+    assert state.flights_done == [("abc", 1)]
+    assert state.output_size == 100
+
+
+def test_record_flights_records_several_flights(tmp_path) -> None:
+    manifest = WindowManifest(str(tmp_path / "manifest.json"))
+    manifest.start("window.csv")
+    manifest.record_flight("window.csv", ("abc", 1), output_size=100, datapoints=3)
+
+    manifest.record_flights("window.csv", [("def", 2), ("ghi", 3)], output_size=250, datapoints=5)
+
+    assert WindowManifest(manifest.path).get("window.csv") == WindowState(
+        WindowStatus.IN_PROGRESS, [("abc", 1), ("def", 2), ("ghi", 3)], 250, 8,
+    )
+
+
+def test_restart_drops_progress_of_window(tmp_path) -> None:
+    manifest = WindowManifest(str(tmp_path / "manifest.json"))
+    manifest.start("window.csv")
+    manifest.record_flight("window.csv", ("abc", 1), output_size=100, datapoints=3)
+
+    state = manifest.restart("window.csv")
+
+    assert state == WindowState()
+    assert WindowManifest(manifest.path).get("window.csv") == WindowState()
+
+
+def test_complete_drops_processed_flights(tmp_path) -> None:
+    path = tmp_path / "manifest.json"
+    manifest = WindowManifest(str(path))
+    manifest.start("window.csv")
+    manifest.record_flight("window.csv", ("abc", 1), output_size=100, datapoints=3)
+
+    manifest.complete("window.csv")
+
+    windows = json.loads(path.read_text())["windows"]
+    assert windows == {
+        "window.csv": {"status": "completed", "flights_done": [], "output_size": 100, "datapoints": 3},
+    }
+
+
+def test_write_atomically_replaces_file_without_leaving_temporary_files(tmp_path) -> None:
+    path = tmp_path / "nested" / "file.json"
+    write_atomically(str(path), b"old")
+    write_atomically(str(path), b"new")
+
+    assert path.read_bytes() == b"new"
+    assert [file.name for file in path.parent.iterdir()] == ["file.json"]
+
+
+def test_changes_of_other_instances_are_kept(tmp_path) -> None:
+    path = str(tmp_path / "manifest.json")
+    first, second = WindowManifest(path), WindowManifest(path)
+
+    first.start("window1.csv")
+    second.start("window2.csv")
+    first.complete("window1.csv")
+
+    reloaded = WindowManifest(path)
+    assert reloaded.is_completed("window1.csv")
+    assert reloaded.get("window2.csv") == WindowState()
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from data_collection.pipeline import Pipeline, Stage
+
+
+def test_pipeline_applies_stages_in_order_of_input() -> None:
+    def slow_for_small(x: int) -> int:
+        time.sleep(0.001 * (10 - x))
+        return x * 10
+
+    pipeline = Pipeline([Stage("multiply", slow_for_small, workers=4), Stage("add", lambda x: x + 1, workers=2)])
+
+    assert list(pipeline.run(range(10))) == [x * 10 + 1 for x in range(10)]
+    assert pipeline.stats["multiply"].processed == 10
+    assert pipeline.stats["add"].processed == 10
+
+
+def test_pipeline_runs_stages_concurrently() -> None:
+    running = set()
+    overlapped = threading.Event()
+
+    def track(name: str):
+        def function(x: int) -> int:
+            running.add(name)
+            if len(running) == 2:
+                overlapped.set()
+            overlapped.wait(0.5)
+            running.discard(name)
+            return x
+        return function
+
+    pipeline = Pipeline([Stage("first", track("first")), Stage("second", track("second"))])
+
+    assert list(pipeline.run(range(3))) == [0, 1, 2]
+    assert overlapped.is_set()
+
+
+def test_pipeline_limits_items_in_flight() -> None:
+    taken = []
+    in_flight = []
+
+    def items():
+        for i in range(50):
+            taken.append(i)
+            yield i
+
+    pipeline = Pipeline([Stage("identity", lambda x: x, workers=2, queue_size=2)], max_in_flight=5)
+    for i in pipeline.run(items()):
+        time.sleep(0.001)
+        in_flight.append(len(taken) - (i + 1))
+
+    assert max(in_flight) <= 5
+
+
+def test_pipeline_raises_errors_of_stages() -> None:
+    def fail_on_three(x: int) -> int:
+        if x == 3:
+            raise ValueError("three")
+        return x
+
+    pipeline = Pipeline([Stage("fail", fail_on_three, workers=2)])
+
+    with pytest.raises(ValueError, match="three"):
+        list(pipeline.run(range(100)))
+
+
+def test_pipeline_raises_errors_of_input() -> None:
+    def items():
+        yield 1
+        raise RuntimeError("input")
+
+    with pytest.raises(RuntimeError, match="input"):
+        list(Pipeline([Stage("identity", lambda x: x)]).run(items()))
+
+
+def test_pipeline_stops_when_results_are_no_longer_consumed() -> None:
+    threads = threading.active_count()
+    results = Pipeline([Stage("identity", lambda x: x, workers=3, queue_size=1)]).run(range(1000))
+
+    assert next(results) == 0
+    results.close()
+
+    assert threading.active_count() == threads
+
+
+def test_stage_rejects_invalid_parallelism() -> None:
+    with pytest.raises(ValueError):
+        Stage("stage", lambda x: x, workers=0)
@@ -0,0 +1,183 @@
+from unittest.mock import patch
+
+import fastavro
+import numpy as np
+import pytest
+
+from common.models import Location
+from data_collection.models import CombinedDatapoint, CombinedDatapointBatch
+from data_collection.sinks import AvroSink, CSVSink, Sink
+from flight_data.models import FlightDatapoint
+from weather_data.models import WeatherDatapoint
+from conftest import FakeClock
+
+
+@pytest.fixture
+def batch() -> CombinedDatapointBatch:
+    return CombinedDatapointBatch.from_datapoints(
+        CombinedDatapoint.from_datapoints(
+            FlightDatapoint(Location(10.0 + i, 20.0), "JFK", Location(20.0, 20.0), 60 * i, 500.0, 1000.0, 10.0, 90.0,
+                            100.0 - i, 600, 600 - 60 * i),
+            WeatherDatapoint(60 * i, 5.0, 4.0, "Cloudy", 10.0, 60.0, 0.0, 10.0, 1020.0, 1.0),
+        )
+        for i in range(3)
+    )
+
+
+def test_output_matches_save_to_csv(tmp_path, batch: CombinedDatapointBatch) -> None:
+    expected_file = tmp_path / "expected.csv"
+    batch.take(slice(0, 1)).save_to_csv(str(expected_file))
+    batch.take(slice(1, 3)).save_to_csv(str(expected_file))
+
+    with CSVSink(str(tmp_path / "window.csv")) as sink:
+        sink.write(batch.take(slice(0, 1)))
+        sink.write(batch.take(slice(1, 3)))
+        sink.finalize()
+
+    assert (tmp_path / "window.csv").read_bytes() == expected_file.read_bytes()
+    assert not (tmp_path / "window.csv.part").exists()
+
+
+def test_rows_are_buffered_until_buffer_is_full(tmp_path, batch: CombinedDatapointBatch, clock: FakeClock) -> None:
+    with CSVSink(str(tmp_path / "first.csv")) as first:
+        first.write(batch.take(slice(0, 1)))
+    sink = CSVSink(str(tmp_path / "window.csv"), buffer_bytes=first.size + 1, clock=clock)
+
+    with patch("builtins.open", wraps=open) as mock_open:
+        sink.write(batch.take(slice(0, 1)))
+        assert sink.pending_rows == 1
+        assert (tmp_path / "window.csv.part").read_bytes() == b""
+
+        sink.write(batch.take(slice(1, 3)))
+
+    mock_open.assert_not_called()
+    assert sink.pending_rows == 0
+    assert sink.flushes == 1
+    assert sink.size == (tmp_path / "window.csv.part").stat().st_size
+    sink.close()
+
+
+def test_rows_are_flushed_after_interval(tmp_path, batch: CombinedDatapointBatch, clock: FakeClock) -> None:
+    sink = CSVSink(str(tmp_path / "window.csv"), flush_interval_s=5, clock=clock)
+
+    sink.write(batch.take(slice(0, 1)))
+    clock.now += 5
+    sink.write(batch.take(slice(1, 2)))
+
+    assert sink.pending_rows == 0
+    assert (tmp_path / "window.csv.part").read_text().count("\n") == 3
+    sink.close()
+
+
+def test_flush_syncs_partial_file(tmp_path, batch: CombinedDatapointBatch) -> None:
+    sink = CSVSink(str(tmp_path / "window.csv"))
+    sink.write(batch)
+
+    with patch("data_collection.sinks.os.fsync") as mock_fsync:
+        sink.flush()
+        sink.flush()
+
+    mock_fsync.assert_called_once_with(sink._file.fileno())
+    sink.close()
+
+
+def test_partial_file_is_continued_without_header(tmp_path, batch: CombinedDatapointBatch) -> None:
+    with CSVSink(str(tmp_path / "window.csv")) as sink:
+        sink.write(batch.take(slice(0, 1)))
+    assert (tmp_path / "window.csv.part").exists()
+    assert not (tmp_path / "window.csv").exists()
+
+    with CSVSink(str(tmp_path / "window.csv")) as sink:
+        sink.write(batch.take(slice(1, 3)))
+        sink.finalize()
+
+    lines = (tmp_path / "window.csv").read_text().splitlines()
+    assert lines[0] == ",".join(CombinedDatapointBatch.column_names())
+    assert len(lines) == 4
+
+
+def test_finalize_removes_empty_output(tmp_path) -> None:
+    with CSVSink(str(tmp_path / "window.csv")) as sink:
+        sink.finalize()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def read_avro(path) -> list[dict]:
+    with open(path, "rb") as file:
+        return list(fastavro.reader(file))
+
+
+def test_avro_output_matches_save_to_avro(tmp_path, batch: CombinedDatapointBatch) -> None:
+    batch.save_to_avro(str(tmp_path / "expected.avro"))
+
+    with AvroSink(str(tmp_path / "window.avro"), codec="deflate") as sink:
+        sink.write(batch.take(slice(0, 1)))
+        sink.write(batch.take(slice(1, 3)))
+        sink.finalize()
+
+    assert read_avro(tmp_path / "window.avro") == read_avro(tmp_path / "expected.avro")
+    with open(tmp_path / "window.avro", "rb") as file:
+        assert fastavro.reader(file).codec == "deflate"
+
+
+def test_avro_blocks_are_written_when_full(tmp_path, batch: CombinedDatapointBatch) -> None:
+    sink = AvroSink(str(tmp_path / "window.avro"), block_bytes=1)
+    header_size = sink.size
+
+    sink.write(batch.take(slice(0, 1)))
+
+    assert sink.pending_rows == 0
+    assert sink.size > header_size
+    assert len(read_avro(tmp_path / "window.avro.part")) == 1
+    sink.close()
+
+
+def test_avro_partial_file_is_continued_after_truncation(tmp_path, batch: CombinedDatapointBatch) -> None:
+    with AvroSink(str(tmp_path / "window.avro")) as sink:
+        sink.write(batch.take(slice(0, 1)))
+        sink.flush()
+        size = sink.size
+        # Rows written after the last size recorded by the collector are dropped when resuming
+        sink.write(batch.take(slice(1, 2)))
+    with open(tmp_path / "window.avro.part", "r+b") as file:
+        file.truncate(size)
+
+    with AvroSink(str(tmp_path / "window.avro")) as sink:
+        sink.write(batch.take(slice(1, 3)))
+        sink.finalize()
+
+    assert [record["timestamp"] for record in read_avro(tmp_path / "window.avro")] == [0, 60, 120]
+
+
+def test_avro_sink_drops_rows_with_missing_values(tmp_path, batch: CombinedDatapointBatch) -> None:
+    batch = batch.take(slice(0, 3))
+    batch.flight_altitude[1] = np.nan
+    batch.weather_uv_index[2] = np.nan
+
+    with AvroSink(str(tmp_path / "window.avro")) as sink:
+        sink.write(batch)
+        sink.finalize()
+
+    assert [record["timestamp"] for record in read_avro(tmp_path / "window.avro")] == [0]
+    assert sink.dropped_rows == 2
+
+
+def test_avro_sink_without_rows_removes_output(tmp_path) -> None:
+    with AvroSink(str(tmp_path / "window.avro")) as sink:
+        sink.finalize()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_avro_sink_rejects_unknown_codec(tmp_path) -> None:
+    with pytest.raises(ValueError):
+        AvroSink(str(tmp_path / "window.avro"), codec="unknown")
+
+
+def test_sink_requires_format_specific_methods(tmp_path) -> None:
+    class IncompleteSink(Sink):
+        EXTENSION = "txt"
+
+    with pytest.raises(TypeError):
+        IncompleteSink(str(tmp_path / "window.txt"), flush_interval_s=1, clock=lambda: 0.0)
@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import os
+import time
+from typing import Generator
+from unittest.mock import MagicMock
+
+import pytest
+
+from data_collection.flight_collector import FlightCollector, ProcessingStoppedError
+from data_collection.work_queue import SQLiteWorkQueue, WorkItem, WorkQueue, WorkStatus, work
+from conftest import FakeClock
+
+WINDOWS = [
+    (datetime(2024, 1, 1, 2 * i, tzinfo=timezone.utc), datetime(2024, 1, 1, 2 * i + 2, tzinfo=timezone.utc))
+    for i in range(3)
+]
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def queue(request: pytest.FixtureRequest, tmp_path, clock: FakeClock) -> Generator[WorkQueue, None, None]:
+    """
+    Queue of every backend; the PostgreSQL one runs against the database at WORK_QUEUE_TEST_POSTGRES_URL,
+    e.g. postgresql://postgres@localhost/work_queue_test, whose windows table is emptied
+    """
+    if request.param == "sqlite":
+        queue = SQLiteWorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2, clock=clock)
+    else:
+        url = os.environ.get("WORK_QUEUE_TEST_POSTGRES_URL")
+        if not url:
+            pytest.skip("WORK_QUEUE_TEST_POSTGRES_URL is not set")
+        postgres_work_queue = pytest.importorskip("data_collection.postgres_work_queue")
+        queue = postgres_work_queue.PostgresWorkQueue(url, max_attempts=2, clock=clock)
+        queue._execute("TRUNCATE windows")
+    queue.enqueue(WINDOWS)
+    yield queue
+    queue.close()
+
+
+def test_enqueue_keeps_windows_already_in_queue(queue: WorkQueue) -> None:
+    item = queue.lease("worker1", 60)
+    queue.complete(item, "worker1")
+
+    assert queue.enqueue(WINDOWS + [(datetime(2024, 1, 1, 6), datetime(2024, 1, 1, 8))]) == 1
+    assert queue.counts() == {"pending": 3, "leased": 0, "done": 1, "failed": 0}
+
+
+def test_lease_returns_windows_in_order_once(queue: WorkQueue) -> None:
+    items = [queue.lease(f"worker{i}", 60) for i in range(4)]
+
+    assert items == [WorkItem(start, end, 1) for start, end in WINDOWS] + [None]
+    assert queue.counts()["leased"] == 3
+
+
+def test_leased_windows_are_in_utc(queue: WorkQueue) -> None:
+    item = queue.lease("worker1", 60)
+
+    assert item.start.tzinfo is timezone.utc
+    assert item.start.hour == 0
+
+
+def test_concurrent_workers_lease_different_windows(queue: WorkQueue) -> None:
+    with ThreadPoolExecutor(4) as executor:
+        items = list(executor.map(lambda i: queue.lease(f"worker{i}", 60), range(4)))
+
+    assert sorted(item.start for item in items if item is not None) == [start for start, _ in WINDOWS]
+    assert items.count(None) == 1
+
+
+def test_expired_lease_is_taken_over(queue: WorkQueue, clock: FakeClock) -> None:
+    item = queue.lease("worker1", 60)
+    clock.now += 40
+    assert queue.heartbeat(item, "worker1", 60)
+    clock.now += 59
+    assert queue.lease("worker2", 60).start == WINDOWS[1][0]
+
+    clock.now += 1
+    taken_over = queue.lease("worker2", 60)
+
+    assert taken_over == WorkItem(*WINDOWS[0], attempts=2)
+    assert not queue.heartbeat(item, "worker1", 60)
+    assert not queue.complete(item, "worker1")
+    assert queue.complete(taken_over, "worker2")
+
+
+def test_expired_lease_without_attempts_left_fails_window(queue: WorkQueue, clock: FakeClock) -> None:
+    queue.lease("worker1", 60)
+    clock.now += 60
+    assert queue.lease("worker2", 60) == WorkItem(*WINDOWS[0], attempts=2)
+    clock.now += 60
+
+    assert queue.lease("worker3", 60) == WorkItem(*WINDOWS[1], attempts=1)
+    assert queue.counts() == {"pending": 1, "leased": 1, "done": 0, "failed": 1}
+    assert queue.requeue_failed() == 1
+
+
+def test_completed_window_is_never_leased_again(queue: WorkQueue, clock: FakeClock) -> None:
+    item = queue.lease("worker1", 60)
+    queue.complete(item, "worker1")
+    clock.now += 3600
+
+    assert queue.lease("worker2", 60).start != item.start
+
+
+def test_release_requeues_window_until_max_attempts(queue: WorkQueue) -> None:
+    item = queue.lease("worker1", 60)
+    assert queue.release(item, "worker1", "error")
+    item = queue.lease("worker1", 60)
+    assert item.attempts == 2
+
+    queue.release(item, "worker1", "error")
+
+    assert queue.counts() == {"pending": 2, "leased": 0, "done": 0, "failed": 1}
+    assert queue.requeue_failed() == 1
+    assert queue.lease("worker1", 60) == WorkItem(*WINDOWS[0], attempts=1)
+
+
+def test_work_processes_all_windows(queue: WorkQueue) -> None:
+    collector = MagicMock(spec=FlightCollector)
+    collector.process_window.side_effect = [None, RuntimeError("boom"), None, None]
+
+    assert work(queue, collector, "worker1", lease_s=60) == 3
+
+    assert [call.args for call in collector.process_window.call_args_list] == [
+        WINDOWS[0], WINDOWS[1], WINDOWS[1], WINDOWS[2],
+    ]
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 3, "failed": 0}
+
+
+def test_work_sends_heartbeats_while_processing(queue: WorkQueue, clock: FakeClock) -> None:
+    collector = MagicMock(spec=FlightCollector)
+    heartbeats = []
+    queue.heartbeat = MagicMock(side_effect=lambda *args: heartbeats.append(args) or True)
+
+    def process_window(*_, **__) -> None:
+        while not heartbeats:
+            time.sleep(0.001)
+
+    collector.process_window.side_effect = process_window
+
+    assert work(queue, collector, "worker1", lease_s=0.03) == 3
+    assert heartbeats[0][1:] == ("worker1", 0.03)
+
+
+def test_work_stops_processing_window_when_lease_is_lost(queue: WorkQueue) -> None:
+    collector = MagicMock(spec=FlightCollector)
+    queue.heartbeat = MagicMock(return_value=False)
+    queue.release = MagicMock()
+
+    def process_window(start: datetime, end: datetime, stop) -> None:
+        assert stop.wait(5)
+        raise ProcessingStoppedError("stopped")
+
+    collector.process_window.side_effect = process_window
+
+    assert work(queue, collector, "worker1", lease_s=0.03) == 0
+    assert collector.process_window.call_count == 3
+    queue.release.assert_not_called()
+    assert queue.counts()["done"] == 0
+
+
+def test_status_values_match_counts(queue: WorkQueue) -> None:
+    assert set(queue.counts()) == {status.value for status in WorkStatus}
@@ -34,3 +34,42 @@ def test_is_airport(airports_data: AirportData, icao: str, expected: bool) -> No
 )
 def test_get_location(airports_data: AirportData, icao: str, expected: Location) -> None:
     assert airports_data.get_location(icao) == expected
+
+
+def test_get_location_unknown_airport(airports_data: AirportData) -> None:
+    with pytest.raises(ValueError) as exc:
+        airports_data.get_location("XXXX")
+
+    assert str(exc.value) == "Unknown airport XXXX"
+
+
+@pytest.mark.parametrize(
+    "icaos, expected",
+    [
+        (["KAAF", "XXXX", "KA34", "YYYY"], ["KAAF", "KA34"]),
+        (["XXXX"], []),
+        ([], []),
+        (("KAAA" for _ in range(2)), ["KAAA", "KAAA"]),
+    ]
+)
+def test_filter_airports(airports_data: AirportData, icaos: list[str], expected: list[str]) -> None:
+    assert airports_data.filter_airports(icaos) == expected
+
+
+@pytest.mark.parametrize(
+    "location, max_distance_km, expected",
+    [
+        (Location(39.24, -119.55), 10, "KA34"),
+        (Location(29.7, -85.0), 10, "KAAF"),
+        (Location(29.0, -85.0), 10, None),
+        (Location(29.0, -85.0), 100, "KAAF"),
+    ]
+)
+def test_nearest_airport(airports_data: AirportData, location: Location, max_distance_km: float, expected: str | None) -> None:
+    assert airports_data.nearest_airport(location, max_distance_km) == expected
+
+
+def test_airports_within(airports_data: AirportData) -> None:
+    assert airports_data.airports_within(Location(39.0, -119.0), 100) == ["KA34"]
+    assert airports_data.airports_within(Location(39.0, -119.0), 1500) == ["KA34", "KA39", "KA50"]
+    assert airports_data.airports_within(Location(0, 0), 100) == []
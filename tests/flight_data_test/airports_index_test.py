@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from flight_data.airports_index import AirportIndex
+from common.models import Location
+
+
+@pytest.fixture
+def index() -> AirportIndex:
+    return AirportIndex(
+        np.array(["EPWA", "EPKK", "EGLL"]),
+        np.array([52.165833, 50.077778, 51.4775]),
+        np.array([20.967222, 19.784722, -0.461389]),
+    )
+
+
+def test_nearest(index: AirportIndex) -> None:
+    distances, idents = index.nearest(np.array([52.2, 50.1]), np.array([21.0, 19.8]))
+
+    assert idents.tolist() == [["EPWA"], ["EPKK"]]
+    assert distances[0, 0] == pytest.approx(Location(52.2, 21.0).distance_to(Location(52.165833, 20.967222)), rel=1e-6)
+    assert distances[1, 0] == pytest.approx(Location(50.1, 19.8).distance_to(Location(50.077778, 19.784722)), rel=1e-6)
+
+
+def test_nearest_k(index: AirportIndex) -> None:
+    distances, idents = index.nearest([52.2], [21.0], k=3)
+
+    assert idents.tolist() == [["EPWA", "EPKK", "EGLL"]]
+    assert np.all(np.diff(distances[0]) > 0)
+
+
+def test_within_radius(index: AirportIndex) -> None:
+    results = index.within_radius([52.2, 0.0], [21.0, 0.0], 300)
+
+    assert results[0][1].tolist() == ["EPWA", "EPKK"]
+    assert np.all(results[0][0] < 300)
+    assert results[1][1].tolist() == []
@@ -0,0 +1,81 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from flight_data.airports_data import AirportData
+from flight_data.airports_snapshot import compile_snapshot, default_snapshot_path, load_or_compile, load_snapshot
+
+TEST_CSV = "tests/flight_data_test/airports-test.csv"
+
+
+@pytest.fixture
+def csv_path(tmp_path) -> str:
+    path = str(tmp_path / "airports.csv")
+    shutil.copy(TEST_CSV, path)
+    return path
+
+
+def test_default_snapshot_path() -> None:
+    assert default_snapshot_path(os.path.join("data", "static", "airports.csv")) == os.path.join("data", "static", "airports.snapshot")
+
+
+def test_compile_and_load_snapshot(csv_path: str, tmp_path) -> None:
+    snapshot_path = str(tmp_path / "airports.snapshot")
+    compile_snapshot(csv_path, snapshot_path)
+
+    table = load_snapshot(snapshot_path)
+
+    assert table.idents.tolist() == [b"KA34", b"KA39", b"KA50", b"KAAA", b"KAAF", b"KAAO"]
+    assert table.latitudes.dtype == np.float64
+    assert table.latitudes[0] == 39.238581
+    assert table.longitudes[0] == -119.555023
+    assert table.elevations[4] == pytest.approx(6.096)
+    assert not table.latitudes.flags.writeable
+
+
+def test_load_snapshot_rejects_other_files(tmp_path) -> None:
+    path = tmp_path / "airports.snapshot"
+    path.write_bytes(b"\0" * 128)
+
+    with pytest.raises(ValueError):
+        load_snapshot(str(path))
+
+
+def test_load_or_compile_recompiles_when_csv_changes(csv_path: str) -> None:
+    assert len(load_or_compile(csv_path).idents) == 6
+    snapshot_mtime = os.stat(default_snapshot_path(csv_path)).st_mtime_ns
+
+    # Fresh snapshot is reused
+    load_or_compile(csv_path)
+    assert os.stat(default_snapshot_path(csv_path)).st_mtime_ns == snapshot_mtime
+
+    with open(csv_path, "a") as file:
+        file.write("\nZZZZ,10.0,1.5,2.5,\n")
+
+    table = load_or_compile(csv_path)
+    assert table.idents[-1] == b"ZZZZ"
+
+
+def test_airport_data_load_matches_csv(csv_path: str) -> None:
+    from_csv = AirportData(csv_path)
+    from_snapshot = AirportData.load(csv_path)
+
+    assert len(from_snapshot) == len(from_csv)
+    for icao in ("KA34", "KAAA", "KAAF"):
+        assert from_snapshot.is_airport(icao)
+        # Coordinates written to the output match those of the CSV exactly
+        assert from_snapshot.get_location(icao) == from_csv.get_location(icao)
+    assert not from_snapshot.is_airport("XXXX")
+    assert not from_snapshot.is_airport("KAAOX")
+    assert from_snapshot.filter_airports(["XXXX", "KAAO", "KAAOX", "A"]) == ["KAAO"]
+    assert from_snapshot.nearest_airport(from_csv.get_location("KAAF"), 1) == "KAAF"
+
+
+def test_airport_data_load_builds_lookup_dictionary_on_first_lookup(csv_path: str) -> None:
+    airports = AirportData.load(csv_path)
+    assert "_rows" not in vars(airports)
+
+    assert airports.is_airport("KAAA")
+    assert "_rows" in vars(airports)
@@ -1,7 +1,8 @@
+import numpy as np
 import pytest
 
 
-from flight_data.models import FlightDatapoint
+from flight_data.models import FlightDatapoint, FlightDatapointBatch
 from common.models import Location
 
 
@@ -40,3 +41,36 @@ def test_get_values(sample_flight):
     assert sample_flight.get_values() == expected_values
     assert len(sample_flight.get_values()) == 13
     assert isinstance(sample_flight.get_values(), list)
+
+
+def test_batch_round_trip(sample_flight: FlightDatapoint) -> None:
+    batch = FlightDatapointBatch.from_datapoints([sample_flight, sample_flight])
+
+    assert len(batch) == 2
+    assert batch.timestamp.dtype == np.int64
+    assert batch.to_datapoints() == [sample_flight, sample_flight]
+    assert FlightDatapointBatch.column_names() == sample_flight.get_attribute_names()
+
+
+def test_batch_concat_and_take(sample_flight: FlightDatapoint) -> None:
+    other_flight = FlightDatapoint(
+        location=Location(41.0, -74.0),
+        arrival_airport="LGA",
+        arrival_airport_location=Location(40.7769, -73.874),
+        timestamp=1635724900,
+        horizontal_speed=None,
+        altitude=1000.0,
+        vertical_speed=None,
+        heading=180.0,
+        distance_to_destination=20.0,
+        arrival_time=None,
+        time_to_arrival=None,
+    )
+    batch = FlightDatapointBatch.concat([
+        FlightDatapointBatch.from_datapoints([sample_flight]),
+        FlightDatapointBatch.from_datapoints([other_flight]),
+    ])
+
+    assert batch.to_datapoints() == [sample_flight, other_flight]
+    assert batch.take([1]).to_datapoints() == [other_flight]
+    assert len(FlightDatapointBatch.concat([])) == 0
@@ -1,13 +1,23 @@
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, patch, call
+import numpy as np
 import pytest
-from typing import Generator
+import requests
+import threading
+import time
+from typing import Any, Generator
 from opensky_api import FlightData as OpenSkyFlightData
 
 from flight_data.airports_data import AirportData
-from flight_data.flight_data import FlightData
+from flight_data.flight_data import FlightData, classify_api_error
 from flight_data.models import FlightInfo
-from config import OPENSKY_PASSWORD, OPENSKY_USERNAME
+from flight_data.track_cache import SQLiteTrackStore, TrackCacheStats
+from config import OPENSKY_PASSWORD, OPENSKY_REQUESTS_PER_SECOND, OPENSKY_USERNAME
+from common.coalescing import CoalescingStats
+from common.throttling import AdaptiveRateLimiter, CircuitBreaker, ErrorKind
 from common.models import Location
+from conftest import NOW, FakeClock
 
 
 @pytest.fixture
@@ -20,10 +30,18 @@ def mock_airports_data() -> MagicMock:
 
 @pytest.fixture
 def mock_opensky_api() -> Generator[MagicMock, None, None]:
-    with patch("flight_data.flight_data.OpenSkyApi") as mock:
+    with patch("flight_data.flight_data.OpenSkyClient") as mock:
         yield mock
 
 
+def assert_distances_to_destination_computed(mock_haversine_distance: MagicMock, latitudes: list[float], longitudes: list[float]) -> None:
+    mock_haversine_distance.assert_called_once()
+    called_latitudes, called_longitudes, *destination = mock_haversine_distance.call_args.args
+    np.testing.assert_array_equal(called_latitudes, latitudes)
+    np.testing.assert_array_equal(called_longitudes, longitudes)
+    assert destination == [10, 5]
+
+
 @pytest.fixture
 def flight_data(mock_airports_data: MagicMock, mock_opensky_api: MagicMock) -> FlightData:
     flight_data = FlightData(mock_airports_data)
@@ -41,28 +59,119 @@ def test_call_api_success(flight_data: FlightData, mock_opensky_api: MagicMock)
 
 def test_call_api_success_after_second_attempt(flight_data: FlightData, mock_opensky_api: MagicMock) -> None:
     mock_opensky_api.get_flights_from_interval.side_effect = [RuntimeError, "success"]
-    with patch("flight_data.flight_data.time.sleep") as mock_sleep:
-        flight_data._call_api(mock_opensky_api.get_flights_from_interval, "abc", test="def")
+    with (
+        patch("flight_data.flight_data.time.sleep") as mock_sleep,
+        patch("flight_data.flight_data.backoff_delay", return_value=1.5) as mock_backoff_delay,
+    ):
+        assert flight_data._call_api(mock_opensky_api.get_flights_from_interval, "abc", test="def") == "success"
 
     assert mock_opensky_api.get_flights_from_interval.call_args_list == [
         call("abc", test="def"),
         call("abc", test="def"),
     ]
-    mock_sleep.assert_called_once_with(960)
+    mock_backoff_delay.assert_called_once_with(0, FlightData.RETRY_BASE_DELAY, FlightData.RETRY_MAX_DELAY)
+    mock_sleep.assert_called_once_with(1.5)
+    assert flight_data.api_stats.calls == 2
+    assert flight_data.api_stats.retries == 1
+    assert flight_data.api_stats.backoff_wait_s == 1.5
+
+
+@contextmanager
+def retries_on_clock(flight_data: FlightData, clock: FakeClock) -> Generator[MagicMock, None, None]:
+    """Runs the retries of flight_data on a fake clock that sleeping advances"""
+    flight_data.circuit_breaker = CircuitBreaker(FlightData.CIRCUIT_FAILURE_THRESHOLD, FlightData.CIRCUIT_RESET_TIMEOUT, clock)
+    flight_data.rate_limiter = AdaptiveRateLimiter(OPENSKY_REQUESTS_PER_SECOND, clock=clock)
+    with patch("flight_data.flight_data.time") as mock_time:
+        mock_time.monotonic.side_effect = clock
+        mock_time.sleep.side_effect = lambda delay: setattr(clock, "now", clock.now + delay)
+        yield mock_time
 
 
-def test_call_api_raises_error(flight_data: FlightData, mock_opensky_api: MagicMock) -> None:
-    mock_opensky_api.get_flights_from_interval.side_effect = RuntimeError
-    with patch("flight_data.flight_data.time.sleep") as mock_sleep, pytest.raises(RuntimeError) as exc:
+@pytest.fixture
+def outage(flight_data: FlightData, clock: FakeClock) -> Generator[MagicMock, None, None]:
+    with retries_on_clock(flight_data, clock) as mock_time:
+        yield mock_time
+
+
+def test_call_api_raises_error_after_retry_budget(flight_data: FlightData, mock_opensky_api: MagicMock, outage: MagicMock, clock: FakeClock) -> None:
+    mock_opensky_api.get_flights_from_interval.side_effect = requests.Timeout()
+
+    with pytest.raises(RuntimeError, match=f"within {FlightData.RETRY_BUDGET_S} s"):
         flight_data._call_api(mock_opensky_api.get_flights_from_interval, "abc", test="def")
 
-    assert mock_opensky_api.get_flights_from_interval.call_args_list == [
-        call("abc", test="def"),
-        call("abc", test="def"),
-        call("abc", test="def"),
+    assert clock.now - NOW <= FlightData.RETRY_BUDGET_S
+    assert mock_opensky_api.get_flights_from_interval.call_count > FlightData.CIRCUIT_FAILURE_THRESHOLD
+
+
+def test_call_api_recovers_after_long_outage(flight_data: FlightData, mock_opensky_api: MagicMock, outage: MagicMock, clock: FakeClock) -> None:
+    outage_s = 1800
+    mock_opensky_api.get_flights_from_interval.side_effect = lambda *_: (
+        "success" if clock.now >= NOW + outage_s else (_ for _ in ()).throw(requests.Timeout())
+    )
+
+    assert flight_data._call_api(mock_opensky_api.get_flights_from_interval, "abc") == "success"
+
+    # The open circuit was waited out, so the recovery was noticed within one reset timeout
+    assert NOW + outage_s <= clock.now <= NOW + outage_s + FlightData.CIRCUIT_RESET_TIMEOUT
+    assert not flight_data.circuit_breaker.is_open
+    assert flight_data.api_stats.backoff_wait_s == pytest.approx(clock.now - NOW)
+
+
+def http_error(status_code: int, headers: dict[str, str] | None = None) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return requests.HTTPError(response=response)
+
+
+@pytest.mark.parametrize(
+    "error, expected_kind",
+    [
+        (http_error(429), ErrorKind.RATE_LIMITED),
+        (http_error(503), ErrorKind.SERVER),
+        (http_error(404), ErrorKind.PERMANENT),
+        (ValueError("interval too long"), ErrorKind.PERMANENT),
+        (requests.JSONDecodeError("Unterminated string", '{"icao24": "', 11), ErrorKind.TRANSIENT),
+        (requests.Timeout(), ErrorKind.TRANSIENT),
+        (requests.ConnectionError(), ErrorKind.TRANSIENT),
+        (RuntimeError(), ErrorKind.TRANSIENT),
     ]
-    assert mock_sleep.call_args_list == [call(960), call(960), call(960)]
-    assert str(exc.value) == "Failed to get flight data after 3 attempts"
+)
+def test_classify_api_error(error: Exception, expected_kind: ErrorKind) -> None:
+    assert classify_api_error(error) == expected_kind
+
+
+def test_call_api_does_not_retry_permanent_errors(flight_data: FlightData, mock_opensky_api: MagicMock) -> None:
+    mock_opensky_api.get_flights_from_interval.side_effect = ValueError("interval too long")
+    with patch("flight_data.flight_data.time.sleep") as mock_sleep, pytest.raises(ValueError):
+        flight_data._call_api(mock_opensky_api.get_flights_from_interval, "abc")
+
+    mock_opensky_api.get_flights_from_interval.assert_called_once_with("abc")
+    mock_sleep.assert_not_called()
+
+
+def test_call_api_slows_down_when_rate_limited(flight_data: FlightData, mock_opensky_api: MagicMock) -> None:
+    mock_opensky_api.get_flights_from_interval.side_effect = [
+        http_error(429, {"X-Rate-Limit-Retry-After-Seconds": "42"}),
+        "success",
+    ]
+    with patch("flight_data.flight_data.time.sleep") as mock_sleep:
+        assert flight_data._call_api(mock_opensky_api.get_flights_from_interval, "abc") == "success"
+
+    mock_sleep.assert_called_once_with(42.0)
+    assert flight_data.rate_limiter.rate < OPENSKY_REQUESTS_PER_SECOND
+    assert flight_data.api_stats.rate_limited == 1
+
+
+def test_call_api_waits_for_open_circuit(flight_data: FlightData, mock_opensky_api: MagicMock, outage: MagicMock, clock: FakeClock) -> None:
+    for _ in range(FlightData.CIRCUIT_FAILURE_THRESHOLD):
+        flight_data.circuit_breaker.record_failure()
+    clock.now += 100
+
+    assert flight_data._call_api(mock_opensky_api.get_flights_from_interval, "abc")
+
+    outage.sleep.assert_called_once_with(FlightData.CIRCUIT_RESET_TIMEOUT - 100)
+    mock_opensky_api.get_flights_from_interval.assert_called_once_with("abc")
 
 
 def test_get_flights_success(flight_data: FlightData, mock_airports_data: MagicMock) -> None:
@@ -129,6 +238,12 @@ def test_get_flights_no_data(flight_data: FlightData, mock_airports_data: MagicM
     mock_airports_data.is_airport.assert_not_called()
 
 
+def test_get_flights_confirmed_no_data(flight_data: FlightData, mock_opensky_api: MagicMock) -> None:
+    mock_opensky_api.return_value.confirms_missing_data = True
+    flight_data._call_api = MagicMock(return_value=None)
+
+    assert flight_data.get_flights(1, 2) == []
+
 
 def test_get_flight_datapoints_no_data(flight_data: FlightData, mock_airports_data: MagicMock) -> None:
     flight_data._call_api = MagicMock(return_value=None)
@@ -144,25 +259,22 @@ def test_get_flight_datapoints_arrival_time_too_big_distance_to_destination(flig
     raw_flight_data = MagicMock(path=[(1635728300, 0, 0, 0, 0, False), (1635728400, 0, 1, 0, 0, False)])
     flight_data._call_api = MagicMock(return_value=raw_flight_data)
     flight_info = FlightInfo("flight1", 1635728300, "JFK", "ABC123")
-    with patch("flight_data.flight_data.Location.distance_to") as mock_distance_to:
-        mock_distance_to.return_value = 50
+    with patch("flight_data.track_engine.haversine_distance") as mock_haversine_distance:
+        mock_haversine_distance.return_value = np.array([50, 50])
         datapoints = flight_data.get_flight_datapoints(flight_info)
 
     assert datapoints is None
     flight_data._call_api.assert_called_once_with(flight_data._api.get_track_by_aircraft, "flight1", 1635728300)
     mock_airports_data.get_location.assert_called_once_with("JFK")
-    assert mock_distance_to.call_args_list == [
-        call(Location(10, 5)),
-        call(Location(10, 5)),
-    ]
+    assert_distances_to_destination_computed(mock_haversine_distance, [0, 0], [0, 1])
 
 
 def test_get_flight_datapoints_success(flight_data: FlightData, mock_airports_data: MagicMock) -> None:
     raw_flight_data = MagicMock(path=[(1635728300, 0, 0, 100, 0, False), (1635728400, 0, 1, 50, 20, False), (1635728500, 1, 1, 0, 30, False)])
     flight_data._call_api = MagicMock(return_value=raw_flight_data)
     flight_info = FlightInfo("flight1", 1635728300, "JFK", "ABC123")
-    with patch("flight_data.flight_data.Location.distance_to") as mock_distance_to:
-        mock_distance_to.side_effect = [30, 15, 5]
+    with patch("flight_data.track_engine.haversine_distance") as mock_haversine_distance:
+        mock_haversine_distance.return_value = np.array([30, 15, 5])
         datapoints = flight_data.get_flight_datapoints(flight_info)
 
     assert len(datapoints) == 2
@@ -192,11 +304,7 @@ def test_get_flight_datapoints_success(flight_data: FlightData, mock_airports_da
 
     flight_data._call_api.assert_called_once_with(flight_data._api.get_track_by_aircraft, "flight1", 1635728300)
     mock_airports_data.get_location.assert_called_once_with("JFK")
-    assert mock_distance_to.call_args_list == [
-        call(Location(10, 5)),
-        call(Location(10, 5)),
-        call(Location(10, 5)),
-    ]
+    assert_distances_to_destination_computed(mock_haversine_distance, [0, 0, 1], [0, 1, 1])
 
 
 def test_get_flight_datapoints_success_with_skip(flight_data: FlightData, mock_airports_data: MagicMock) -> None:
@@ -204,8 +312,8 @@ def test_get_flight_datapoints_success_with_skip(flight_data: FlightData, mock_a
         path=[(1635728300, 0, 0, 100, 0, False), (1635728350, 0, 0.5, 90, 10, False), (1635728400, 0, 1, 50, 20, False), (1635728500, 1, 1, 0, 30, False)])
     flight_data._call_api = MagicMock(return_value=raw_flight_data)
     flight_info = FlightInfo("flight1", 1635728300, "JFK", "ABC123")
-    with patch("flight_data.flight_data.Location.distance_to") as mock_distance_to:
-        mock_distance_to.side_effect = [30, 25, 15, 5]
+    with patch("flight_data.track_engine.haversine_distance") as mock_haversine_distance:
+        mock_haversine_distance.return_value = np.array([30, 25, 15, 5])
         datapoints = flight_data.get_flight_datapoints(flight_info)
 
     assert len(datapoints) == 2
@@ -235,9 +343,128 @@ def test_get_flight_datapoints_success_with_skip(flight_data: FlightData, mock_a
 
     flight_data._call_api.assert_called_once_with(flight_data._api.get_track_by_aircraft, "flight1", 1635728300)
     mock_airports_data.get_location.assert_called_once_with("JFK")
-    assert mock_distance_to.call_args_list == [
-        call(Location(10, 5)),
-        call(Location(10, 5)),
-        call(Location(10, 5)),
-        call(Location(10, 5)),
+    assert_distances_to_destination_computed(mock_haversine_distance, [0, 0, 0, 1], [0, 0.5, 1, 1])
+
+
+def test_get_flights_keeps_flights_without_arrival_airport_when_inferring(mock_airports_data: MagicMock, mock_opensky_api: MagicMock) -> None:
+    flight_data = FlightData(mock_airports_data, infer_arrival_airport=True)
+    raw_flight_info = [
+        OpenSkyFlightData(["flight1", 0, "", 1635728300, "JFK", "ABC123", 0, 0, 0, 0, 0, 0]),
+        OpenSkyFlightData(["flight2", 0, "", 1635728400, None, "DEF456", 0, 0, 0, 0, 0, 0]),
+        OpenSkyFlightData(["flight3", 0, "", 1635728500, "INVALID", None, 0, 0, 0, 0, 0, 0]),
+    ]
+    flight_data._call_api = MagicMock(return_value=raw_flight_info)
+
+    assert flight_data.get_flights(1, 2) == [
+        FlightInfo(icao24="flight1", last_seen=1635728300, arrival_airport="JFK", call_sign="ABC123"),
+        FlightInfo(icao24="flight2", last_seen=1635728400, arrival_airport=None, call_sign="DEF456"),
     ]
+    assert mock_airports_data.is_airport.call_args_list == [call("JFK"), call("INVALID")]
+
+
+def test_get_flight_datapoints_infers_arrival_airport(flight_data: FlightData, mock_airports_data: MagicMock) -> None:
+    mock_airports_data.nearest_airport.return_value = "JFK"
+    raw_flight_data = MagicMock(path=[(1635728300, 0, 0, 100, 0, False), (1635728400, 9.95, 5, 0, 20, True)])
+    flight_data._call_api = MagicMock(return_value=raw_flight_data)
+    flight_info = FlightInfo("flight1", 1635728300, None, "ABC123")
+    with patch("flight_data.track_engine.haversine_distance") as mock_haversine_distance:
+        mock_haversine_distance.return_value = np.array([30, 5])
+        datapoints = flight_data.get_flight_datapoints(flight_info)
+
+    assert len(datapoints) == 1
+    assert datapoints[0].arrival_airport == "JFK"
+    assert datapoints[0].arrival_time == 1635728400
+    mock_airports_data.nearest_airport.assert_called_once_with(Location(9.95, 5), FlightData.THRESHOLD_DISTANCE_KM)
+    mock_airports_data.get_location.assert_called_once_with("JFK")
+
+
+def test_get_flight_datapoints_no_airport_near_track_end(flight_data: FlightData, mock_airports_data: MagicMock) -> None:
+    mock_airports_data.nearest_airport.return_value = None
+    raw_flight_data = MagicMock(path=[(1635728300, 0, 0, 100, 0, False), (1635728400, 0, 1, 50, 20, False)])
+    flight_data._call_api = MagicMock(return_value=raw_flight_data)
+    flight_info = FlightInfo("flight1", 1635728300, None, "ABC123")
+
+    assert flight_data.get_flight_datapoints(flight_info) is None
+    mock_airports_data.nearest_airport.assert_called_once_with(Location(0, 1), FlightData.THRESHOLD_DISTANCE_KM)
+    mock_airports_data.get_location.assert_not_called()
+
+
+def test_get_flight_datapoint_batch_coalesces_concurrent_track_requests(flight_data: FlightData, mock_airports_data: MagicMock) -> None:
+    started = threading.Event()
+    release = threading.Event()
+
+    def get_track(*_: Any) -> None:
+        started.set()
+        release.wait(5)
+        return None
+
+    flight_data._call_api = MagicMock(side_effect=get_track)
+    flight_info = FlightInfo("flight1", 1635728300, "JFK", "ABC123")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        leader = executor.submit(flight_data.get_flight_datapoint_batch, flight_info)
+        started.wait(5)
+        followers = [executor.submit(flight_data.get_flight_datapoint_batch, flight_info) for _ in range(2)]
+        while flight_data.track_requests.stats.coalesced < 2:
+            time.sleep(0.001)
+        release.set()
+
+        assert [future.result() for future in [leader, *followers]] == [None, None, None]
+
+    flight_data._call_api.assert_called_once_with(flight_data._api.get_track_by_aircraft, "flight1", 1635728300)
+    assert flight_data.track_requests.stats == CoalescingStats(calls=1, coalesced=2)
+
+
+def test_get_flight_datapoint_batch_reads_tracks_from_track_cache(mock_airports_data: MagicMock, mock_opensky_api: MagicMock, tmp_path) -> None:
+    track_cache = SQLiteTrackStore(str(tmp_path / "tracks.sqlite"))
+    flight_data = FlightData(mock_airports_data, track_cache=track_cache)
+    path = [(1635728000 + 600 * i, 8.0 + i, 5.0, 1000.0 * (2 - i), 0.0, False) for i in range(3)]
+    mock_opensky_api.return_value.get_track_by_aircraft.return_value = MagicMock(path=path)
+    flight_info = FlightInfo("flight1", 1635729200, "JFK", "ABC123")
+
+    first = flight_data.get_flight_datapoint_batch(flight_info)
+    second = flight_data.get_flight_datapoint_batch(flight_info)
+
+    mock_opensky_api.return_value.get_track_by_aircraft.assert_called_once_with("flight1", 1635729200)
+    assert first.to_datapoints() == second.to_datapoints()
+    assert track_cache.stats == TrackCacheStats(hits=1, misses=1)
+
+
+def test_get_flight_datapoint_batch_caches_missing_tracks(mock_airports_data: MagicMock, mock_opensky_api: MagicMock, tmp_path) -> None:
+    track_cache = SQLiteTrackStore(str(tmp_path / "tracks.sqlite"))
+    mock_opensky_api.return_value.confirms_missing_data = True
+    flight_data = FlightData(mock_airports_data, track_cache=track_cache)
+    mock_opensky_api.return_value.get_track_by_aircraft.return_value = None
+    flight_info = FlightInfo("flight1", 1635729200, "JFK", "ABC123")
+
+    assert flight_data.get_flight_datapoint_batch(flight_info) is None
+    assert flight_data.get_flight_datapoint_batch(flight_info) is None
+
+    mock_opensky_api.return_value.get_track_by_aircraft.assert_called_once()
+    assert track_cache.stats == TrackCacheStats(negative_hits=1, misses=1)
+
+
+def test_get_flight_datapoint_batch_does_not_cache_unconfirmed_missing_tracks(mock_airports_data: MagicMock, tmp_path) -> None:
+    track_cache = SQLiteTrackStore(str(tmp_path / "tracks.sqlite"))
+    api = MagicMock(spec=["get_track_by_aircraft"])
+    api.get_track_by_aircraft.return_value = None
+    flight_data = FlightData(mock_airports_data, api=api, track_cache=track_cache)
+    flight_info = FlightInfo("flight1", 1635729200, "JFK", "ABC123")
+
+    assert flight_data.get_flight_datapoint_batch(flight_info) is None
+    assert flight_data.get_flight_datapoint_batch(flight_info) is None
+
+    assert api.get_track_by_aircraft.call_count == 2
+    assert len(track_cache) == 0
+
+
+def test_get_flight_datapoint_batch_does_not_cache_failed_track_requests(mock_airports_data: MagicMock, tmp_path, clock: FakeClock) -> None:
+    track_cache = SQLiteTrackStore(str(tmp_path / "tracks.sqlite"))
+    api = MagicMock(confirms_missing_data=True)
+    api.get_track_by_aircraft.side_effect = requests.ConnectionError
+    flight_data = FlightData(mock_airports_data, api=api, track_cache=track_cache)
+
+    with retries_on_clock(flight_data, clock), pytest.raises(RuntimeError):
+        flight_data.get_flight_datapoint_batch(FlightInfo("flight1", 1635729200, "JFK", "ABC123"))
+
+    assert len(track_cache) == 0
@@ -0,0 +1,73 @@
+from unittest.mock import MagicMock, patch
+import pytest
+import requests
+from requests_mock.mocker import Mocker
+
+from flight_data.flight_data import FlightData
+from flight_data.opensky_client import OpenSkyClient
+
+API_URL = "https://opensky-network.org/api"
+TRACKS_URL = f"{API_URL}/tracks/all"
+
+
+@pytest.fixture
+def client() -> OpenSkyClient:
+    client = OpenSkyClient(username="user", password="secret")
+    client._api_url = API_URL
+    client._auth = ("user", "secret")
+    return client
+
+
+def get_track(client: OpenSkyClient) -> dict | None:
+    return client._get_json("/tracks/all", client.get_track_by_aircraft, params={"icao24": "abc123", "time": 0})
+
+
+def test_get_json_returns_response(client: OpenSkyClient, requests_mock: Mocker) -> None:
+    requests_mock.get(TRACKS_URL, json={"icao24": "abc123", "path": []})
+
+    assert get_track(client) == {"icao24": "abc123", "path": []}
+    assert requests_mock.last_request.qs == {"icao24": ["abc123"], "time": ["0"]}
+    assert requests_mock.last_request.headers["Authorization"].startswith("Basic ")
+
+
+def test_get_json_returns_none_without_data(client: OpenSkyClient, requests_mock: Mocker) -> None:
+    requests_mock.get(TRACKS_URL, status_code=404)
+
+    assert get_track(client) is None
+
+
+@pytest.mark.parametrize("status_code", [400, 429, 500, 503])
+def test_get_json_raises_http_errors(client: OpenSkyClient, requests_mock: Mocker, status_code: int) -> None:
+    requests_mock.get(TRACKS_URL, status_code=status_code)
+
+    with pytest.raises(requests.HTTPError) as error:
+        get_track(client)
+    assert error.value.response.status_code == status_code
+
+
+def test_get_json_raises_decode_error_for_truncated_body(client: OpenSkyClient, requests_mock: Mocker) -> None:
+    requests_mock.get(TRACKS_URL, text='{"icao24": "abc')
+
+    with pytest.raises(requests.JSONDecodeError):
+        get_track(client)
+
+
+@pytest.mark.parametrize(
+    "first_response",
+    [
+        {"status_code": 429, "headers": {"Retry-After": "2"}},
+        {"status_code": 503},
+        {"text": '{"icao24": "abc'},
+    ]
+)
+def test_flight_data_retries_failed_responses(client: OpenSkyClient, requests_mock: Mocker, first_response: dict) -> None:
+    requests_mock.get(TRACKS_URL, [first_response, {"json": {"icao24": "abc123", "path": []}}])
+    flight_data = FlightData(MagicMock(), api=client)
+
+    with patch("flight_data.flight_data.time.sleep") as mock_sleep:
+        assert flight_data._call_api(get_track, client) == {"icao24": "abc123", "path": []}
+
+    assert requests_mock.call_count == 2
+    mock_sleep.assert_called_once()
+    assert flight_data.api_stats.retries == 1
+    assert flight_data.api_stats.rate_limited == (1 if first_response.get("status_code") == 429 else 0)
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from common.recording import ReplayStats, ResponseArchive
+from flight_data.replay import RecordingOpenSkyApi, ReplayOpenSkyApi
+
+
+@pytest.fixture
+def archive(tmp_path) -> ResponseArchive:
+    return ResponseArchive(str(tmp_path / "archive.sqlite"))
+
+
+def test_recorded_responses_are_replayed(archive: ResponseArchive) -> None:
+    api = MagicMock()
+    api.get_flights_from_interval.return_value = [SimpleNamespace(icao24="abc", lastSeen=100, estArrivalAirport="JFK")]
+    api.get_track_by_aircraft.side_effect = [SimpleNamespace(icao24="abc", path=[[90, 1.0, 2.0, 300.0, 45.0, False]]), None]
+    recorder = RecordingOpenSkyApi(api, archive)
+
+    recorded_flights = recorder.get_flights_from_interval(0, 7200)
+    recorder.get_track_by_aircraft("abc", 100)
+    recorder.get_track_by_aircraft("def", 200)
+
+    replay = ReplayOpenSkyApi(archive)
+    assert replay.get_flights_from_interval(0, 7200) == recorded_flights
+    assert replay.get_track_by_aircraft("abc", 100).path == [[90, 1.0, 2.0, 300.0, 45.0, False]]
+    assert replay.get_track_by_aircraft("def", 200) is None
+    assert replay.stats == ReplayStats(hits=2, misses=1)
+
+
+def test_responses_without_data_are_not_recorded(archive: ResponseArchive) -> None:
+    api = MagicMock()
+    api.get_flights_from_interval.return_value = None
+    api.get_track_by_aircraft.return_value = None
+    recorder = RecordingOpenSkyApi(api, archive)
+
+    assert recorder.get_flights_from_interval(0, 7200) is None
+    assert recorder.get_track_by_aircraft("abc", 100) is None
+
+    assert len(archive) == 0
+
+
+def test_failed_calls_are_not_recorded(archive: ResponseArchive) -> None:
+    api = MagicMock()
+    api.get_track_by_aircraft.side_effect = RuntimeError("timeout")
+
+    with pytest.raises(RuntimeError):
+        RecordingOpenSkyApi(api, archive).get_track_by_aircraft("abc", 100)
+
+    assert len(archive) == 0
+
+
+def test_calls_that_were_not_recorded_return_none(archive: ResponseArchive) -> None:
+    replay = ReplayOpenSkyApi(archive)
+
+    assert replay.get_flights_from_interval(0, 7200) is None
+    assert replay.stats == ReplayStats(misses=1)
+
+
+def test_replay_injects_latency(archive: ResponseArchive) -> None:
+    replay = ReplayOpenSkyApi(archive, latency_s=0.25)
+
+    with patch("flight_data.replay.time.sleep") as mock_sleep:
+        replay.get_track_by_aircraft("abc", 100)
+
+    mock_sleep.assert_called_once_with(0.25)
+
+
+@pytest.mark.parametrize("api, confirms_missing_data", [
+    (MagicMock(confirms_missing_data=True), True),
+    (MagicMock(spec=["get_track_by_aircraft"]), False),
+])
+def test_recorder_confirms_missing_data_like_its_client(archive: ResponseArchive, api: MagicMock, confirms_missing_data: bool) -> None:
+    assert RecordingOpenSkyApi(api, archive).confirms_missing_data is confirms_missing_data
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from flight_data.track_cache import SQLiteTrackStore, TrackCacheStats
+from flight_data.track_engine import TrackColumns
+
+from conftest import NOW, FakeClock
+
+
+@pytest.fixture
+def store(tmp_path, clock: FakeClock) -> SQLiteTrackStore:
+    return SQLiteTrackStore(str(tmp_path / "tracks.sqlite"), negative_ttl_s=600, clock=clock)
+
+
+def make_track(points: int = 3) -> TrackColumns:
+    return TrackColumns.from_path([
+        (1635728000 + 60 * i, 10.5 + i / 7, 5.25 - i / 3, 1000.0 * i, None if i == 1 else 90.0)
+        for i in range(points)
+    ])
+
+
+def assert_tracks_equal(actual: TrackColumns, expected: TrackColumns) -> None:
+    for actual_column, expected_column in zip(actual, expected):
+        np.testing.assert_array_equal(actual_column, expected_column)
+        assert actual_column.dtype == expected_column.dtype
+
+
+def test_round_trip(store: SQLiteTrackStore) -> None:
+    track = make_track()
+    assert store.lookup(("abc", 1)) == (False, None)
+
+    store.put(("abc", 1), track)
+
+    cached, cached_track = store.lookup(("abc", 1))
+    assert cached
+    assert_tracks_equal(cached_track, track)
+    assert len(store) == 1
+    assert store.stats == TrackCacheStats(hits=1, misses=1)
+    assert store.stats.hit_rate == 0.5
+
+
+def test_empty_track_round_trip(store: SQLiteTrackStore) -> None:
+    store.put(("abc", 1), make_track(0))
+
+    cached, track = store.lookup(("abc", 1))
+    assert cached
+    assert len(track) == 0
+
+
+def test_missing_tracks_expire(store: SQLiteTrackStore, clock: FakeClock) -> None:
+    store.put(("abc", 1), None)
+    assert store.lookup(("abc", 1)) == (True, None)
+
+    clock.now += 600
+
+    assert store.lookup(("abc", 1)) == (False, None)
+    assert store.stats == TrackCacheStats(negative_hits=1, misses=1)
+
+
+def test_tracks_expire_after_max_age(tmp_path, clock: FakeClock) -> None:
+    store = SQLiteTrackStore(str(tmp_path / "tracks.sqlite"), max_age_s=3600, clock=clock)
+    store.put(("abc", 1), make_track())
+    clock.now += 3600
+
+    assert store.lookup(("abc", 1)) == (False, None)
+    assert store.evict() == 1
+    assert len(store) == 0
+
+
+def test_evict_removes_least_recently_used_tracks_over_max_bytes(tmp_path, clock: FakeClock) -> None:
+    store = SQLiteTrackStore(str(tmp_path / "tracks.sqlite"), clock=clock)
+    for i in range(3):
+        store.put(("abc", i), make_track(10))
+        clock.now += 1
+    clock.now += store.touch_interval_s
+    store.lookup(("abc", 0))
+    store.max_bytes = 2 * store.size_bytes() // 3
+
+    assert store.evict() == 1
+
+    assert store.lookup(("abc", 1)) == (False, None)
+    assert store.lookup(("abc", 0))[0]
+    assert store.lookup(("abc", 2))[0]
+
+
+def test_lookup_updates_access_time_at_most_once_per_touch_interval(tmp_path, clock: FakeClock) -> None:
+    store = SQLiteTrackStore(str(tmp_path / "tracks.sqlite"), touch_interval_s=60, clock=clock)
+    store.put(("abc", 0), make_track())
+    store.put(("abc", 1), make_track())
+
+    def accessed_at() -> list[float]:
+        return [row[0] for row in store._connection().execute("SELECT accessed_at FROM tracks ORDER BY last_seen")]
+
+    clock.now += 59
+    store.lookup(("abc", 0))
+    assert accessed_at() == [NOW, NOW]
+
+    clock.now += 1
+    store.lookup(("abc", 0))
+    store.lookup(("abc", 1))
+    assert accessed_at() == [NOW + 60, NOW + 60]
+
+
+def test_store_is_shared_between_instances(tmp_path, clock: FakeClock) -> None:
+    path = str(tmp_path / "tracks.sqlite")
+    SQLiteTrackStore(path, clock=clock).put(("abc", 1), make_track())
+
+    cached, track = SQLiteTrackStore(path, clock=clock).lookup(("abc", 1))
+
+    assert cached
+    assert_tracks_equal(track, make_track())
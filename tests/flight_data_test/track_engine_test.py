@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from common.models import Location
+from common.utils import calculate_speed
+from flight_data.models import FlightDatapoint
+from flight_data.track_engine import TrackColumns, build_datapoint_batch, downsample_indices
+
+DESTINATION = Location(52.165833, 20.967222)
+
+
+def reference_datapoints(path: list[tuple], ignore_min_distance: bool = False) -> list[FlightDatapoint] | None:
+    """Per-point loop the engine replaces"""
+    distances = [Location(point[1], point[2]).distance_to(DESTINATION) for point in path]
+    arrival_time = None
+    for i, point in enumerate(path):
+        if distances[i] < 10:
+            arrival_time = point[0]
+            distances, path = distances[:i + 1], path[:i + 1]
+            break
+    if arrival_time is None and not ignore_min_distance:
+        return None
+    if ignore_min_distance:
+        arrival_time = None
+
+    datapoints = []
+    last = 0
+    for i in range(1, len(path)):
+        if path[i][0] - path[last][0] < 60:
+            continue
+        datapoints.append(FlightDatapoint(
+            location=Location(path[i][1], path[i][2]),
+            arrival_airport="EPWA",
+            arrival_airport_location=DESTINATION,
+            timestamp=path[i][0],
+            horizontal_speed=calculate_speed(distances[i] - distances[last], path[i][0] - path[last][0]),
+            altitude=path[i][3],
+            vertical_speed=calculate_speed((path[i][3] - path[last][3]) / 1000, path[i][0] - path[last][0]),
+            heading=path[i][4],
+            distance_to_destination=distances[i],
+            arrival_time=arrival_time,
+            time_to_arrival=arrival_time - path[i][0] if arrival_time is not None else None,
+        ))
+        last = i
+    return datapoints
+
+
+def random_path(seed: int, size: int) -> list[tuple]:
+    """Track approaching the destination with irregular sampling"""
+    rng = np.random.default_rng(seed)
+    times = 1_700_000_000 + np.cumsum(rng.integers(1, 40, size))
+    progress = np.linspace(0, 1, size)
+    latitudes = 50.0 + progress * (DESTINATION.latitude - 50.0)
+    longitudes = 15.0 + progress * (DESTINATION.longitude - 15.0)
+    altitudes = rng.uniform(0, 12000, size)
+    headings = rng.uniform(0, 360, size)
+    return [
+        (int(t), float(lat), float(lon), float(alt), float(heading), False)
+        for t, lat, lon, alt, heading in zip(times, latitudes, longitudes, altitudes, headings)
+    ]
+
+
+def test_track_columns_from_path() -> None:
+    track = TrackColumns.from_path([(100, 1.5, 2.5, 300, 90, False), (160, 1.6, None, 200, 95, True)])
+
+    assert track.times.tolist() == [100, 160]
+    assert track.times.dtype == np.int64
+    assert track.latitudes.tolist() == [1.5, 1.6]
+    assert track.longitudes[0] == 2.5 and np.isnan(track.longitudes[1])
+    assert track.altitudes.tolist() == [300, 200]
+    assert track.headings.tolist() == [90, 95]
+
+
+def test_track_columns_from_empty_path() -> None:
+    track = TrackColumns.from_path([])
+
+    assert len(track) == 0
+    assert build_datapoint_batch(track, "EPWA", DESTINATION, 10, ignore_min_distance=True).to_datapoints() == []
+
+
+@pytest.mark.parametrize(
+    "times, expected",
+    [
+        ([0, 30, 60, 90, 130, 200], [0, 2, 4, 5]),
+        ([0, 59, 119, 120, 180], [0, 2, 4]),
+        ([0, 10, 20], [0]),
+        ([0], [0]),
+        ([], []),
+        # Unordered tracks fall back to a sequential scan
+        ([0, 70, 30, 140, 200], [0, 1, 3, 4]),
+    ]
+)
+def test_downsample_indices(times: list[int], expected: list[int]) -> None:
+    assert downsample_indices(np.array(times, dtype=np.int64), 60).tolist() == expected
+
+
+@pytest.mark.parametrize("seed, size", [(0, 10), (1, 500), (2, 3000)])
+@pytest.mark.parametrize("ignore_min_distance", [False, True])
+def test_build_datapoint_batch_matches_reference(seed: int, size: int, ignore_min_distance: bool) -> None:
+    path = random_path(seed, size)
+
+    batch = build_datapoint_batch(TrackColumns.from_path(path), "EPWA", DESTINATION, 10, ignore_min_distance=ignore_min_distance)
+    expected = reference_datapoints(path, ignore_min_distance)
+
+    datapoints = batch.to_datapoints()
+    assert len(datapoints) == len(expected) == len(batch)
+    for datapoint, expected_datapoint in zip(datapoints, expected):
+        assert datapoint.timestamp == expected_datapoint.timestamp
+        assert datapoint.location == expected_datapoint.location
+        assert datapoint.arrival_airport == "EPWA"
+        assert datapoint.arrival_airport_location == DESTINATION
+        assert datapoint.altitude == expected_datapoint.altitude
+        assert datapoint.heading == expected_datapoint.heading
+        assert datapoint.distance_to_destination == pytest.approx(expected_datapoint.distance_to_destination, rel=1e-9)
+        assert datapoint.horizontal_speed == pytest.approx(expected_datapoint.horizontal_speed, rel=1e-6, abs=1e-6)
+        assert datapoint.vertical_speed == pytest.approx(expected_datapoint.vertical_speed, rel=1e-9)
+        assert datapoint.arrival_time == expected_datapoint.arrival_time
+        assert datapoint.time_to_arrival == expected_datapoint.time_to_arrival
+
+
+def test_build_datapoint_batch_not_arrived() -> None:
+    path = [(0, 0.0, 0.0, 100, 0, False), (100, 0.0, 1.0, 100, 0, False)]
+
+    assert build_datapoint_batch(TrackColumns.from_path(path), "EPWA", DESTINATION, 10) is None
+
+
+def test_build_datapoint_batch_missing_arrival_time() -> None:
+    path = [(0, 0.0, 0.0, 100, 0, False), (100, 0.0, 1.0, 50, 0, False)]
+
+    batch = build_datapoint_batch(TrackColumns.from_path(path), "EPWA", DESTINATION, 10, ignore_min_distance=True)
+
+    assert len(batch) == 1
+    assert np.isnan(batch.arrival_time[0]) and np.isnan(batch.time_to_arrival[0])
+    datapoint = batch.to_datapoints()[0]
+    assert datapoint.arrival_time is None
+    assert datapoint.time_to_arrival is None
+    assert isinstance(datapoint.timestamp, int)
+
+
+@pytest.mark.parametrize("min_interval", [0, -60])
+def test_downsample_indices_keeps_all_points_without_positive_interval(min_interval: int) -> None:
+    times = np.array([0, 0, 30, 60, 20], dtype=np.int64)
+
+    assert downsample_indices(times, min_interval).tolist() == [0, 1, 2, 3, 4]
@@ -0,0 +1,64 @@
+from unittest.mock import MagicMock
+
+from weather_data.cache import CacheStats, WeatherCache
+from weather_data.hourly import HourlyWeather
+from weather_data.store import SQLiteWeatherStore
+
+
+def test_cache_miss_and_hit() -> None:
+    cache = WeatherCache(parse=None)
+
+    assert cache.get(("a", "2024-03-20")) is None
+    cache.put(("a", "2024-03-20"), [{"temp_c": 1.0}])
+
+    assert cache.get(("a", "2024-03-20")) == [{"temp_c": 1.0}]
+    assert ("a", "2024-03-20") in cache
+    assert cache.stats == CacheStats(hits=1, disk_hits=0, misses=1)
+    assert cache.stats.hit_rate == 0.5
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    cache = WeatherCache(max_entries=2, parse=None)
+    cache.put(("a", "d"), 1)
+    cache.put(("b", "d"), 2)
+    cache.get(("a", "d"))
+    cache.put(("c", "d"), 3)
+
+    assert ("a", "d") in cache
+    assert ("b", "d") not in cache
+    assert ("c", "d") in cache
+
+
+def test_cache_keeps_parsed_days() -> None:
+    hour = {"temp_c": 1.0, "feelslike_c": 1.0, "wind_kph": 0.0, "humidity": 50, "precip_mm": 0.0, "vis_km": 10.0,
+            "pressure_mb": 1000.0, "uv": 0.0, "condition": {"text": "Clear"}}
+    hourly = [{"time": "2024-03-20 00:00", **hour}, {"time": "2024-03-20 01:00", **hour}]
+    cache = WeatherCache()
+
+    weather = cache.put(("a", "2024-03-20"), hourly)
+
+    assert isinstance(weather, HourlyWeather)
+    assert cache.get(("a", "2024-03-20")) is weather
+
+
+def test_cache_parses_persisted_day_once() -> None:
+    persistent = {("a", "d"): [1]}
+    parse = MagicMock(side_effect=lambda raw: ("parsed", raw))
+    cache = WeatherCache(persistent=MagicMock(get=persistent.get), parse=parse)
+
+    assert cache.get(("a", "d")) == ("parsed", [1])
+    assert cache.get(("a", "d")) == ("parsed", [1])
+    parse.assert_called_once_with([1])
+
+
+def test_is_cached_checks_both_tiers_without_counting(tmp_path) -> None:
+    store = SQLiteWeatherStore(str(tmp_path / "weather.sqlite"))
+    store.put(("disk", "2024-03-20"), [1])
+    cache = WeatherCache(persistent=store, parse=None)
+    cache.put(("memory", "2024-03-20"), [2])
+
+    assert cache.is_cached(("memory", "2024-03-20"))
+    assert cache.is_cached(("disk", "2024-03-20"))
+    assert not cache.is_cached(("missing", "2024-03-20"))
+    assert ("disk", "2024-03-20") not in cache
+    assert cache.stats == CacheStats()
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from common.models import Location
+from weather_data.grid import WeatherGrid
+
+
+@pytest.mark.parametrize(
+    "location, expected_id, expected_center",
+    [
+        (Location(0, 0), "0.1_0_0", Location(0, 0)),
+        (Location(52.1489, 20.9671), "0.1_521_210", Location(52.1, 21.0)),
+        (Location(-33.9461, 151.1772), "0.1_-339_1512", Location(-33.9, 151.2)),
+        (Location(89.99, 179.99), "0.1_900_1800", Location(90, 180)),
+    ]
+)
+def test_cell_id_and_snap(location: Location, expected_id: str, expected_center: Location) -> None:
+    grid = WeatherGrid()
+
+    assert grid.cell_id(location) == expected_id
+    assert grid.snap(location) == expected_center
+
+
+def test_points_in_one_cell_share_id() -> None:
+    grid = WeatherGrid(0.25)
+
+    assert grid.cell_id(Location(10.1, 20.05)) == grid.cell_id(Location(9.9, 19.95)) == "0.25_40_80"
+    assert grid.cell_id(Location(10.2, 20.05)) != grid.cell_id(Location(10.1, 20.05))
+
+
+def test_cell_indices_are_vectorized() -> None:
+    latitudes, longitudes = WeatherGrid().cell_indices([0.04, 0.06, -0.06], [1.0, 1.04, 1.06])
+
+    np.testing.assert_array_equal(latitudes, [0, 1, -1])
+    np.testing.assert_array_equal(longitudes, [10, 10, 11])
+
+
+@pytest.mark.parametrize("resolution", [0, -0.1, 11])
+def test_invalid_resolution(resolution: float) -> None:
+    with pytest.raises(ValueError):
+        WeatherGrid(resolution)
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+from typing import Any
+
+import numpy as np
+import pytest
+
+from common.utils import interpolate_value
+from weather_data.hourly import HourlyWeather, _round
+from weather_data.models import WeatherDatapoint
+
+
+def make_hour(time: datetime, rng: np.random.Generator) -> dict[str, Any]:
+    return {
+        "time": time.strftime(HourlyWeather.DATETIME_FORMAT),
+        "temp_c": round(rng.uniform(-20, 30), 1),
+        "feelslike_c": round(rng.uniform(-25, 30), 1),
+        "wind_kph": round(rng.uniform(0, 60), 1),
+        "humidity": int(rng.integers(0, 100)),
+        "precip_mm": round(rng.uniform(0, 5), 2),
+        "vis_km": float(rng.integers(0, 10)),
+        "pressure_mb": float(rng.integers(980, 1040)),
+        "uv": float(rng.integers(0, 10)),
+        "condition": {"text": str(rng.choice(["Clear", "Rain", "Fog"]))},
+    }
+
+
+def reference_minutes(hourly_data: list[dict[str, Any]]) -> list[WeatherDatapoint]:
+    """Minute-by-minute interpolation the lazy representation has to reproduce"""
+    minutes: list[WeatherDatapoint] = []
+    for start_hour, end_hour in zip(hourly_data, hourly_data[1:]):
+        start_time = datetime.strptime(start_hour['time'], HourlyWeather.DATETIME_FORMAT)
+        end_time = datetime.strptime(end_hour['time'], HourlyWeather.DATETIME_FORMAT)
+        delta_minutes = (end_time - start_time).seconds // 60
+        for minute_offset in range(delta_minutes):
+            progress = minute_offset / delta_minutes
+            minutes.append(WeatherDatapoint(
+                timestamp=int((start_time + timedelta(minutes=minute_offset)).timestamp()),
+                temperature_celsius=interpolate_value(start_hour['temp_c'], end_hour['temp_c'], progress),
+                feels_like_celsius=interpolate_value(start_hour['feelslike_c'], end_hour['feelslike_c'], progress),
+                condition_text=start_hour['condition']['text'],
+                wind_speed_kph=interpolate_value(start_hour['wind_kph'], end_hour['wind_kph'], progress),
+                humidity_percent=interpolate_value(start_hour['humidity'], end_hour['humidity'], progress),
+                precipitation_mm=interpolate_value(start_hour['precip_mm'], end_hour['precip_mm'], progress),
+                visibility_km=interpolate_value(start_hour['vis_km'], end_hour['vis_km'], progress),
+                pressure_mb=interpolate_value(start_hour['pressure_mb'], end_hour['pressure_mb'], progress),
+                uv_index=interpolate_value(start_hour['uv'], end_hour['uv'], progress),
+            ))
+    return minutes
+
+
+def reference_closest(minutes: list[WeatherDatapoint], timestamp: int) -> WeatherDatapoint:
+    return min(minutes, key=lambda minute: abs(minute.timestamp - timestamp))
+
+
+@pytest.fixture
+def hourly_data() -> list[dict[str, Any]]:
+    rng = np.random.default_rng(0)
+    return [make_hour(datetime(2024, 3, 20) + timedelta(hours=i), rng) for i in range(24)]
+
+
+def test_interpolate_hour() -> None:
+    hourly_data = [
+        {"time": "2024-03-20 00:00", "temp_c": 0.0, "wind_kph": 0.0, "humidity": 0.0, "precip_mm": 0.0,
+         "vis_km": 0.0, "pressure_mb": 0.0, "feelslike_c": 0.0, "uv": 0.0, "condition": {"text": "Clear"}},
+        {"time": "2024-03-20 01:00", "temp_c": 6.0, "wind_kph": 0.6, "humidity": 60.0, "precip_mm": 3.0,
+         "vis_km": 1.2, "pressure_mb": 600.0, "feelslike_c": 12.0, "uv": 30.0, "condition": {"text": "Rain"}},
+    ]
+    start_timestamp = int(datetime(2024, 3, 20, 0, 0).timestamp())
+
+    assert HourlyWeather.from_hourly_data(hourly_data).to_batch().to_datapoints() == [
+        WeatherDatapoint(
+            timestamp=start_timestamp + 60 * i,
+            temperature_celsius=i/10,
+            feels_like_celsius=i/5,
+            condition_text="Clear",
+            wind_speed_kph=i/100,
+            humidity_percent=i,
+            precipitation_mm=i/20,
+            visibility_km=i/50,
+            pressure_mb=i*10,
+            uv_index=i/2,
+        )
+        for i in range(60)
+    ]
+
+
+def test_round_matches_builtin_round() -> None:
+    values = np.concatenate([np.arange(-20, 20, 0.0005), [1.005, 2.675, 0.285, -2.675, 1e4 + 0.125]])
+
+    assert _round(values).tolist() == [round(value, 2) for value in values.tolist()]
+
+
+def test_whole_day_matches_minute_interpolation(hourly_data: list[dict[str, Any]]) -> None:
+    weather = HourlyWeather.from_hourly_data(hourly_data)
+    expected = reference_minutes(hourly_data)
+
+    assert len(weather) == len(expected) == 23 * 60
+    assert weather.minute_timestamps().tolist() == [minute.timestamp for minute in expected]
+    assert weather.to_batch().to_datapoints() == expected
+
+
+def test_closest_minute_matches_linear_search(hourly_data: list[dict[str, Any]]) -> None:
+    weather = HourlyWeather.from_hourly_data(hourly_data)
+    minutes = reference_minutes(hourly_data)
+    start = minutes[0].timestamp
+    timestamps = [start - 500, start, start + 29, start + 30, start + 31, start + 3599, start + 3630,
+                  start + 50_000, minutes[-1].timestamp + 29, minutes[-1].timestamp + 600]
+
+    assert weather.at(timestamps).to_datapoints() == [reference_closest(minutes, t) for t in timestamps]
+    assert [weather.datapoint_at(t) for t in timestamps] == [reference_closest(minutes, t) for t in timestamps]
+
+
+@pytest.mark.parametrize("hours", [0, 1])
+def test_day_without_intervals(hourly_data: list[dict[str, Any]], hours: int) -> None:
+    weather = HourlyWeather.from_hourly_data(hourly_data[:hours])
+
+    assert len(weather) == 0
+    assert len(weather.to_batch()) == 0
+    assert weather.datapoint_at(0) is None
+    with pytest.raises(ValueError):
+        weather.at([0])
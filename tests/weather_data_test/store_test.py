@@ -0,0 +1,124 @@
+import json
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+
+from weather_data.cache import CacheStats, WeatherCache
+from weather_data.store import SQLiteWeatherStore
+from conftest import FakeClock
+
+NOW = datetime(2024, 3, 20, 12, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture
+def clock(clock: FakeClock) -> FakeClock:
+    clock.now = NOW
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path, clock: FakeClock) -> SQLiteWeatherStore:
+    return SQLiteWeatherStore(str(tmp_path / "weather.sqlite"), recent_ttl_s=600, clock=clock)
+
+
+def test_round_trip(store: SQLiteWeatherStore) -> None:
+    assert store.get(("cell", "2024-03-01")) is None
+    assert ("cell", "2024-03-01") not in store
+
+    store.put(("cell", "2024-03-01"), [{"temp_c": 1.0}])
+
+    assert store.get(("cell", "2024-03-01")) == [{"temp_c": 1.0}]
+    assert ("cell", "2024-03-01") in store
+    assert len(store) == 1
+
+
+@pytest.mark.parametrize(
+    "date, expected",
+    [("2024-03-17", True), ("2024-03-18", True), ("2024-03-19", False), ("2024-03-20", False)],
+)
+def test_is_final(store: SQLiteWeatherStore, date: str, expected: bool) -> None:
+    assert store.is_final(date) == expected
+
+
+def test_final_days_are_written_once(store: SQLiteWeatherStore, clock: FakeClock) -> None:
+    store.put(("cell", "2024-03-01"), [1])
+    store.put(("cell", "2024-03-01"), [2])
+    clock.now += 365 * 24 * 3600
+
+    assert store.get(("cell", "2024-03-01")) == [1]
+
+
+def test_recent_days_expire_and_are_replaced(store: SQLiteWeatherStore, clock: FakeClock) -> None:
+    store.put(("cell", "2024-03-20"), [1])
+    store.put(("cell", "2024-03-20"), [2])
+    assert store.get(("cell", "2024-03-20")) == [2]
+
+    clock.now += 601
+
+    assert store.get(("cell", "2024-03-20")) is None
+    assert ("cell", "2024-03-20") not in store
+
+
+def test_store_is_shared_between_instances(tmp_path, clock: FakeClock) -> None:
+    SQLiteWeatherStore(str(tmp_path / "weather.sqlite"), clock=clock).put(("cell", "2024-03-01"), [1])
+
+    assert SQLiteWeatherStore(str(tmp_path / "weather.sqlite"), clock=clock).get(("cell", "2024-03-01")) == [1]
+
+
+def test_concurrent_readers_and_writers_in_threads(store: SQLiteWeatherStore) -> None:
+    def work(i: int) -> list | None:
+        store.put((f"cell{i}", "2024-03-01"), [i])
+        return store.get((f"cell{i % 4}", "2024-03-01"))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, range(64)))
+
+    assert len(store) == 64
+
+
+def write_days(path: str, worker: int) -> None:
+    store = SQLiteWeatherStore(path)
+    for i in range(50):
+        store.put((f"cell{i}", "2020-01-01"), [worker])
+
+
+def test_concurrent_writers_in_processes(tmp_path) -> None:
+    path = str(tmp_path / "weather.sqlite")
+    SQLiteWeatherStore(path)
+    processes = [multiprocessing.Process(target=write_days, args=(path, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    store = SQLiteWeatherStore(path)
+    assert [process.exitcode for process in processes] == [0, 0, 0, 0]
+    assert len(store) == 50
+    # Every day was written by exactly one worker and never overwritten
+    assert all(len(hourly) == 1 for _, _, hourly in store.iter_days())
+
+
+def test_export_jsonl(tmp_path, store: SQLiteWeatherStore) -> None:
+    store.put(("b", "2024-03-01"), [2])
+    store.put(("a", "2024-03-02"), [3])
+    store.put(("a", "2024-03-01"), [1])
+
+    assert store.export_jsonl(str(tmp_path / "export.jsonl")) == 3
+
+    with open(tmp_path / "export.jsonl") as file:
+        assert [json.loads(line) for line in file] == [
+            {"cell": "a", "date": "2024-03-01", "hour": [1]},
+            {"cell": "b", "date": "2024-03-01", "hour": [2]},
+            {"cell": "a", "date": "2024-03-02", "hour": [3]},
+        ]
+
+
+def test_store_as_persistent_cache_tier(store: SQLiteWeatherStore) -> None:
+    WeatherCache(persistent=store, parse=None).put(("cell", "2024-03-01"), [1])
+    cache = WeatherCache(persistent=store, parse=None)
+
+    assert cache.is_cached(("cell", "2024-03-01"))
+    assert cache.get(("cell", "2024-03-01")) == [1]
+    assert cache.stats == CacheStats(hits=0, disk_hits=1, misses=0)
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from typing import Any, Generator
+
+import pytest
+from aiohttp import web
+
+from common.models import Location
+from common.throttling import RateLimiter
+from weather_data.weather_client import WeatherClient
+
+PAYLOAD = {"forecast": {"forecastday": [{"hour": [{"time": "2024-03-20 00:00"}]}]}}
+
+
+class StubServer:
+    """Weather API stub running on an event loop in a background thread"""
+
+    def __init__(self) -> None:
+        self.queries: list[dict[str, str]] = []
+        self.responses: list[tuple[int, Any]] = []  # served in order, PAYLOAD afterwards
+        self.delay = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get("/v1/history.json", self._handle)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        self.url = f"http://127.0.0.1:{self._runner.addresses[0][1]}/v1/history.json"
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.queries.append(dict(request.query))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            status, body = self.responses.pop(0) if self.responses else (200, PAYLOAD)
+            if isinstance(body, str):
+                return web.Response(text=body, status=status)
+            return web.json_response(body, status=status)
+        finally:
+            self.in_flight -= 1
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+@pytest.fixture
+def server() -> Generator[StubServer, None, None]:
+    server = StubServer()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server: StubServer) -> Generator[WeatherClient, None, None]:
+    with WeatherClient(
+        api_url=server.url,
+        api_key="secret",
+        rate_limiter=RateLimiter(None),
+        timeout_s=0.5,
+        backoff_base_s=0.001,
+    ) as client:
+        yield client
+
+
+def test_fetch_weather_data(server: StubServer, client: WeatherClient) -> None:
+    assert client.fetch_weather_data(Location(51.5074, -0.1278), "2024-03-20") == PAYLOAD
+    assert server.queries == [{"key": "secret", "q": "51.5074,-0.1278", "dt": "2024-03-20"}]
+
+
+def test_fetch_weather_data_retries_temporary_errors(server: StubServer, client: WeatherClient) -> None:
+    server.responses = [(503, {}), (429, {})]
+
+    assert client.fetch_weather_data(Location(0, 0), "2024-03-20") == PAYLOAD
+    assert len(server.queries) == 3
+
+
+def test_fetch_weather_data_gives_up_after_retries(server: StubServer, client: WeatherClient) -> None:
+    server.responses = [(500, {})] * 4
+
+    assert client.fetch_weather_data(Location(0, 0), "2024-03-20") is None
+    assert len(server.queries) == 4
+
+
+@pytest.mark.parametrize("response", [(400, {"error": "bad request"}), (200, "Invalid JSON")])
+def test_fetch_weather_data_does_not_retry_invalid_responses(server: StubServer, client: WeatherClient, response: tuple[int, Any]) -> None:
+    server.responses = [response]
+
+    assert client.fetch_weather_data(Location(0, 0), "2024-03-20") is None
+    assert len(server.queries) == 1
+
+
+def test_fetch_weather_data_times_out(server: StubServer) -> None:
+    server.delay = 0.2
+
+    with WeatherClient(api_url=server.url, timeout_s=0.05, max_retries=1, backoff_base_s=0.001) as client:
+        assert client.fetch_weather_data(Location(0, 0), "2024-03-20") is None
+
+    assert len(server.queries) == 2
+
+
+def test_fetch_weather_data_raises_error_for_invalid_date_format(server: StubServer, client: WeatherClient) -> None:
+    with pytest.raises(ValueError):
+        client.fetch_weather_data(Location(0, 0), "20240320")
+
+    assert server.queries == []
+
+
+def test_fetch_many_limits_concurrency_and_keeps_order(server: StubServer) -> None:
+    server.delay = 0.02
+    server.responses = [(200, {"id": i}) for i in range(8)]
+    requests = [(Location(i, 0), "2024-03-20") for i in range(8)]
+
+    with WeatherClient(api_url=server.url, max_concurrency=2, rate_limiter=RateLimiter(None)) as client:
+        results = client.fetch_many(requests)
+
+    assert server.max_in_flight == 2
+    # Responses are numbered in the order the server received the requests
+    received = [query["q"] for query in server.queries]
+    assert [result["id"] for result in results] == [received.index(str(location)) for location, _ in requests]
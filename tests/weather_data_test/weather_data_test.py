@@ -1,52 +1,64 @@
 import pytest
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from unittest.mock import MagicMock, call, patch
 from typing import Any
 
+from common.coalescing import CoalescingStats
 from common.models import Location
-from weather_data.weather_data import WeatherDataProcessor
+from weather_data.cache import WeatherCache
+from weather_data.grid import WeatherGrid
+from weather_data.hourly import HourlyWeather
+from weather_data.weather_data import WeatherDataProcessor, WeatherPrefetchPlan
 from weather_data.models import WeatherDatapoint
-from flight_data.models import FlightDatapoint
+from flight_data.models import FlightDatapoint, FlightDatapointBatch
+
+
+def make_hour(time: str, temp_c: float, condition: str = "Clear") -> dict[str, Any]:
+    return {
+        "time": time,
+        "temp_c": temp_c,
+        "feelslike_c": 0.0,
+        "wind_kph": 0.0,
+        "humidity": 0.0,
+        "precip_mm": 0.0,
+        "vis_km": 0.0,
+        "pressure_mb": 0.0,
+        "uv": 0.0,
+        "condition": {"text": condition},
+    }
+
+
+START_TIMESTAMP = int(datetime(2024, 3, 20, 0, 0).timestamp())
+WEATHER_DAY = HourlyWeather.from_hourly_data([
+    make_hour("2024-03-20 00:00", 0.0),
+    make_hour("2024-03-20 01:00", 6.0, "Rain"),
+    make_hour("2024-03-20 02:00", 12.0),
+])
+
+
+def make_weather_datapoint(minute: int, temperature_celsius: float, condition_text: str) -> WeatherDatapoint:
+    return WeatherDatapoint(
+        START_TIMESTAMP + 60 * minute, temperature_celsius, 0.0, condition_text, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+    )
 
 
 @pytest.mark.parametrize(
     "weather_data, timestamp, expected_data",
     [
-        (
-            [
-                WeatherDatapoint(0, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-                WeatherDatapoint(60, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-                WeatherDatapoint(120, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-            ],
-            60,
-            WeatherDatapoint(60, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-        ),
-        (
-            [
-                WeatherDatapoint(0, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-                WeatherDatapoint(60, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-                WeatherDatapoint(120, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-            ],
-            70,
-            WeatherDatapoint(60, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-        ),
-        (
-            [
-                WeatherDatapoint(0, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-                WeatherDatapoint(60, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-                WeatherDatapoint(120, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-            ],
-            130,
-            WeatherDatapoint(120, 0.0, 0.0, "", 0.0, 0.0, 0.0, 0.0, 0.0, 0.0),
-        ),
-        (
-            None,
-            100,
-            None,
-        )
+        (WEATHER_DAY, START_TIMESTAMP + 60, make_weather_datapoint(1, 0.1, "Clear")),
+        (WEATHER_DAY, START_TIMESTAMP + 70, make_weather_datapoint(1, 0.1, "Clear")),
+        (WEATHER_DAY, START_TIMESTAMP + 90, make_weather_datapoint(1, 0.1, "Clear")),
+        (WEATHER_DAY, START_TIMESTAMP + 3590, make_weather_datapoint(60, 6.0, "Rain")),
+        (WEATHER_DAY, START_TIMESTAMP - 100, make_weather_datapoint(0, 0.0, "Clear")),
+        (WEATHER_DAY, START_TIMESTAMP + 7200, make_weather_datapoint(119, 11.9, "Rain")),
+        (HourlyWeather.from_hourly_data([make_hour("2024-03-20 00:00", 0.0)]), START_TIMESTAMP, None),
+        (None, 100, None),
     ],
 )
-def test_get_weather_datapoint_for_flight_datapoint(weather_data: list[WeatherDatapoint], timestamp: int, expected_data: WeatherDatapoint | None) -> None:
+def test_get_weather_datapoint_for_flight_datapoint(weather_data: HourlyWeather | None, timestamp: int, expected_data: WeatherDatapoint | None) -> None:
     flight_datapoint = FlightDatapoint(
         location=Location(10, 20),
         arrival_airport="",
@@ -69,98 +81,6 @@ def test_get_weather_datapoint_for_flight_datapoint(weather_data: list[WeatherDa
     mock_timestamp_to_date.assert_called_once_with(timestamp)
 
 
-def test_interpolate_hour_range() -> None:
-    start_data = {
-        "time": "2024-03-20 00:00",
-        "temp_c": 0.0,
-        "wind_kph": 0.0,
-        "humidity": 0.0,
-        "precip_mm": 0.0,
-        "vis_km": 0.0,
-        "pressure_mb": 0.0,
-        "feelslike_c": 0.0,
-        "uv": 0.0,
-        "condition": {
-            "text": "Clear",
-        },
-    }
-    end_data = {
-        "time": "2024-03-20 01:00",
-        "temp_c": 6.0,
-        "wind_kph": 0.6,
-        "humidity": 60.0,
-        "precip_mm": 3.0,
-        "vis_km": 1.2,
-        "pressure_mb": 600.0,
-        "feelslike_c": 12.0,
-        "uv": 30.0,
-        "condition": {
-            "text": "Rain",
-        },
-    }
-    processor = WeatherDataProcessor()
-    start_timestamp = int(datetime(2024, 3, 20, 0, 0).timestamp())
-
-    assert processor._interpolate_hour_range(start_data, end_data) == [
-        WeatherDatapoint(
-            timestamp=start_timestamp + 60 * i,
-            temperature_celsius=i/10,
-            feels_like_celsius=i/5,
-            condition_text="Clear",
-            wind_speed_kph=i/100,
-            humidity_percent=i,
-            precipitation_mm=i/20,
-            visibility_km=i/50,
-            pressure_mb=i*10,
-            uv_index=i/2,
-        )
-        for i in range(60)
-    ]
-
-
-def test_interpolate_data() -> None:
-    data = [
-        {"time": f"2024-03-20 00:00"},
-        {"time": f"2024-03-20 01:00"},
-        {"time": f"2024-03-20 02:00"},
-        {"time": f"2024-03-20 03:00"},
-    ]
-    timestamp = int(datetime(2024, 3, 20, 0, 0).timestamp())
-
-    processor = WeatherDataProcessor()
-    processor._interpolate_hour_range = MagicMock(side_effect=[
-        [
-            WeatherDatapoint.empty_from_timestamp(timestamp),
-            WeatherDatapoint.empty_from_timestamp(timestamp + 60),
-        ],
-        [
-            WeatherDatapoint.empty_from_timestamp(timestamp + 3600),
-            WeatherDatapoint.empty_from_timestamp(timestamp + 3660),
-        ],
-        [
-            WeatherDatapoint.empty_from_timestamp(timestamp + 7200),
-            WeatherDatapoint.empty_from_timestamp(timestamp + 7260),
-        ],
-    ])
-
-    interpolated_data = processor._interpolate_data(data)
-
-    assert processor._interpolate_hour_range.call_args_list == [
-        call(data[0], data[1]),
-        call(data[1], data[2]),
-        call(data[2], data[3]),
-    ]
-
-    assert interpolated_data == [
-        WeatherDatapoint.empty_from_timestamp(timestamp),
-        WeatherDatapoint.empty_from_timestamp(timestamp + 60),
-        WeatherDatapoint.empty_from_timestamp(timestamp + 3600),
-        WeatherDatapoint.empty_from_timestamp(timestamp + 3660),
-        WeatherDatapoint.empty_from_timestamp(timestamp + 7200),
-        WeatherDatapoint.empty_from_timestamp(timestamp + 7260),
-    ]
-
-
 @pytest.mark.parametrize(
     "response_data",
     [
@@ -175,22 +95,249 @@ def test_interpolate_data() -> None:
 )
 def test_get_weather_data_incorrect_response(response_data: None | dict[str | Any]) -> None:
     processor = WeatherDataProcessor()
-    processor._interpolate_data = MagicMock()
 
-    with patch("weather_data.weather_data.fetch_weather_data", return_value=response_data) as mock_fetch_weather_data:
+    with (
+        patch("weather_data.weather_data.fetch_weather_data", return_value=response_data) as mock_fetch_weather_data,
+        patch.object(processor.cache, "parse") as mock_parse,
+    ):
         assert processor.get_weather_data_for_day(Location(0, 0), "2024-03-20") is None
 
     mock_fetch_weather_data.assert_called_once_with(Location(0, 0), "2024-03-20")
-    processor._interpolate_data.assert_not_called()
+    mock_parse.assert_not_called()
 
 
 def test_get_weather_data_success() -> None:
     processor = WeatherDataProcessor()
-    processor._interpolate_data = MagicMock(return_value=[WeatherDatapoint.empty_from_timestamp(0)])
 
     response_data = {"forecast": {"forecastday": [{"hour": [{"timestamp": 123}]}]}}
-    with patch("weather_data.weather_data.fetch_weather_data", return_value=response_data) as mock_fetch_weather_data:
-        assert processor.get_weather_data_for_day(Location(0, 0), "2024-03-20") == [WeatherDatapoint.empty_from_timestamp(0)]
+    with (
+        patch("weather_data.weather_data.fetch_weather_data", return_value=response_data) as mock_fetch_weather_data,
+        patch.object(processor.cache, "parse") as mock_parse,
+    ):
+        assert processor.get_weather_data_for_day(Location(0, 0), "2024-03-20") == mock_parse.return_value
 
     mock_fetch_weather_data.assert_called_once_with(Location(0, 0), "2024-03-20")
-    processor._interpolate_data.assert_called_once_with([{"timestamp": 123}])
+    mock_parse.assert_called_once_with([{"timestamp": 123}])
+
+
+def test_get_weather_data_is_cached() -> None:
+    processor = WeatherDataProcessor()
+
+    response_data = {"forecast": {"forecastday": [{"hour": [make_hour("2024-03-20 00:00", 0.0)]}]}}
+    with patch("weather_data.weather_data.fetch_weather_data", return_value=response_data) as mock_fetch_weather_data:
+        processor.get_weather_data_for_day(Location(10, 20), "2024-03-20")
+        processor.get_weather_data_for_day(Location(10.00001, 20), "2024-03-20")
+        processor.get_weather_data_for_day(Location(10, 20), "2024-03-21")
+
+    assert mock_fetch_weather_data.call_args_list == [
+        call(Location(10, 20), "2024-03-20"),
+        call(Location(10, 20), "2024-03-21"),
+    ]
+    assert processor.cache.stats.hits == 1
+    assert processor.cache.stats.misses == 2
+
+
+def test_get_weather_data_does_not_cache_failures() -> None:
+    processor = WeatherDataProcessor()
+
+    with patch("weather_data.weather_data.fetch_weather_data", return_value=None) as mock_fetch_weather_data:
+        processor.get_weather_data_for_day(Location(10, 20), "2024-03-20")
+        processor.get_weather_data_for_day(Location(10, 20), "2024-03-20")
+
+    assert mock_fetch_weather_data.call_count == 2
+
+
+def test_get_weather_data_snaps_locations_to_grid() -> None:
+    processor = WeatherDataProcessor(grid=WeatherGrid(0.5))
+
+    response_data = {"forecast": {"forecastday": [{"hour": [make_hour("2024-03-20 00:00", 0.0)]}]}}
+    with patch("weather_data.weather_data.fetch_weather_data", return_value=response_data) as mock_fetch_weather_data:
+        processor.get_weather_data_for_day(Location(10.1, 20.2), "2024-03-20")
+        processor.get_weather_data_for_day(Location(9.8, 19.9), "2024-03-20")
+        processor.get_weather_data_for_day(Location(10.3, 20.2), "2024-03-20")
+
+    assert mock_fetch_weather_data.call_args_list == [
+        call(Location(10, 20), "2024-03-20"),
+        call(Location(10.5, 20), "2024-03-20"),
+    ]
+    assert processor.request_stats() == {"cells": 2, "cell_days": 2}
+
+    processor.reset_request_stats()
+    assert processor.request_stats() == {"cells": 0, "cell_days": 0}
+
+
+def test_get_weather_batch_for_flight_batch_groups_by_cell_and_date() -> None:
+    def flight_datapoint(latitude: float, timestamp: int) -> FlightDatapoint:
+        return FlightDatapoint(Location(latitude, 20), "", Location(0, 0), timestamp, 0.0, 0.0, 0.0, 0.0, 0.0, 0, 0)
+
+    midnight = int(datetime(2024, 3, 21, tzinfo=timezone.utc).timestamp())
+    flight_datapoints = [
+        flight_datapoint(10.0, midnight - 600),
+        flight_datapoint(10.01, midnight - 300),
+        flight_datapoint(12.0, midnight - 60),
+        flight_datapoint(12.0, midnight + 60),
+        flight_datapoint(10.0, midnight + 120),
+    ]
+    days = {
+        ("10.0,20.0", "2024-03-20"): HourlyWeather.from_hourly_data([
+            make_hour("2024-03-20 23:00", 1.0), make_hour("2024-03-21 00:00", 1.0),
+        ]),
+        ("12.0,20.0", "2024-03-20"): HourlyWeather.from_hourly_data([
+            make_hour("2024-03-20 23:00", 2.0), make_hour("2024-03-21 00:00", 2.0),
+        ]),
+        ("12.0,20.0", "2024-03-21"): HourlyWeather.from_hourly_data([
+            make_hour("2024-03-21 00:00", 3.0), make_hour("2024-03-21 01:00", 3.0),
+        ]),
+    }
+    processor = WeatherDataProcessor()
+    processor.get_weather_data_for_days = MagicMock(
+        side_effect=lambda requests: [days.get((str(location), date)) for location, date in requests],
+    )
+
+    weather = processor.get_weather_batch_for_flight_batch(FlightDatapointBatch.from_datapoints(flight_datapoints))
+
+    processor.get_weather_data_for_days.assert_called_once()
+    assert sorted(
+        (str(location), date) for location, date in processor.get_weather_data_for_days.call_args.args[0]
+    ) == [("10.0,20.0", "2024-03-20"), ("10.0,20.0", "2024-03-21"), ("12.0,20.0", "2024-03-20"), ("12.0,20.0", "2024-03-21")]
+    assert weather.column_values("temperature_celsius") == [1.0, 1.0, 2.0, 3.0, 0.0]
+    assert weather.column_values("condition_text") == ["Clear", "Clear", "Clear", "Clear", "NA"]
+    assert weather.timestamp[-1] == midnight + 120
+    assert weather.to_datapoints()[:4] == [
+        days[("10.0,20.0", "2024-03-20")].datapoint_at(midnight - 600),
+        days[("10.0,20.0", "2024-03-20")].datapoint_at(midnight - 300),
+        days[("12.0,20.0", "2024-03-20")].datapoint_at(midnight - 60),
+        days[("12.0,20.0", "2024-03-21")].datapoint_at(midnight + 60),
+    ]
+
+
+def test_get_weather_data_for_days_fetches_missing_days_with_client() -> None:
+    client = MagicMock()
+    response_data = {"forecast": {"forecastday": [{"hour": [make_hour("2024-03-20 00:00", 0.0)]}]}}
+    client.fetch_many.return_value = [response_data, None]
+    processor = WeatherDataProcessor(client=client)
+    processor.cache.put(("0.1_100_200", "2024-03-20"), [make_hour("2024-03-20 00:00", 1.0)])
+
+    weather = processor.get_weather_data_for_days([
+        (Location(10, 20), "2024-03-20"),
+        (Location(10, 20.04), "2024-03-21"),
+        (Location(20, 20), "2024-03-20"),
+    ])
+
+    client.fetch_many.assert_called_once_with([(Location(10, 20), "2024-03-21"), (Location(20, 20), "2024-03-20")])
+    assert weather[0].values["temperature_celsius"].tolist() == [1.0]
+    assert weather[1].values["temperature_celsius"].tolist() == [0.0]
+    assert weather[2] is None
+    assert ("0.1_100_200", "2024-03-21") in processor.cache
+    assert ("0.1_200_200", "2024-03-20") not in processor.cache
+
+
+def test_get_weather_data_coalesces_concurrent_requests() -> None:
+    started = threading.Event()
+    release = threading.Event()
+    response_data = {"forecast": {"forecastday": [{"hour": [make_hour("2024-03-20 00:00", 0.0)]}]}}
+
+    def fetch(*_: Any) -> dict[str, Any]:
+        started.set()
+        release.wait(5)
+        return response_data
+
+    processor = WeatherDataProcessor()
+    with (
+        patch("weather_data.weather_data.fetch_weather_data", side_effect=fetch) as mock_fetch_weather_data,
+        ThreadPoolExecutor(max_workers=3) as executor,
+    ):
+        leader = executor.submit(processor.get_weather_data_for_day, Location(10, 20), "2024-03-20")
+        started.wait(5)
+        followers = [
+            executor.submit(processor.get_weather_data_for_day, Location(10.01, 20), "2024-03-20") for _ in range(2)
+        ]
+        while processor.in_flight.stats.coalesced < 2:
+            time.sleep(0.001)
+        release.set()
+
+        weather = [future.result() for future in [leader, *followers]]
+
+    mock_fetch_weather_data.assert_called_once_with(Location(10, 20), "2024-03-20")
+    assert all(day is not None and len(day.times) == 1 for day in weather)
+    assert processor.in_flight.stats == CoalescingStats(calls=1, coalesced=2)
+
+
+def test_get_weather_data_uses_day_cached_after_lookup() -> None:
+    hours = [make_hour("2024-03-20 00:00", 1.0)]
+    processor = WeatherDataProcessor()
+    processor.cache.put(("0.1_100_200", "2024-03-20"), hours)
+    # The day was cached by another thread between the cache lookup and claiming it
+    processor.cache.get = MagicMock(return_value=None)
+
+    with patch("weather_data.weather_data.fetch_weather_data") as mock_fetch_weather_data:
+        weather = processor.get_weather_data_for_day(Location(10, 20), "2024-03-20")
+
+    mock_fetch_weather_data.assert_not_called()
+    assert weather.values["temperature_celsius"].tolist() == [1.0]
+    assert processor.in_flight.stats == CoalescingStats(calls=1)
+
+
+def test_get_weather_data_fetches_day_evicted_after_lookup_once() -> None:
+    response_data = {"forecast": {"forecastday": [{"hour": [make_hour("2024-03-20 00:00", 0.0)]}]}}
+    # The day is reported as cached but evicted before it can be read
+    cache = MagicMock(spec=WeatherCache)
+    cache.__contains__.return_value = True
+    cache.get.return_value = None
+    cache.peek.return_value = None
+    processor = WeatherDataProcessor(cache)
+
+    with patch("weather_data.weather_data.fetch_weather_data", return_value=response_data) as mock_fetch_weather_data:
+        weather = processor.get_weather_data_for_day(Location(10, 20), "2024-03-20")
+
+    mock_fetch_weather_data.assert_called_once_with(Location(10, 20), "2024-03-20")
+    assert weather is not None
+
+
+def test_plan_and_prefetch_weather_for_window() -> None:
+    def flight_batch(*points: tuple[float, int]) -> FlightDatapointBatch:
+        return FlightDatapointBatch.from_datapoints(
+            FlightDatapoint(Location(latitude, 20), "", Location(0, 0), timestamp, 0.0, 0.0, 0.0, 0.0, 0.0, 0, 0)
+            for latitude, timestamp in points
+        )
+
+    midnight = int(datetime(2024, 3, 21, tzinfo=timezone.utc).timestamp())
+    client = MagicMock()
+    client.fetch_many.side_effect = lambda requests: [
+        {"forecast": {"forecastday": [{"hour": [make_hour(f"{date} 00:00", 0.0)]}]}} for _, date in requests
+    ]
+    processor = WeatherDataProcessor(client=client)
+    processor.cache.put(("0.1_100_200", "2024-03-20"), [make_hour("2024-03-20 00:00", 1.0)])
+
+    plan = processor.plan_prefetch([
+        flight_batch((10.0, midnight - 60), (10.01, midnight - 30), (10.0, midnight + 60)),
+        flight_batch((10.0, midnight - 120), (12.0, midnight - 120)),
+    ])
+
+    assert plan == WeatherPrefetchPlan(
+        required=3,
+        missing=[(Location(10, 20), "2024-03-21"), (Location(12, 20), "2024-03-20")],
+    )
+    assert plan.api_calls == 2
+    client.fetch_many.assert_not_called()
+
+    processor.prefetch(plan)
+
+    client.fetch_many.assert_called_once_with(plan.missing)
+    assert isinstance(processor.cache.peek(("0.1_100_200", "2024-03-21")), HourlyWeather)
+    assert ("0.1_120_200", "2024-03-20") in processor.cache
+
+
+def test_plan_prefetch_leaves_out_planned_days() -> None:
+    processor = WeatherDataProcessor()
+    midnight = int(datetime(2024, 3, 21, tzinfo=timezone.utc).timestamp())
+    flight_batch = FlightDatapointBatch.from_datapoints([
+        FlightDatapoint(Location(10, 20), "", Location(0, 0), midnight - 60, 0.0, 0.0, 0.0, 0.0, 0.0, 0, 0),
+        FlightDatapoint(Location(10, 20), "", Location(0, 0), midnight + 60, 0.0, 0.0, 0.0, 0.0, 0.0, 0, 0),
+    ])
+    planned = {("0.1_100_200", "2024-03-20")}
+
+    plan = processor.plan_prefetch([flight_batch], planned)
+
+    assert plan == WeatherPrefetchPlan(required=1, missing=[(Location(10, 20), "2024-03-21")])
+    assert planned == {("0.1_100_200", "2024-03-20"), ("0.1_100_200", "2024-03-21")}
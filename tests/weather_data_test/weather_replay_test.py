@@ -0,0 +1,38 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from common.models import Location
+from common.recording import ReplayStats, ResponseArchive
+from weather_data.replay import RecordingWeatherClient, ReplayWeatherClient
+
+
+@pytest.fixture
+def archive(tmp_path) -> ResponseArchive:
+    return ResponseArchive(str(tmp_path / "archive.sqlite"))
+
+
+def test_recorded_responses_are_replayed(archive: ResponseArchive) -> None:
+    client = MagicMock()
+    client.fetch_many.return_value = [{"forecast": 1}, None]
+    client.fetch_weather_data.return_value = {"forecast": 3}
+    recorder = RecordingWeatherClient(client, archive)
+
+    assert recorder.fetch_many([(Location(1, 2), "2024-03-01"), (Location(3, 4), "2024-03-01")]) == [{"forecast": 1}, None]
+    assert recorder.fetch_weather_data(Location(5, 6), "2024-03-02") == {"forecast": 3}
+
+    replay = ReplayWeatherClient(archive)
+    assert replay.fetch_many([(Location(5, 6), "2024-03-02"), (Location(1, 2), "2024-03-01")]) == [{"forecast": 3}, {"forecast": 1}]
+    # Failed requests are not recorded and fail again when replayed
+    assert replay.fetch_weather_data(Location(3, 4), "2024-03-01") is None
+    assert replay.stats == ReplayStats(hits=2, misses=1)
+
+
+@pytest.mark.parametrize("requests, expected_delay", [(1, 0.1), (4, 0.1), (5, 0.2)])
+def test_fetch_many_latency_depends_on_concurrency(archive: ResponseArchive, requests: int, expected_delay: float) -> None:
+    replay = ReplayWeatherClient(archive, latency_s=0.1, max_concurrency=4)
+
+    with patch("weather_data.replay.time.sleep") as mock_sleep:
+        replay.fetch_many([(Location(i, 0), "2024-03-01") for i in range(requests)])
+
+    mock_sleep.assert_called_once_with(pytest.approx(expected_delay))